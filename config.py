@@ -18,6 +18,27 @@ def safe_enabled(enabled):
         raise ValueError("Enabled flag must be 'y' or 'n'.")
     return enabled == 'y'
 
+# set index functions a cache or the DTLB can use, modulo is the plain bit slice
+INDEX_FUNCTIONS = ("modulo", "xor", "prime", "skewed")
+
+def safe_index_function(name):
+    """Ensure that an index function name is one of INDEX_FUNCTIONS."""
+    name = name.strip().lower()
+    if name not in INDEX_FUNCTIONS:
+        raise ValueError(f"Index function must be one of {', '.join(INDEX_FUNCTIONS)}.")
+    return name
+
+
+# hardware prefetchers a cache can use, see mem_hierarchy.protocols.prefetchers
+PREFETCHERS = ("none", "next-line", "stride", "stream")
+
+def safe_prefetcher(name):
+    """Ensure that a prefetcher name is one of PREFETCHERS."""
+    name = name.strip().lower()
+    if name not in PREFETCHERS:
+        raise ValueError(f"Prefetcher must be one of {', '.join(PREFETCHERS)}.")
+    return name
+
 
 class BitCounts:
     def __init__(self):
@@ -40,12 +61,20 @@ class BitCounts:
         self.ppn_bits = 0
 
 class CacheConfig:
-    def __init__(self, num_sets, associativity, line_size, policy, enabled=True):
+    def __init__(self, num_sets, associativity, line_size, policy, enabled=True, index_function="modulo",
+                 prefetcher="none", prefetch_degree=1, prefetch_distance=1, write_buffer=0):
         self.num_sets = num_sets
         self.associativity = associativity
         self.line_size = line_size
         self.policy = policy
         self.enabled = enabled
+        self.index_function = index_function
+        # lines asked for per trigger, and how many lines ahead of the access the first one is
+        self.prefetcher = prefetcher
+        self.prefetch_degree = prefetch_degree
+        self.prefetch_distance = prefetch_distance
+        # blocks of the write buffer in front of the lower level, 0 for none, write-through caches only
+        self.write_buffer = write_buffer
 
 class PageTableConfig:
     def __init__(self, n_virtual_pages, n_physical_pages, page_size):
@@ -54,10 +83,25 @@ class PageTableConfig:
         self.page_size = page_size
 
 class DTLBConfig:
-    def __init__(self, num_sets, associativity, enabled=True):
+    def __init__(self, num_sets, associativity, enabled=True, index_function="modulo"):
         self.num_sets = num_sets
         self.associativity = associativity
         self.enabled = enabled
+        self.index_function = index_function
+
+class TimingConfig:
+    def __init__(self, dtlb_latency=1, page_table_latency=30, disk_latency=1000000, dc_latency=4, l2_latency=12,
+                 memory_latency=200, dc_bus_width=32, l2_bus_width=16):
+        # hit latencies in cycles, the disk latency is paid on every page table miss
+        self.dtlb_latency = dtlb_latency
+        self.page_table_latency = page_table_latency
+        self.disk_latency = disk_latency
+        self.dc_latency = dc_latency
+        self.l2_latency = l2_latency
+        self.memory_latency = memory_latency
+        # bytes per cycle of the bus below each cache
+        self.dc_bus_width = dc_bus_width
+        self.l2_bus_width = l2_bus_width
 
 class Config:
     def __init__(self,
@@ -67,7 +111,8 @@ class Config:
                  dtlb_cfg,
                  pt_cfg,
                  dc_cfg,
-                 l2_cfg=None):
+                 l2_cfg=None,
+                 timing_cfg=None):
         self.physical_address_bits = 0
         self.virtual_address_bits = 0
         self.virtual_addresses = virtual_addresses
@@ -77,6 +122,7 @@ class Config:
         self.pt = pt_cfg
         self.dc = dc_cfg
         self.l2 = l2_cfg if self.l2_enabled else None
+        self.timing = timing_cfg if timing_cfg is not None else TimingConfig()
         #self.address_bits = 0  # fixed at 32 bits
         self.bits = BitCounts()
         self.validate()
@@ -84,9 +130,13 @@ class Config:
 
     @classmethod
     def from_config_file(cls, filepath):
-        # parse out config info
         with open(filepath) as infile:
-            raw_lines = [ln.rstrip("\n") for ln in infile]
+            return cls.from_config_text(infile.read())
+
+    @classmethod
+    def from_config_text(cls, text):
+        # parse out config info
+        raw_lines = text.splitlines()
 
         # Section names exactly as in the file
         section_headers = {
@@ -94,6 +144,7 @@ class Config:
             "Page Table configuration": "pt",
             "Data Cache configuration": "dc",
             "L2 Cache configuration": "l2",
+            "Timing configuration": "timing",
         }
 
         # Buckets for per-section key/values
@@ -102,6 +153,7 @@ class Config:
             "pt": {},
             "dc": {},
             "l2": {},
+            "timing": {},
             "toggles": {},  # for bottom y/n switches
         }
 
@@ -135,6 +187,7 @@ class Config:
         dtlb_num_sets = int(sections["dtlb"].get("Number of sets", 0))
         dtlb_associativity = int(sections["dtlb"].get("Set size", 1))
         dtlb_enabled = safe_enabled(sections["toggles"]["TLB"])
+        dtlb_index_function = safe_index_function(sections["dtlb"].get("Index function", "modulo"))
 
         # Page table config info
         n_virtual_pages = int(sections["pt"].get("Number of virtual pages", 0))
@@ -147,28 +200,51 @@ class Config:
         l2_line_size = int(sections["l2"].get("Line size", 0))
         l2_policy = safe_enabled(sections["l2"]["Write through/no write allocate"])
         l2_enabled = safe_enabled(sections["toggles"]["L2 cache"])
+        l2_index_function = safe_index_function(sections["l2"].get("Index function", "modulo"))
+        l2_options = cls._optional_cache_options(sections["l2"])
 
         # DC config info
         DC_num_sets = int(sections["dc"].get("Number of sets", 0))
         DC_associativity = int(sections["dc"].get("Set size", 1))
         DC_line_size = int(sections["dc"].get("Line size", 0))
         DC_policy = safe_enabled(sections["dc"]["Write through/no write allocate"])
+        DC_index_function = safe_index_function(sections["dc"].get("Index function", "modulo"))
+        DC_options = cls._optional_cache_options(sections["dc"])
 
         # Virtual address config info
         virtual_addresses_enabled = safe_enabled(sections["toggles"]["Virtual addresses"])
 
+        # Timing config info, the whole section is optional and every key defaults
+        timing_keys = {"DTLB latency": "dtlb_latency", "Page table latency": "page_table_latency",
+                       "Disk latency": "disk_latency", "DC latency": "dc_latency", "L2 latency": "l2_latency",
+                       "Memory latency": "memory_latency", "DC bus width": "dc_bus_width",
+                       "L2 bus width": "l2_bus_width"}
+        timing_cfg = TimingConfig(**{timing_keys[key]: int(value) for key, value in sections["timing"].items()
+                                     if key in timing_keys})
+
         # make config class, validate it, and derive bit info
         config = cls(
             virtual_addresses=virtual_addresses_enabled,
             dtlb_enabled=dtlb_enabled,
             l2_enabled=l2_enabled,
-            dtlb_cfg=DTLBConfig(dtlb_num_sets, dtlb_associativity, dtlb_enabled),
+            dtlb_cfg=DTLBConfig(dtlb_num_sets, dtlb_associativity, dtlb_enabled, index_function=dtlb_index_function),
             pt_cfg=PageTableConfig(n_virtual_pages, n_physical_pages, page_size),
-            dc_cfg=CacheConfig(DC_num_sets, DC_associativity, DC_line_size, DC_policy, enabled=True),
-            l2_cfg=CacheConfig(l2_num_sets, l2_associativity, l2_line_size, l2_policy, enabled=l2_enabled)
+            dc_cfg=CacheConfig(DC_num_sets, DC_associativity, DC_line_size, DC_policy, enabled=True,
+                               index_function=DC_index_function, **DC_options),
+            l2_cfg=CacheConfig(l2_num_sets, l2_associativity, l2_line_size, l2_policy, enabled=l2_enabled,
+                               index_function=l2_index_function, **l2_options),
+            timing_cfg=timing_cfg,
         )
         return config
 
+    @staticmethod
+    def _optional_cache_options(section):
+        # the prefetch and write buffer keys are optional, a cache without them does not prefetch or buffer
+        return {"prefetcher": safe_prefetcher(section.get("Prefetcher", "none")),
+                "prefetch_degree": int(section.get("Prefetch degree", 1)),
+                "prefetch_distance": int(section.get("Prefetch distance", 1)),
+                "write_buffer": int(section.get("Write buffer entries", 0))}
+
     def _validate_dtlb(self):
         # max DTLB sets is 256
         if self.dtlb.num_sets < 1 or self.dtlb.num_sets > 256:
@@ -220,6 +296,26 @@ class Config:
         if self.l2.line_size < self.dc.line_size:
             raise ValueError("L2 line size must be at least as large as DC line size.")
 
+    @staticmethod
+    def _validate_optional_cache_options(level):
+        if level.prefetcher not in PREFETCHERS:
+            raise ValueError(f"Prefetcher must be one of {', '.join(PREFETCHERS)}.")
+        if level.prefetch_degree < 1:
+            raise ValueError("Prefetch degree must be at least 1.")
+        if level.prefetch_distance < 1:
+            raise ValueError("Prefetch distance must be at least 1.")
+        if level.write_buffer < 0:
+            raise ValueError("Write buffer entries must not be negative.")
+        if level.write_buffer and not level.policy:
+            raise ValueError("A write buffer needs a write through/no write allocate cache.")
+
+    def _validate_timing(self):
+        for name, value in vars(self.timing).items():
+            if name.endswith("_latency") and value < 0:
+                raise ValueError("Timing latencies must not be negative.")
+            if name.endswith("_bus_width") and value < 1:
+                raise ValueError("Bus widths must be at least 1 byte.")
+
     def validate(self):
         # address bits must be <= 32
         if self.virtual_address_bits > 32:
@@ -230,6 +326,13 @@ class Config:
         self._validate_pt()
         if self.l2_enabled:
             self._validate_l2()
+        for level in (self.dtlb, self.dc, self.l2):
+            if level is not None and level.index_function not in INDEX_FUNCTIONS:
+                raise ValueError(f"Index function must be one of {', '.join(INDEX_FUNCTIONS)}.")
+        for level in (self.dc, self.l2):
+            if level is not None:
+                self._validate_optional_cache_options(level)
+        self._validate_timing()
 
     @staticmethod
     def _bit_slicer(addr_bits, sets=None, line_size=None):
@@ -296,11 +399,33 @@ class Config:
             self.bits.l2_index_bits = l2_bits["index"]
             self.bits.l2_offset_bits = l2_bits["offset"]
 
+    @staticmethod
+    def _index_function_str(level):
+        # only hashed indexing is mentioned, so modulo configs print as they always have
+        if level.index_function == "modulo":
+            return ""
+        return f"Sets are selected with the {level.index_function} index function.\n"
+
+    @staticmethod
+    def _prefetcher_str(level):
+        # like the index function, only printed when the cache prefetches
+        if level.prefetcher == "none":
+            return ""
+        return (f"The cache uses a {level.prefetcher} prefetcher of degree {level.prefetch_degree} and "
+                f"distance {level.prefetch_distance}.\n")
+
+    @staticmethod
+    def _write_buffer_str(level):
+        if not level.write_buffer:
+            return ""
+        return f"Stores drain through a write buffer of {level.write_buffer} blocks.\n"
+
     def __str__(self):
         print_str = ""
         print_str += f"Data TLB contains {self.dtlb.num_sets} sets.\n"
         print_str += f"Each set contains {self.dtlb.associativity} entries.\n"
-        print_str += f"Number of bits used for the index is {self.bits.dtlb_index_bits}.\n\n"
+        print_str += f"Number of bits used for the index is {self.bits.dtlb_index_bits}.\n"
+        print_str += self._index_function_str(self.dtlb) + "\n"
         print_str += f"Number of virtual pages is {self.pt.n_virtual_pages}.\n"
         print_str += f"Number of physical pages is {self.pt.n_physical_pages}.\n"
         print_str += f"Each page contains {self.pt.page_size} bytes.\n"
@@ -311,6 +436,9 @@ class Config:
         print_str += f"Each line is {self.dc.line_size} bytes.\n"
         print_str += f"The cache uses a {'no ' if self.dc.policy else ''}write allocate and {'write-through' if self.dc.policy else 'write-back'} policy.\n"
         print_str += f"Number of bits used for the index is {self.bits.dc_index_bits}.\n"
+        print_str += self._index_function_str(self.dc)
+        print_str += self._prefetcher_str(self.dc)
+        print_str += self._write_buffer_str(self.dc)
         print_str += f"Number of bits used for the offset is {self.bits.dc_offset_bits}.\n\n"
         if self.l2_enabled:
             print_str += f"L2 cache contains {self.l2.num_sets} sets.\n"
@@ -318,6 +446,9 @@ class Config:
             print_str += f"Each line is {self.l2.line_size} bytes.\n"
             print_str += f"The cache uses a {'no ' if self.l2.policy else ''}write allocate and {'write-through' if self.l2.policy else 'write-back'} policy.\n"
             print_str += f"Number of bits used for the index is {self.bits.l2_index_bits}.\n"
+            print_str += self._index_function_str(self.l2)
+            print_str += self._prefetcher_str(self.l2)
+            print_str += self._write_buffer_str(self.l2)
             print_str += f"Number of bits used for the offset is {self.bits.l2_offset_bits}.\n\n"
         if self.virtual_addresses:
             print_str += "The addresses read in are virtual addresses."
@@ -0,0 +1,496 @@
+from config import Config
+from mem_hierarchy import MemoryHierarchySimulator, FusedSimulator
+from mem_hierarchy.sharded import ShardedSimulator
+from mem_hierarchy.pipeline import PipelinedSimulator
+from mem_hierarchy.analysis.sampled_simulation import run_lines
+from contextlib import redirect_stdout
+import argparse
+import io
+import os
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+
+REFERENCE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "tests", "memhier_ref")
+# engines the python side can run a trace through, only serial renders per access lines
+ENGINES = ("serial", "batch", "pipeline", "sharded", "fused")
+# accesses shown on each side of the first diverging one
+CONTEXT = 3
+# reference labels that name the same stat differently
+_LABEL_ALIASES = {"hit ratio": "hit rate", "pt faults": "pt misses"}
+_TABLE_RULE = "-------- ------ ---- ------"
+# what the reference prints for the stats of a level the config leaves out
+_ABSENT = ("0", "N/A")
+
+
+def generate_trace(path, accesses, address_bits, seed=0, write_ratio=0.3):
+    """
+    Write a trace mixing sequential runs, reuse of a small hot region, strided sweeps, and uniform random
+    addresses, so the caches, DTLB and page table all see hits, misses, evictions and dirty writebacks
+    :param path: trace file path
+    :param accesses: number of accesses
+    :param address_bits: addresses stay below 2 ** address_bits
+    :param seed: random seed, the same seed always gives the same trace
+    :param write_ratio: share of writes
+    :return: None
+    """
+    rng = random.Random(seed)
+    limit = 1 << address_bits
+    hot_base = rng.randrange(limit)
+    hot_size = min(limit, 1 << 12)
+    address = rng.randrange(limit)
+    with open(path, "w") as f:
+        written = 0
+        while written < accesses:
+            pattern = rng.random()
+            run = min(accesses - written, rng.randint(1, 64))
+            stride = rng.choice((4, 8, 16, 64, 4096)) if pattern < 0.6 else 0
+            for _ in range(run):
+                if pattern < 0.35:
+                    address = (address + 4) % limit
+                elif pattern < 0.6:
+                    address = (address + stride) % limit
+                elif pattern < 0.85:
+                    address = (hot_base + rng.randrange(hot_size)) % limit
+                else:
+                    address = rng.randrange(limit)
+                operation = "W" if rng.random() < write_ratio else "R"
+                f.write(f"{operation}:{address:x}\n")
+            written += run
+
+
+def parse_output(text):
+    """
+    Split simulator output into its per access table rows and its final stats
+    :param text: stdout of memhier_ref or of a verbose run of main.py
+    :return: (list of rows with trailing blanks removed, dict of normalized stat name to value string)
+    """
+    rows = []
+    stats = {}
+    in_table = in_stats = False
+    for line in text.splitlines():
+        if line.startswith(_TABLE_RULE):
+            in_table = True
+            continue
+        if line.startswith("Simulation statistics"):
+            in_table = False
+            in_stats = True
+            continue
+        if in_table and line.strip():
+            rows.append(line.rstrip())
+        elif in_stats and ":" in line:
+            label, value = line.split(":", 1)
+            stats[normalize_label(label)] = value.strip()
+    return rows, stats
+
+
+def row_fields(row):
+    """
+    The fields of a table row, so rows compare equal whatever the column widths and justification. Blank
+    columns only ever trail a miss or a hit that ends the lookup, so they never shift one field into another's
+    place.
+    """
+    return row.split()
+
+
+def normalize_label(label):
+    label = " ".join(label.lower().split())
+    for alias, name in _LABEL_ALIASES.items():
+        label = label.replace(alias, name)
+    return label
+
+
+def normalize_stats(stat_dict):
+    """
+    The pprint_stats dict of a python engine in the form parse_output gives the reference's stats
+    """
+    return {normalize_label(name): str(value) for name, value in stat_dict.items() if value != ""}
+
+
+def access_lines(trace):
+    """
+    The lines of a trace that hold an access
+    """
+    with open(trace) as f:
+        return [line for line in f if len(line.split(":")) >= 2]
+
+
+def uses_hashed_indexing(config):
+    """
+    Whether any enabled level of a config indexes its sets with something other than modulo, which the reference
+    does not model
+    """
+    levels = (config.dtlb if config.dtlb_enabled else None, config.dc, config.l2)
+    return any(level is not None and level.index_function != "modulo" for level in levels)
+
+
+def uses_prefetching(config):
+    """
+    Whether any enabled cache of a config prefetches, which the reference does not model
+    """
+    return any(level is not None and level.prefetcher != "none" for level in (config.dc, config.l2))
+
+
+def uses_write_buffer(config):
+    """
+    Whether any enabled cache of a config buffers its stores, which the reference does not model
+    """
+    return any(level is not None and level.write_buffer for level in (config.dc, config.l2))
+
+
+def run_reference(config_path, trace, reference=REFERENCE):
+    """
+    Run memhier_ref on a trace. It reads trace.config from its working directory and the trace from stdin, so
+    it runs in a scratch directory holding a copy of the config.
+    :return: (rows, stats) as from parse_output
+    """
+    with tempfile.TemporaryDirectory() as scratch:
+        shutil.copyfile(config_path, os.path.join(scratch, "trace.config"))
+        with open(trace) as stdin:
+            result = subprocess.run([os.path.abspath(reference)], stdin=stdin, cwd=scratch, capture_output=True,
+                                    text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f"{reference} exited with {result.returncode}: {result.stderr.strip()}")
+    return parse_output(result.stdout)
+
+
+def run_engine(engine, config, trace):
+    """
+    Run a trace through one python engine
+    :return: (rows, stats), rows is None for engines that render nothing
+    """
+    if engine == "serial":
+        out = io.StringIO()
+        with redirect_stdout(out):
+            MemoryHierarchySimulator(config).simulate(trace, verbose=True)
+        return parse_output(out.getvalue())
+    if engine == "batch":
+        stats = MemoryHierarchySimulator(config).simulate(trace, verbose=False)
+    elif engine == "pipeline":
+        stats = PipelinedSimulator(config).simulate(trace)
+    elif engine == "sharded":
+        stats = ShardedSimulator(config, workers=2).simulate(trace)
+    elif engine == "fused":
+        stats = FusedSimulator([config]).simulate(trace)[0]
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+    return None, normalize_stats(stats)
+
+
+def event_log(config, trace, verbose):
+    """
+    Every tracepoint a run fires, in the order it fires them
+    :param verbose: True for the per access path, False for the batched one
+    :return: list of event lines
+    """
+    simulator = MemoryHierarchySimulator(config)
+    events = []
+    simulator.tracepoints.subscribe(lambda event: events.append(str(event)))
+    with redirect_stdout(io.StringIO()):
+        simulator.simulate(trace, verbose=verbose)
+    return events
+
+
+def event_divergence(config, trace):
+    """
+    Where the batched path's event log first departs from the per access one, the order included
+    :return: None when they agree, else (position, per access event, batched event), an event is None past the
+             end of its log
+    """
+    expected = event_log(config, trace, True)
+    got = event_log(config, trace, False)
+    for position in range(max(len(expected), len(got))):
+        expected_event = expected[position] if position < len(expected) else None
+        got_event = got[position] if position < len(got) else None
+        if expected_event != got_event:
+            return position, expected_event, got_event
+    return None
+
+
+def _stats_diff(expected, got):
+    diff = {}
+    for name in sorted(set(expected) | set(got)):
+        if expected.get(name) == got.get(name):
+            continue
+        # python leaves out the stats of a disabled level, the reference prints them as zero
+        if name not in got and expected[name] in _ABSENT:
+            continue
+        diff[name] = (expected.get(name), got.get(name))
+    return diff
+
+
+class Divergence:
+    """
+    Where an engine first disagrees with the reference, and the hierarchy state just before that access
+    """
+    def __init__(self, index, access, expected_rows, got_rows, stats_diff, state):
+        """
+        :param index: 0 based position of the first diverging access in the trace
+        :param access: that access's trace line
+        :param expected_rows: reference rows around it, (position, row) pairs
+        :param got_rows: python rows around it, (position, row) pairs, empty when the engine renders nothing
+        :param stats_diff: dict of stat name to (reference value, python value) for the whole trace
+        :param state: lines describing the level state the access ran into
+        """
+        self.index = index
+        self.access = access
+        self.expected_rows = expected_rows
+        self.got_rows = got_rows
+        self.stats_diff = stats_diff
+        self.state = state
+
+    def format(self):
+        lines = [f"first divergence at access {self.index}: {self.access.strip()}"]
+        if self.stats_diff:
+            lines.append("stats (reference / python):")
+            for name, (expected, got) in self.stats_diff.items():
+                lines.append(f"    {name:<18s} {expected} / {got}")
+        lines.append("reference:")
+        lines += [f"  {'>' if position == self.index else ' '}{position:>8d} {row}"
+                  for position, row in self.expected_rows]
+        if self.got_rows:
+            lines.append("python:")
+            lines += [f"  {'>' if position == self.index else ' '}{position:>8d} {row}"
+                      for position, row in self.got_rows]
+        lines.append("state before the access:")
+        lines += [f"    {line}" for line in self.state]
+        return "\n".join(lines)
+
+
+def level_state(config, lines, index):
+    """
+    Run the first index accesses and describe the state the next one meets: its DTLB set, its page table
+    mapping and the resident pages, and its DC and L2 sets
+    :param config: Config
+    :param lines: access lines of the trace
+    :param index: position of the access
+    :return: list of strings
+    """
+    simulator = MemoryHierarchySimulator(config)
+    mask = (1 << config.address_bits) - 1
+    run_lines(simulator, iter(lines), index, mask)
+    address = int(lines[index].split(":")[1].strip(), 16) & mask
+    state = [f"address {address:08x}"]
+    physical_address = address
+    if simulator.pt:
+        page_table = simulator.pt.page_table
+        offset_bits = page_table.page_offset_bits
+        vpn = address >> offset_bits
+        if simulator.dtlb:
+            dtlb_cache = simulator.dtlb.dtlb_cache
+            set_index = dtlb_cache.set_of(address)
+            entries = ", ".join(f"tag {tag:x} ppn {entry.ppn:x}" for tag, entry in dtlb_cache.sets[set_index].items())
+            state.append(f"dtlb set {set_index}: {entries or 'empty'}")
+        ppn = page_table.vpn_to_ppn.get(vpn)
+        state.append(f"page table: vpn {vpn:x} -> " + (f"ppn {ppn:x}" if ppn is not None else "not mapped"))
+        # least recently used first
+        state.append("resident pages: " + ", ".join(f"{page_table.ppn_to_vpn[page]:x}->{page:x}"
+                                                    for page in page_table.lru_ppns))
+        if ppn is None:
+            return state
+        physical_address = (ppn << offset_bits) | (address & ((1 << offset_bits) - 1))
+        state.append(f"physical address {physical_address:08x}")
+    for level in (simulator.dc, simulator.l2):
+        if level is None:
+            continue
+        cache = level.cache
+        set_index = cache.set_of(physical_address)
+        entries = ", ".join(f"{entry.address:x}{' dirty' if entry.dirty else ''}"
+                            for entry in cache.sets[set_index].values())
+        state.append(f"{level.name} set {set_index} (lru first): {entries or 'empty'}")
+    return state
+
+
+class DifferentialHarness:
+    """
+    Runs traces through memhier_ref and the python engines and compares the per access rows, where the engine
+    renders them, and the final stats. On a mismatch the first diverging access is found directly from the rows
+    or, for engines that only give stats, by bisecting on trace prefixes: both sides rerun on the first half of
+    the remaining range until one access separates an agreeing prefix from a disagreeing one.
+    """
+    def __init__(self, config_path, reference=REFERENCE):
+        self.config_path = config_path
+        self.config = Config.from_config_file(config_path)
+        self.reference = reference
+
+    def _prefix_differs(self, engine, lines, count, scratch):
+        prefix = os.path.join(scratch, "prefix.dat")
+        with open(prefix, "w") as f:
+            f.writelines(lines[:count])
+        _, expected = run_reference(self.config_path, prefix, self.reference)
+        _, got = run_engine(engine, self.config, prefix)
+        return bool(_stats_diff(expected, got))
+
+    def bisect(self, engine, lines):
+        """
+        Smallest trace prefix whose stats disagree, given that the whole trace does
+        :return: 0 based position of the last access of that prefix
+        """
+        low, high = 0, len(lines)
+        with tempfile.TemporaryDirectory() as scratch:
+            while high - low > 1:
+                middle = (low + high) // 2
+                if self._prefix_differs(engine, lines, middle, scratch):
+                    high = middle
+                else:
+                    low = middle
+        return high - 1
+
+    def _rows_around(self, rows, index):
+        start = max(0, index - CONTEXT)
+        return list(enumerate(rows))[start:index + CONTEXT + 1]
+
+    def check(self, trace, engine):
+        """
+        Compare one engine against the reference on a trace
+        :return: None when they agree, Divergence otherwise
+        """
+        expected_rows, expected_stats = run_reference(self.config_path, trace, self.reference)
+        got_rows, got_stats = run_engine(engine, self.config, trace)
+        stats_diff = _stats_diff(expected_stats, got_stats)
+        index = None
+        if got_rows is not None:
+            expected_fields = [row_fields(row) for row in expected_rows]
+            got_fields = [row_fields(row) for row in got_rows]
+            if expected_fields != got_fields:
+                index = next((i for i, (expected, got) in enumerate(zip(expected_fields, got_fields))
+                              if expected != got), min(len(expected_fields), len(got_fields)))
+        if index is None and not stats_diff:
+            return None
+        lines = access_lines(trace)
+        if index is None:
+            index = self.bisect(engine, lines)
+            if got_rows is None:
+                # the serial engine renders the rows this one does not
+                got_rows, _ = run_engine("serial", self.config, trace)
+        index = min(index, len(lines) - 1)
+        return Divergence(index, lines[index], self._rows_around(expected_rows, index),
+                          self._rows_around(got_rows, index), stats_diff, level_state(self.config, lines, index))
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Compare the simulator against tests/memhier_ref on shipped and generated traces"
+    )
+    parser.add_argument(
+        "-c", "--config",
+        nargs="+",
+        default=["trace.config"],
+        help="Config file paths (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-t", "--trace",
+        nargs="*",
+        default=[],
+        help="Trace file paths",
+    )
+    parser.add_argument(
+        "--generate",
+        type=int,
+        default=0,
+        metavar="N",
+        help="Also check this many generated traces per config",
+    )
+    parser.add_argument(
+        "--accesses",
+        type=int,
+        default=10000,
+        help="Accesses per generated trace (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--seed",
+        type=int,
+        default=0,
+        help="Seed of the first generated trace, the next ones count up from it (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--engines",
+        default="serial,batch",
+        help=f"Comma separated engines to check, from {', '.join(ENGINES)} (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--reference",
+        default=REFERENCE,
+        help="Reference binary (default: tests/memhier_ref)",
+    )
+    parser.add_argument(
+        "--keep-going",
+        action="store_true",
+        help="Check every combination instead of stopping at the first divergence",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # validation
+    engines = args.engines.split(",")
+    for engine in engines:
+        if engine not in ENGINES:
+            print(f"error: unknown engine: {engine}", file=sys.stderr)
+            sys.exit(2)
+    for path in args.config + args.trace + [args.reference]:
+        if not os.path.exists(path):
+            print(f"error: file not found: {path}", file=sys.stderr)
+            sys.exit(2)
+    if not args.trace and not args.generate:
+        print("error: give traces with -t, --generate, or both", file=sys.stderr)
+        sys.exit(2)
+
+    failures = 0
+    with tempfile.TemporaryDirectory() as scratch:
+        for config_path in args.config:
+            harness = DifferentialHarness(config_path, args.reference)
+            if uses_hashed_indexing(harness.config):
+                print(f"SKIP {config_path}: the reference only models modulo set indexing")
+                continue
+            if uses_prefetching(harness.config):
+                print(f"SKIP {config_path}: the reference does not model prefetching")
+                continue
+            if uses_write_buffer(harness.config):
+                print(f"SKIP {config_path}: the reference does not model write buffers")
+                continue
+            traces = list(args.trace)
+            for i in range(args.generate):
+                trace = os.path.join(scratch, f"generated_{args.seed + i}.dat")
+                generate_trace(trace, args.accesses, harness.config.address_bits, seed=args.seed + i)
+                traces.append(trace)
+            for trace in traces:
+                name = os.path.basename(trace)
+                for engine in engines:
+                    try:
+                        divergence = harness.check(trace, engine)
+                    except RuntimeError as e:
+                        # traces the reference refuses, like addresses wider than the config, say nothing
+                        print(f"SKIP {config_path} {name} {engine}: {e}")
+                        break
+                    if divergence is None:
+                        print(f"PASS {config_path} {name} {engine}")
+                        continue
+                    failures += 1
+                    print(f"FAIL {config_path} {name} {engine}")
+                    print(divergence.format())
+                    if not args.keep_going:
+                        sys.exit(1)
+                if "batch" not in engines:
+                    continue
+                # the batched path has to fire the same tracepoints in the same order as the per access one
+                divergence = event_divergence(harness.config, trace)
+                if divergence is None:
+                    print(f"PASS {config_path} {name} events")
+                    continue
+                failures += 1
+                position, expected, got = divergence
+                print(f"FAIL {config_path} {name} events")
+                print(f"first event out of order at {position}:\n  per access: {expected}\n  batched:    {got}")
+                if not args.keep_going:
+                    sys.exit(1)
+    if failures:
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
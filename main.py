@@ -1,6 +1,23 @@
 from config import Config
-from mem_hierarchy import MemoryHierarchySimulator
+from trace_parser import rereadable_trace
+from mem_hierarchy import MemoryHierarchySimulator, FusedSimulator
+from mem_hierarchy.sharded import ShardedSimulator
+from mem_hierarchy.pipeline import PipelinedSimulator
+from mem_hierarchy.result_cache import ResultCache
+from mem_hierarchy.metrics import EXPORTERS, write_metrics
+from mem_hierarchy.tracepoints import EVENTS, TraceLog
+from mem_hierarchy.profiling import PhaseProfiler
+from mem_hierarchy.timing import TimingModel
+from mem_hierarchy.daemon import SimulatorDaemon, DaemonClient
+from mem_hierarchy.replay import capture_metadata, replay_miss_stream, format_replay
+from mem_hierarchy.data_structures.result_structures import MissStreamWriter, IntervalSeriesWriter, \
+    ColumnarAccessWriter
+from mem_hierarchy.analysis import profile_trace, sample_trace, validate_against_simulator, compare_opt_lru, \
+    format_comparison, SampledSimulator, format_estimates, SimPoints, simulate_simpoints, format_simpoint_estimates, \
+    track_sets, format_set_stats, write_heatmap
 import argparse
+import contextlib
+import json
 import os
 import sys
 
@@ -10,8 +27,10 @@ def parse_args() -> argparse.Namespace:
     )
     parser.add_argument(
         "-c", "--config",
-        default="trace.config",
-        help="Path to config file (default: %(default)s)",
+        nargs="+",
+        default=["trace.config"],
+        help="Path to config file, several configs sharing one VM/DTLB setup are simulated in a single fused pass "
+             "(default: trace.config)",
     )
     parser.add_argument(
         "-t", "--trace",
@@ -31,29 +50,530 @@ def parse_args() -> argparse.Namespace:
         action="store_false",
         help="Quiet mode (turn off verbose output)",
     )
+    parser.add_argument(
+        "--mrc",
+        action="store_true",
+        help="Profile LRU miss ratio curves for every set count and associativity instead of simulating",
+    )
+    sampling = parser.add_mutually_exclusive_group()
+    sampling.add_argument(
+        "--sample-rate",
+        type=float,
+        default=None,
+        help="With --mrc, estimate the curves from this fraction of spatially hashed sets",
+    )
+    sampling.add_argument(
+        "--sample-budget",
+        type=int,
+        default=None,
+        help="With --mrc, estimate the curves from at most this many sampled sets per set count",
+    )
+    parser.add_argument(
+        "--validate",
+        action="store_true",
+        help="With --mrc, compare the configured geometry against a full simulation",
+    )
+    parser.add_argument(
+        "--opt",
+        action="store_true",
+        help="Compare LRU against Belady optimal replacement for the DC and DTLB instead of simulating",
+    )
+    stream = parser.add_mutually_exclusive_group()
+    stream.add_argument(
+        "--capture-miss-stream",
+        metavar="PATH",
+        default=None,
+        help="Record the stream the DC sends to the L2 and memory to this file while simulating",
+    )
+    stream.add_argument(
+        "--replay-miss-stream",
+        metavar="PATH",
+        default=None,
+        help="Replay a captured DC miss stream into the L2 and memory of each config instead of simulating",
+    )
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="In quiet mode, split a physically addressed trace into independent set shards over this many "
+             "worker processes (runs serially when sharding would not be exact)",
+    )
+    parser.add_argument(
+        "--pipeline",
+        action="store_true",
+        help="In quiet mode, run translation and the caches as two pipelined processes",
+    )
+    parser.add_argument(
+        "--sample-period",
+        type=int,
+        default=None,
+        help="Estimate miss rates from one measured window per this many accesses instead of simulating all of them",
+    )
+    parser.add_argument(
+        "--sample-window",
+        type=int,
+        default=10000,
+        help="With --sample-period, accesses measured per period (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--warmup",
+        type=int,
+        default=None,
+        help="With --sample-period or --simulate-simpoints, accesses simulated before each measured "
+             "window, the rest are skipped (default: warm through the whole period)",
+    )
+    parser.add_argument(
+        "--confidence",
+        type=float,
+        default=0.95,
+        help="With --sample-period, confidence level of the intervals (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--target-error",
+        type=float,
+        default=None,
+        help="With --sample-period, stop once the DC and L2 intervals are within this fraction of their miss rates",
+    )
+    simpoint = parser.add_mutually_exclusive_group()
+    simpoint.add_argument(
+        "--simpoints",
+        type=int,
+        metavar="K",
+        default=None,
+        help="Cluster the trace's intervals into K phases and print the representative intervals and their weights "
+             "instead of simulating",
+    )
+    simpoint.add_argument(
+        "--simulate-simpoints",
+        metavar="PATH",
+        default=None,
+        help="Simulate only the representative intervals saved in this file and combine their weighted stats, "
+             "warming up for --warmup accesses (default 0) before each",
+    )
+    parser.add_argument(
+        "--interval",
+        type=int,
+        default=100000,
+        help="Accesses per interval for --simpoints and --interval-metrics (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--simpoints-out",
+        metavar="PATH",
+        default=None,
+        help="With --simpoints, save the representative intervals to this file",
+    )
+    parser.add_argument(
+        "--interval-metrics",
+        metavar="PATH",
+        default=None,
+        help="Stream per interval counter deltas to this file, CSV for a .csv path and JSON lines otherwise",
+    )
+    parser.add_argument(
+        "--metrics",
+        metavar="PATH",
+        default=None,
+        help="Write every registered counter and histogram to this file at the end of the run",
+    )
+    parser.add_argument(
+        "--metrics-format",
+        choices=sorted(EXPORTERS),
+        default=None,
+        help="With --metrics, export format (default: from the extension, .json, .csv or .prom, text otherwise)",
+    )
+    parser.add_argument(
+        "--set-stats",
+        metavar="PATH",
+        default=None,
+        help="Track per set accesses, misses, evictions and back-invalidations with a 3C miss breakdown, print "
+             "the summary and write the per set matrix to this file (JSON for a .json path, CSV otherwise)",
+    )
+    parser.add_argument(
+        "--access-columns",
+        metavar="PATH",
+        default=None,
+        help="Write the raw fields of every access (vpn, ppn, tags, indices, hit/miss) as columns to this file",
+    )
+    parser.add_argument(
+        "--access-columns-format",
+        choices=["binary", "csv"],
+        default=None,
+        help="With --access-columns, file format (default: csv for a .csv path, binary otherwise)",
+    )
+    parser.add_argument(
+        "--timing",
+        action="store_true",
+        help="Time every access with the latencies and bus widths of the config's Timing configuration section, "
+             "then print AMAT, total cycles, per level cycles and bytes moved, and a latency histogram",
+    )
+    parser.add_argument(
+        "--timing-json",
+        metavar="PATH",
+        default=None,
+        help="With --timing, also write the timing summary to this file as JSON",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="Report the wall time and calls spent in each phase of the hierarchy on stderr",
+    )
+    parser.add_argument(
+        "--profile-pstats",
+        metavar="PATH",
+        default=None,
+        help="With --profile, also run under cProfile and dump its stats to this file",
+    )
+    parser.add_argument(
+        "--profile-collapsed",
+        metavar="PATH",
+        default=None,
+        help="With --profile, write the phase stacks in the flamegraph collapsed stack format to this file",
+    )
+    parser.add_argument(
+        "--trace-events",
+        metavar="EVENTS",
+        default=None,
+        help=f"Log hierarchy events as they fire, a comma separated list of {', '.join(EVENTS)}, or all",
+    )
+    parser.add_argument(
+        "--trace-levels",
+        metavar="LEVELS",
+        default=None,
+        help="With --trace-events, only events of these comma separated levels (dc, l2, page table, dtlb)",
+    )
+    parser.add_argument(
+        "--trace-range",
+        metavar="LO-HI",
+        default=None,
+        help="With --trace-events, only events for addresses from LO up to but excluding HI, in hex",
+    )
+    parser.add_argument(
+        "--trace-sets",
+        metavar="SETS",
+        default=None,
+        help="With --trace-events, only events in these comma separated set indices",
+    )
+    parser.add_argument(
+        "--trace-out",
+        metavar="PATH",
+        default=None,
+        help="With --trace-events, write the event log to this file instead of stderr",
+    )
+    parser.add_argument(
+        "--checkpoint",
+        metavar="PATH",
+        default=None,
+        help="Save the hierarchy state and trace position to this file at the end of the run",
+    )
+    parser.add_argument(
+        "--checkpoint-every",
+        type=int,
+        default=None,
+        help="With --checkpoint in quiet mode, also save about every this many accesses",
+    )
+    parser.add_argument(
+        "--restore",
+        metavar="PATH",
+        default=None,
+        help="Start from a checkpoint of a hierarchy with the same geometry and resume the trace where it stopped",
+    )
+    parser.add_argument(
+        "--reset-stats",
+        action="store_true",
+        help="With --restore, keep the warm state but count stats from zero",
+    )
+    parser.add_argument(
+        "--write-to",
+        metavar="PATH",
+        default=None,
+        help="Write the stats to this file as JSON (a plain quiet run prints them on stdout otherwise)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="In quiet mode, always simulate instead of reusing a stored result for the same config and trace",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Result cache directory (default: $MEMHIER_CACHE_DIR or ~/.cache/memhier)",
+    )
+    daemon = parser.add_mutually_exclusive_group()
+    daemon.add_argument(
+        "--serve",
+        metavar="SOCKET",
+        default=None,
+        help="Run as a daemon taking jobs on this Unix socket, with -j warm worker processes",
+    )
+    daemon.add_argument(
+        "--daemon",
+        metavar="SOCKET",
+        default=None,
+        help="Send the config and trace to a daemon on this socket and print the stats as JSON",
+    )
     parser.set_defaults(verbose=True)
-    return parser.parse_args()
+    args = parser.parse_args()
+    # several configs run fused or replayed, these modes only work on a single in-process simulator
+    if len(args.config) > 1 and not args.replay_miss_stream:
+        single = [flag for flag in ("--mrc", "--opt", "--pipeline", "--sample-period", "--simpoints",
+                                    "--simulate-simpoints", "--capture-miss-stream", "--interval-metrics", "--metrics",
+                                    "--set-stats", "--access-columns", "--timing", "--timing-json", "--profile",
+                                    "--profile-pstats", "--profile-collapsed", "--trace-events", "--trace-out",
+                                    "--checkpoint", "--restore", "--daemon", "--write-to")
+                  if getattr(args, flag[2:].replace("-", "_"))]
+        if single:
+            parser.error(f"{', '.join(single)} cannot be used with more than one -c config")
+    # these modes print their own reports instead of the stats
+    if args.write_to:
+        other = [option for option in ("--mrc", "--opt", "--sample-period", "--simpoints", "--simulate-simpoints",
+                                       "--replay-miss-stream", "--daemon", "--serve")
+                 if getattr(args, option[2:].replace("-", "_"))]
+        if other:
+            parser.error(f"--write-to cannot be used with {', '.join(other)}")
+    # the pipelined and sharded runs stand in for a plain quiet run of one config, nothing else
+    if args.pipeline or (args.jobs and not args.serve):
+        flag = "--pipeline" if args.pipeline else "-j"
+        if args.pipeline and args.jobs:
+            parser.error("--pipeline and -j cannot be used together")
+        if args.verbose:
+            parser.error(f"{flag} only applies in quiet mode (-q)")
+        if len(args.config) > 1:
+            parser.error(f"{flag} cannot be used with more than one -c config")
+        other = [option for option in ("--mrc", "--opt", "--sample-period", "--simpoints", "--simulate-simpoints",
+                                       "--replay-miss-stream", "--capture-miss-stream", "--interval-metrics",
+                                       "--metrics", "--set-stats", "--access-columns", "--timing", "--profile",
+                                       "--trace-events", "--checkpoint", "--restore", "--daemon")
+                 if getattr(args, option[2:].replace("-", "_"))]
+        if other:
+            parser.error(f"{flag} cannot be used with {', '.join(other)}")
+    return args
+
+def emit_stats(stats, write_to=None):
+    """
+    Hand back the stats dict of a run as JSON
+    :param write_to: file to write it to, None prints it on stdout
+    """
+    if write_to is None:
+        print(json.dumps(stats, indent=4))
+        return
+    with open(write_to, "w") as f:
+        json.dump(stats, f, indent=4)
 
 def main():
     args = parse_args()
 
     use_stdin = (args.trace == "-")
 
+    if args.serve:
+        SimulatorDaemon(args.serve, workers=args.jobs).serve_forever()
+        return
+
     # validation
-    if not os.path.exists(args.config):
-        print(f"error: config file not found: {args.config}", file=sys.stderr)
-        sys.exit(2)
+    for config_path in args.config:
+        if not os.path.exists(config_path):
+            print(f"error: config file not found: {config_path}", file=sys.stderr)
+            sys.exit(2)
 
     if not use_stdin and not os.path.exists(args.trace):
         print(f"error: trace file not found: {args.trace}", file=sys.stderr)
         sys.exit(2)
 
-    mem_sim_config = Config.from_config_file(args.config)
+    trace_path = "/dev/stdin" if use_stdin else args.trace
+    if args.daemon:
+        with open(args.config[0]) as f:
+            config_text = f.read()
+        try:
+            with DaemonClient(args.daemon) as client:
+                if use_stdin:
+                    stats = client.simulate(config_text, stream=sys.stdin)
+                else:
+                    stats = client.simulate(config_text, trace=trace_path)
+        except (OSError, ValueError) as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(2)
+        print(json.dumps(stats, indent=4))
+        return
+    if args.replay_miss_stream:
+        for config_path in args.config:
+            try:
+                result = replay_miss_stream(Config.from_config_file(config_path), args.replay_miss_stream)
+            except ValueError as e:
+                print(f"error: {config_path}: {e}", file=sys.stderr)
+                sys.exit(2)
+            print(f"{config_path}:")
+            print(format_replay(result))
+        return
+    if len(args.config) > 1:
+        configs = [Config.from_config_file(config_path) for config_path in args.config]
+        try:
+            fused = FusedSimulator(configs)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(2)
+        if args.verbose:
+            for config_path, config in zip(args.config, configs):
+                print(f"{config_path}:")
+                print(config)
+        fused.simulate(trace_path)
+        if args.verbose:
+            for config_path, simulator in zip(args.config, fused.simulators):
+                print(f"\nSimulation statistics for {config_path}\n")
+                simulator.pprint_stats()
+        return
+    mem_sim_config = Config.from_config_file(args.config[0])
     if args.verbose:
         print(mem_sim_config)
-    trace_path = "/dev/stdin" if use_stdin else args.trace
+    if args.mrc:
+        # validation reads the trace a second time
+        with rereadable_trace(trace_path) if args.validate else contextlib.nullcontext(trace_path) as trace_path:
+            if args.sample_rate is not None or args.sample_budget is not None:
+                profilers = sample_trace(mem_sim_config, trace_path, rate=args.sample_rate,
+                                         budget=args.sample_budget)
+            else:
+                profilers = profile_trace(mem_sim_config, trace_path)
+            for profiler in profilers.values():
+                print(profiler.format_curves())
+            if args.validate:
+                for level, (simulated, estimate, error) in validate_against_simulator(
+                        mem_sim_config, trace_path, profilers).items():
+                    error_str = f" (+-{1.96 * error:.6f})" if error is not None else ""
+                    print(f"{level:<5s} simulated miss ratio {simulated:.6f}, estimated {estimate:.6f}{error_str}")
+        return
+    if args.sample_period:
+        try:
+            sampled = SampledSimulator(mem_sim_config, period=args.sample_period, window=args.sample_window,
+                                       warmup=args.warmup, confidence=args.confidence, target_error=args.target_error)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(2)
+        print(format_estimates(sampled.simulate(trace_path)))
+        return
+    if args.simpoints:
+        try:
+            simpoints = SimPoints.analyze(mem_sim_config, trace_path, interval_size=args.interval, k=args.simpoints)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(2)
+        print(simpoints.format())
+        if args.simpoints_out:
+            simpoints.save(args.simpoints_out)
+        return
+    if args.simulate_simpoints:
+        try:
+            estimates = simulate_simpoints(mem_sim_config, trace_path, SimPoints.load(args.simulate_simpoints),
+                                           warmup=args.warmup or 0)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(2)
+        print(format_simpoint_estimates(estimates))
+        return
+    if args.opt:
+        try:
+            comparison = compare_opt_lru(mem_sim_config, trace_path)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(2)
+        print(format_comparison(comparison))
+        return
+    # checkpoints, metrics, tracepoints, and profiles work on a single in-process simulator
+    serial_only = args.capture_miss_stream or args.checkpoint or args.restore or args.interval_metrics or \
+        args.metrics or args.trace_events or args.profile or args.access_columns or args.set_stats or args.timing
+    # a plain quiet run only hands back its stats, so a stored result for the same config and trace stands in for it
+    plain = not args.verbose and not serial_only
+    cache = ResultCache(args.cache_dir) if args.cache and plain else None
+    cache_key = cache.key(mem_sim_config, trace_path) if cache else None
+    stats = cache.get(cache_key) if cache else None
+    if stats is not None:
+        emit_stats(stats, args.write_to)
+        return
+    if args.pipeline:
+        stats = PipelinedSimulator(mem_sim_config).simulate(trace_path)
+        if cache:
+            cache.put(cache_key, stats)
+        emit_stats(stats, args.write_to)
+        return
+    if args.jobs:
+        sharded = ShardedSimulator(mem_sim_config, workers=args.jobs)
+        if not sharded.exact:
+            print(f"note: running serially, {sharded.reason}", file=sys.stderr)
+        stats = sharded.simulate(trace_path)
+        if cache:
+            cache.put(cache_key, stats)
+        emit_stats(stats, args.write_to)
+        return
     simulator = MemoryHierarchySimulator(mem_sim_config)
-    simulator.simulate(trace_path, verbose=args.verbose)
+    start = 0
+    if args.restore:
+        try:
+            start = simulator.restore(args.restore, counters=not args.reset_stats)
+        except ValueError as e:
+            print(f"error: {args.restore}: {e}", file=sys.stderr)
+            sys.exit(2)
+    if args.capture_miss_stream:
+        writer = MissStreamWriter(args.capture_miss_stream, mem_sim_config.bits.dc_offset_bits)
+        simulator.dc.capture_miss_stream(writer)
+    trace_log = None
+    if args.trace_events:
+        try:
+            events = None if args.trace_events == "all" else args.trace_events.split(",")
+            levels = args.trace_levels.split(",") if args.trace_levels else None
+            address_range = None
+            if args.trace_range:
+                low, high = args.trace_range.split("-")
+                address_range = (int(low, 16), int(high, 16))
+            sets = [int(index) for index in args.trace_sets.split(",")] if args.trace_sets else None
+            trace_log = TraceLog(open(args.trace_out, "w") if args.trace_out else sys.stderr)
+            simulator.tracepoints.subscribe(trace_log, events, levels, address_range, sets)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(2)
+    series = None
+    if args.interval_metrics:
+        try:
+            series = IntervalSeriesWriter(args.interval_metrics, args.interval)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(2)
+    tracked_sets = track_sets(simulator) if args.set_stats else None
+    columns = None
+    if args.access_columns:
+        try:
+            columns = ColumnarAccessWriter(args.access_columns, args.access_columns_format)
+        except ValueError as e:
+            print(f"error: {e}", file=sys.stderr)
+            sys.exit(2)
+    simulate_args = dict(verbose=args.verbose, start=start, checkpoint_to=args.checkpoint,
+                         checkpoint_every=args.checkpoint_every, series=series, columns=columns)
+    timing = TimingModel(mem_sim_config.timing) if args.timing else None
+    with timing.attached(simulator) if timing else contextlib.nullcontext():
+        if args.profile:
+            profiler = PhaseProfiler()
+            stats = profiler.run(simulator, trace_path, pstats_path=args.profile_pstats, **simulate_args)
+            print(profiler.format(), file=sys.stderr)
+            if args.profile_collapsed:
+                profiler.write_collapsed(args.profile_collapsed)
+        else:
+            stats = simulator.simulate(trace_path, **simulate_args)
+    if timing is not None:
+        print("\nTiming\n")
+        print(timing.format())
+        if args.timing_json:
+            with open(args.timing_json, "w") as f:
+                json.dump(timing.summary(), f, indent=4)
+    if args.metrics:
+        write_metrics(simulator.metrics, args.metrics, args.metrics_format)
+    if tracked_sets is not None:
+        write_heatmap(tracked_sets, args.set_stats)
+        print(format_set_stats(tracked_sets))
+    if cache:
+        cache.put(cache_key, stats)
+    if plain or args.write_to:
+        emit_stats(stats, args.write_to)
+    if args.capture_miss_stream:
+        simulator.dc.capture_miss_stream(None)
+        writer.close(capture_metadata(simulator))
+    if trace_log is not None and args.trace_out:
+        trace_log.out.close()
 
 
 if __name__ == '__main__':
@@ -1,3 +1,4 @@
 from .simulator import MemoryHierarchySimulator
+from .fused import FusedSimulator
 
-__all__ = ["MemoryHierarchySimulator"]
\ No newline at end of file
+__all__ = ["MemoryHierarchySimulator", "FusedSimulator"]
\ No newline at end of file
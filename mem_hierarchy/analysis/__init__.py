@@ -0,0 +1,11 @@
+from .stack_distance import StackDistanceProfiler, profile_trace
+from .shards import ShardsProfiler, sample_trace, validate_against_simulator
+from .belady import NextUseIndex, compare_opt_lru, format_comparison
+from .sampled_simulation import SampledSimulator, format_estimates
+from .simpoint import SimPoints, simulate_simpoints, format_simpoint_estimates
+from .set_conflicts import SetStats, track_sets, analyze_set_conflicts, format_set_stats, write_heatmap
+
+__all__ = ["StackDistanceProfiler", "profile_trace", "ShardsProfiler", "sample_trace", "validate_against_simulator",
+           "NextUseIndex", "compare_opt_lru", "format_comparison", "SampledSimulator", "format_estimates",
+           "SimPoints", "simulate_simpoints", "format_simpoint_estimates", "SetStats", "track_sets",
+           "analyze_set_conflicts", "format_set_stats", "write_heatmap"]
@@ -0,0 +1,204 @@
+import os
+import tempfile
+from array import array
+from trace_parser import TraceParser, rereadable_trace
+from mem_hierarchy.data_structures.mem_levels.translation_front_end import TranslationFrontEnd
+from mem_hierarchy.data_structures.result_structures.access_results import AccessLine
+from mem_hierarchy.protocols.replacement import BeladyReplacement
+
+# next use of a block that is never referenced again
+NEVER = 2 ** 62
+_ITEM_BYTES = array('q').itemsize
+# reuse keys carry a generation above the block number, addresses are at most 32 bits
+_GENERATION_SHIFT = 40
+_BLOCK_MASK = (1 << _GENERATION_SHIFT) - 1
+
+
+class NextUseIndex:
+    """
+    On disk next use index for one cache's reference stream. A forward pass appends the block each reference
+    touches, finalize() runs a chunked backward pass that writes the position of the next reference to the same
+    block, so only one chunk plus the set of distinct blocks is ever held in memory.
+    A block's generation is bumped when its contents are invalidated (page evictions), references across
+    generations are not reuses.
+    """
+    def __init__(self, name, directory, chunk_size=1 << 16):
+        self.name = name
+        self.chunk_size = chunk_size
+        self.blocks_path = os.path.join(directory, f"{name}.blocks")
+        self.next_path = os.path.join(directory, f"{name}.next")
+        self._blocks_file = open(self.blocks_path, 'wb')
+        self._pending = array('q')
+        self.length = 0
+
+    def append(self, block, generation=0):
+        self._pending.append((generation << _GENERATION_SHIFT) | block)
+        if len(self._pending) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        self._pending.tofile(self._blocks_file)
+        self.length += len(self._pending)
+        self._pending = array('q')
+
+    def finalize(self):
+        """
+        Backward pass over the recorded blocks, chunk by chunk from the end of the stream
+        :return: None
+        """
+        self._flush()
+        self._blocks_file.close()
+        last_seen = {}
+        with open(self.blocks_path, 'rb') as blocks_file, open(self.next_path, 'wb') as next_file:
+            next_file.truncate(self.length * _ITEM_BYTES)
+            end = self.length
+            while end > 0:
+                start = max(0, end - self.chunk_size)
+                blocks = array('q')
+                blocks_file.seek(start * _ITEM_BYTES)
+                blocks.fromfile(blocks_file, end - start)
+                next_uses = array('q', bytes(len(blocks) * _ITEM_BYTES))
+                for offset in range(len(blocks) - 1, -1, -1):
+                    block = blocks[offset]
+                    next_uses[offset] = last_seen.get(block, NEVER)
+                    last_seen[block] = start + offset
+                next_file.seek(start * _ITEM_BYTES)
+                next_uses.tofile(next_file)
+                end = start
+
+    def __iter__(self):
+        """
+        Stream (block, next use) pairs forward, a chunk at a time
+        """
+        with open(self.blocks_path, 'rb') as blocks_file, open(self.next_path, 'rb') as next_file:
+            remaining = self.length
+            while remaining > 0:
+                count = min(self.chunk_size, remaining)
+                blocks = array('q')
+                blocks.fromfile(blocks_file, count)
+                next_uses = array('q')
+                next_uses.fromfile(next_file, count)
+                for key, next_use in zip(blocks, next_uses):
+                    yield key & _BLOCK_MASK, next_use
+                remaining -= count
+
+    def remove(self):
+        for path in (self.blocks_path, self.next_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def build_next_use_indexes(config, trace, directory, chunk_size=1 << 16):
+    """
+    Build next use indexes for the DTLB (virtual page numbers, when virtual addresses and the DTLB are enabled) and
+    the DC (physical blocks). Both levels see exactly one reference per trace access. The DTLB stream comes straight
+    from the trace. The DC stream depends on translation, and the page table's LRU order depends on which
+    references hit in the DTLB, so a second pass runs the translation front end with the optimal DTLB to get the
+    physical stream of the OPT run. Page evictions start a new generation for the evicted ppn since the
+    invalidation drops those lines before they can be reused.
+    :param config: Config
+    :param trace: trace file path
+    :param directory: directory for the index files
+    :return: dict of level name to NextUseIndex
+    """
+    indexes = {}
+    page_offset_bits = config.bits.page_offset_bits
+    front_end = None
+    if config.virtual_addresses:
+        front_end = TranslationFrontEnd(config)
+        if front_end.dtlb is not None:
+            dtlb_index = indexes["dtlb"] = NextUseIndex("dtlb", directory, chunk_size)
+            for _, address, _ in TraceParser(trace, addr_bits=config.address_bits):
+                dtlb_index.append(address >> page_offset_bits)
+            dtlb_index.finalize()
+            dtlb_policy = BeladyReplacement(front_end.dtlb.dtlb_cache, dtlb_index)
+
+    dc_index = indexes["dc"] = NextUseIndex("dc", directory, chunk_size)
+    dc_offset_bits = config.bits.dc_offset_bits
+    ppn_generation = {}
+    for operation, address, _ in TraceParser(trace, addr_bits=config.address_bits):
+        if front_end is None:
+            physical_address = address
+        else:
+            if "dtlb" in indexes:
+                dtlb_policy.advance()
+            physical_address, evictions = front_end.translate(operation, address)
+            for evicted in evictions:
+                ppn_generation[evicted.ppn] = ppn_generation.get(evicted.ppn, 0) + 1
+        dc_index.append(physical_address >> dc_offset_bits, ppn_generation.get(physical_address >> page_offset_bits, 0))
+    dc_index.finalize()
+    return indexes
+
+
+def simulate_opt(config, trace, indexes):
+    """
+    Run the configured hierarchy with Belady replacement in the DC and DTLB. The L2 keeps LRU, its reference
+    stream depends on DC misses so it cannot be known ahead of time. Inclusion back invalidations from the L2 are
+    not foreseen either, so with an L2 the DC result is a near optimal rather than a strict bound.
+    :param config: Config
+    :param trace: trace file path
+    :param indexes: dict from build_next_use_indexes
+    :return: MemoryHierarchySimulator after the run
+    """
+    # imported here since the simulator pulls in the whole hierarchy
+    from mem_hierarchy.simulator import MemoryHierarchySimulator
+    simulator = MemoryHierarchySimulator(config)
+    policies = [BeladyReplacement(simulator.dc.cache, indexes["dc"])]
+    if simulator.dtlb is not None and "dtlb" in indexes:
+        policies.append(BeladyReplacement(simulator.dtlb.dtlb_cache, indexes["dtlb"]))
+    for operation, address, _ in TraceParser(trace, addr_bits=config.address_bits):
+        if operation == "R":
+            simulator.reads += 1
+        elif operation == "W":
+            simulator.writes += 1
+        else:
+            raise ValueError(f"Unknown op: {operation}")
+        for policy in policies:
+            policy.advance()
+        simulator.top_level.access(operation, address, AccessLine(address))
+    return simulator
+
+
+def compare_opt_lru(config, trace, chunk_size=1 << 16):
+    """
+    Simulate the trace under LRU and under Belady OPT for the DC and DTLB. The trace is read several times, so a
+    trace on stdin or a pipe is spooled to a temporary file first.
+    :param config: Config
+    :param trace: trace file path
+    :return: dict of level name to {"lru": stats, "opt": stats}
+    """
+    from mem_hierarchy.simulator import MemoryHierarchySimulator
+    lru = MemoryHierarchySimulator(config)
+    with rereadable_trace(trace) as trace, tempfile.TemporaryDirectory() as directory:
+        lru.simulate(trace, verbose=False)
+        indexes = build_next_use_indexes(config, trace, directory, chunk_size)
+        opt = simulate_opt(config, trace, indexes)
+    lru_stats = lru.get_stats()
+    opt_stats = opt.get_stats()
+    comparison = {}
+    for level in ("dtlb", "dc", "l2"):
+        if level in lru_stats:
+            comparison[level] = {"lru": lru_stats[level], "opt": opt_stats[level]}
+    comparison["main memory"] = {"lru": lru_stats["main memory"], "opt": opt_stats["main memory"]}
+    return comparison
+
+
+def format_comparison(comparison):
+    """
+    Render an LRU vs OPT comparison side by side
+    :param comparison: dict from compare_opt_lru
+    :return: string
+    """
+    print_str = "level        LRU hits  LRU misses  LRU hit rate  OPT hits  OPT misses  OPT hit rate  gap\n"
+    print_str += "------------ --------- ----------- ------------- --------- ----------- ------------- ---------\n"
+    for level, stats in comparison.items():
+        lru = stats["lru"]
+        opt = stats["opt"]
+        if level == "main memory":
+            print_str += f"{'main memory':<12s} {'refs ' + str(lru['mem_accesses']):>33s}" \
+                         f" {'refs ' + str(opt['mem_accesses']):>37s}\n"
+            continue
+        gap = opt["hit rate"] - lru["hit rate"]
+        print_str += f"{level:<12s} {lru['hits']:>9d} {lru['misses']:>11d} {lru['hit rate']:>13.6f}" \
+                     f" {opt['hits']:>9d} {opt['misses']:>11d} {opt['hit rate']:>13.6f} {gap:>9.6f}\n"
+    return print_str
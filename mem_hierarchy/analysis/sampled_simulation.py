@@ -0,0 +1,225 @@
+import math
+from itertools import islice
+from statistics import NormalDist
+from trace_parser import TraceParser, hex_to_int
+
+# levels whose miss rates are estimated, in report order
+LEVELS = ("dtlb", "page table", "dc", "l2")
+# levels that have to converge before an early stop
+CONVERGENCE_LEVELS = ("dc", "l2")
+
+
+def _level_counts(stats):
+    """
+    (misses, accesses) per level from MemoryHierarchySimulator.get_stats
+    """
+    counts = {}
+    for level in LEVELS:
+        if level in stats:
+            counts[level] = (stats[level]["misses"], stats[level]["hits"] + stats[level]["misses"])
+    return counts
+
+
+def run_lines(simulator, lines, count, mask, batch_size=4096):
+    """
+    Decode up to count raw trace lines and run them through the simulator's batched path
+    :param simulator: MemoryHierarchySimulator
+    :param lines: iterator of raw trace lines
+    :param mask: address mask
+    :return: number of lines consumed
+    """
+    consumed = 0
+    while consumed < count:
+        chunk = list(islice(lines, min(batch_size, count - consumed)))
+        if not chunk:
+            break
+        consumed += len(chunk)
+        ops = []
+        addrs = []
+        for line in chunk:
+            parts = line.split(":")
+            if len(parts) < 2:
+                continue
+            ops.append(parts[0].strip())
+            addrs.append(hex_to_int(parts[1].strip()) & mask)
+        if ops:
+            simulator.access_many(ops, addrs)
+    return consumed
+
+
+def skip_lines(lines, count):
+    """
+    Consume up to count raw trace lines without decoding them
+    :return: number of lines consumed
+    """
+    skipped = 0
+    for _ in islice(lines, count):
+        skipped += 1
+    return skipped
+
+
+class MissRateEstimate:
+    """
+    Miss rate of one level over the measured windows, a ratio estimate with each window as one cluster
+    """
+    def __init__(self):
+        self.window_misses = []
+        self.window_accesses = []
+
+    def add_window(self, misses, accesses):
+        self.window_misses.append(misses)
+        self.window_accesses.append(accesses)
+
+    @property
+    def miss_rate(self):
+        accesses = sum(self.window_accesses)
+        return sum(self.window_misses) / accesses if accesses else 0.0
+
+    def standard_error(self):
+        n = len(self.window_accesses)
+        total = sum(self.window_accesses)
+        if n < 2 or total == 0:
+            return math.inf
+        ratio = self.miss_rate
+        residuals = sum((misses - ratio * accesses) ** 2
+                        for misses, accesses in zip(self.window_misses, self.window_accesses))
+        return math.sqrt(residuals / (n - 1) / n) / (total / n)
+
+
+class SampledSimulator:
+    """
+    Periodic sampling in the style of SMARTS. Every period of the trace ends in a measured window, the stats of a
+    run come only from those windows, and miss rates are reported with confidence intervals over the windows.
+    With functional warming (warmup=None) every access outside the windows still runs through the hierarchy's
+    batched path, so cache, DTLB and page table state is exact when a window starts. With a warmup length, only
+    that many accesses before each window are simulated and the rest of the period is skipped without decoding,
+    which is much faster but leaves stale state from the previous window behind.
+    """
+    def __init__(self, config, period=1000000, window=10000, warmup=None, confidence=0.95, target_error=None,
+                 min_windows=10, batch_size=4096):
+        """
+        :param config: Config
+        :param period: accesses per sampling period
+        :param window: measured accesses at the end of each period
+        :param warmup: accesses simulated before each window, None to warm through the whole period
+        :param confidence: confidence level of the reported intervals
+        :param target_error: stop once the DC and L2 interval half widths are within this fraction of their
+                             miss rates, None to run the whole trace
+        :param min_windows: windows measured before an early stop is considered
+        """
+        if window < 1 or window > period:
+            raise ValueError("Sample window must be between 1 and the sampling period.")
+        if warmup is not None and warmup < 0:
+            raise ValueError("Warmup must not be negative.")
+        # imported here since the simulator pulls in the whole hierarchy
+        from mem_hierarchy.simulator import MemoryHierarchySimulator
+        self.config = config
+        self.simulator = MemoryHierarchySimulator(config)
+        self.period = period
+        self.window = window
+        self.warmup = warmup
+        self.z = NormalDist().inv_cdf(0.5 + confidence / 2)
+        self.confidence = confidence
+        self.target_error = target_error
+        self.min_windows = min_windows
+        self.batch_size = batch_size
+        self.estimates = {}
+        self.lines_seen = 0
+        self.measured = 0
+        self.stopped_early = False
+
+    def _run(self, lines, count, mask):
+        """
+        Decode and simulate up to count trace lines
+        :return: number of lines consumed
+        """
+        return run_lines(self.simulator, lines, count, mask, self.batch_size)
+
+    def _measure(self, lines, mask):
+        before = _level_counts(self.simulator.get_stats())
+        consumed = self._run(lines, self.window, mask)
+        after = _level_counts(self.simulator.get_stats())
+        for level, (misses, accesses) in after.items():
+            window_accesses = accesses - before[level][1]
+            if window_accesses:
+                self.estimates.setdefault(level, MissRateEstimate()).add_window(
+                    misses - before[level][0], window_accesses)
+        self.measured += consumed
+        return consumed
+
+    def converged(self):
+        """
+        Whether the DC and L2 estimates are within the target error
+        """
+        if self.target_error is None:
+            return False
+        for level in CONVERGENCE_LEVELS:
+            estimate = self.estimates.get(level)
+            if estimate is None:
+                continue
+            if len(estimate.window_accesses) < self.min_windows:
+                return False
+            if self.z * estimate.standard_error() > self.target_error * estimate.miss_rate:
+                return False
+        return True
+
+    def simulate(self, trace):
+        """
+        Run the sampled simulation. Positions in the schedule count trace lines.
+        :param trace: trace file path
+        :return: dict from get_estimates
+        """
+        mask = (1 << self.config.address_bits) - 1
+        lines = TraceParser(trace, addr_bits=self.config.address_bits).iter_lines()
+        skip_length = 0
+        warm_length = self.period - self.window
+        if self.warmup is not None and self.warmup < warm_length:
+            skip_length = warm_length - self.warmup
+            warm_length = self.warmup
+        while True:
+            if skip_length:
+                skipped = skip_lines(lines, skip_length)
+                self.lines_seen += skipped
+                if skipped < skip_length:
+                    break
+            self.lines_seen += self._run(lines, warm_length, mask)
+            consumed = self._measure(lines, mask)
+            self.lines_seen += consumed
+            if consumed < self.window:
+                break
+            if self.converged():
+                self.stopped_early = True
+                break
+        # releases the trace file when the run stopped early
+        lines.close()
+        return self.get_estimates()
+
+    def get_estimates(self):
+        """
+        :return: dict of level name to miss rate, interval half width, and window count, plus run totals
+        """
+        estimates = {}
+        for level in LEVELS:
+            estimate = self.estimates.get(level)
+            if estimate is None:
+                continue
+            estimates[level] = {"miss rate": estimate.miss_rate,
+                                "half width": self.z * estimate.standard_error(),
+                                "windows": len(estimate.window_accesses)}
+        return {"levels": estimates, "confidence": self.confidence, "lines seen": self.lines_seen,
+                "accesses measured": self.measured, "stopped early": self.stopped_early}
+
+
+def format_estimates(estimates):
+    """
+    Render sampled miss rate estimates
+    :param estimates: dict from SampledSimulator.get_estimates
+    :return: string
+    """
+    print_str = f"sampled {estimates['accesses measured']} of {estimates['lines seen']} accesses" \
+                f"{' (stopped early)' if estimates['stopped early'] else ''}, " \
+                f"{estimates['confidence']:.0%} confidence intervals\n"
+    for level, estimate in estimates["levels"].items():
+        print_str += f"{level + ' miss rate':<21s}: {estimate['miss rate']:.6f} +- {estimate['half width']:.6f}" \
+                     f" ({estimate['windows']} windows)\n"
+    return print_str
@@ -0,0 +1,174 @@
+import csv
+import json
+from array import array
+from collections import OrderedDict
+from config import Config
+from mem_hierarchy.simulator import MemoryHierarchySimulator
+
+# per set counters in heatmap column order
+METRICS = ("accesses", "misses", "evictions", "dirty_evictions", "back_invalidations",
+           "compulsory", "capacity", "conflict")
+# sets listed by format_set_stats, most misses first
+HOTTEST_SETS = 8
+
+
+class SetStats:
+    """
+    Per set counters of one cache level, and the 3C classification of its demand misses. A shadow fully
+    associative LRU tag store of the same capacity sees the same demand stream: a miss on a block never seen
+    before is compulsory, a miss the shadow store also misses is capacity, and a miss the shadow store hits
+    is conflict, the set mapping alone lost that block. Writebacks from the level above count toward
+    evictions and back-invalidations but are not demand accesses, and the shadow store allocates on every
+    miss whatever the write policy. Hits of the level above and writebacks that hit here touch the real
+    cache's recency without being demand accesses, so they touch the shadow store's too.
+    """
+    def __init__(self, num_sets, lines):
+        """
+        :param num_sets: sets of the cache
+        :param lines: lines of the cache, the size of the shadow store
+        """
+        self.num_sets = num_sets
+        self.lines = lines
+        for metric in METRICS:
+            setattr(self, metric, array('q', bytes(8 * num_sets)))
+        self._shadow = OrderedDict()
+        self._seen = set()
+
+    def access(self, index, block, hit):
+        """
+        Count one demand access
+        :param index: set index
+        :param block: block base address
+        :param hit: whether the real cache hit
+        """
+        self.accesses[index] += 1
+        shadow_hit = self.touched(block)
+        first_reference = block not in self._seen
+        if first_reference:
+            self._seen.add(block)
+        if hit:
+            return
+        self.misses[index] += 1
+        if first_reference:
+            self.compulsory[index] += 1
+        elif shadow_hit:
+            self.conflict[index] += 1
+        else:
+            self.capacity[index] += 1
+
+    def touched(self, block):
+        """
+        Reference a block in the shadow store only
+        :param block: block base address
+        :return: whether the shadow store held it
+        """
+        shadow = self._shadow
+        if block in shadow:
+            shadow.move_to_end(block)
+            return True
+        shadow[block] = None
+        if len(shadow) > self.lines:
+            shadow.popitem(last=False)
+        return False
+
+    def evicted(self, index, dirty):
+        self.evictions[index] += 1
+        if dirty:
+            self.dirty_evictions[index] += 1
+
+    def back_invalidated(self, index):
+        self.back_invalidations[index] += 1
+
+    def totals(self):
+        return {metric: sum(getattr(self, metric)) for metric in METRICS}
+
+    def matrix(self):
+        """
+        Heatmap ready rows, one per set
+        :return: list of lists, the counters of each set in METRICS order
+        """
+        columns = [getattr(self, metric) for metric in METRICS]
+        return [[column[index] for column in columns] for index in range(self.num_sets)]
+
+
+def track_sets(simulator):
+    """
+    Start per set tracking on every data cache of a simulator. Tracked levels run each access through the full
+    path, the batched hit loop is skipped while tracking.
+    :param simulator: MemoryHierarchySimulator
+    :return: dict of level name to SetStats
+    """
+    tracked = {}
+    for level in (simulator.dc, simulator.l2):
+        if level is None:
+            continue
+        cache = level.cache
+        level.set_stats = SetStats(cache.num_sets, cache.num_sets * cache.associativity)
+        tracked[level.name] = level.set_stats
+    return tracked
+
+
+def analyze_set_conflicts(config, trace):
+    """
+    Simulate a trace with per set tracking on
+    :param config: Config or config file path
+    :param trace: trace file path
+    :return: dict of level name to SetStats
+    """
+    if isinstance(config, str):
+        config = Config.from_config_file(config)
+    simulator = MemoryHierarchySimulator(config)
+    tracked = track_sets(simulator)
+    simulator.simulate(trace, verbose=False)
+    return tracked
+
+
+def format_set_stats(tracked):
+    """
+    3C breakdown of each level and its sets with the most misses
+    :param tracked: dict of level name to SetStats
+    :return: string
+    """
+    lines = []
+    for name, stats in tracked.items():
+        totals = stats.totals()
+        misses = totals["misses"] or 1
+        lines.append(f"{name} ({stats.num_sets} sets, {stats.lines} lines): {totals['accesses']} accesses, "
+                     f"{totals['misses']} misses")
+        for kind in ("compulsory", "capacity", "conflict"):
+            lines.append(f"    {kind:<11s}: {totals[kind]:>10d} ({100 * totals[kind] / misses:5.1f}%)")
+        lines.append(f"    {'set':>6s} {'accesses':>10s} {'misses':>10s} {'conflict':>10s} {'evictions':>10s} "
+                     f"{'dirty':>10s} {'back inv.':>10s}")
+        hottest = sorted(range(stats.num_sets), key=lambda index: (-stats.misses[index], index))[:HOTTEST_SETS]
+        for index in hottest:
+            if not stats.misses[index]:
+                break
+            lines.append(f"    {index:>6d} {stats.accesses[index]:>10d} {stats.misses[index]:>10d} "
+                         f"{stats.conflict[index]:>10d} {stats.evictions[index]:>10d} "
+                         f"{stats.dirty_evictions[index]:>10d} {stats.back_invalidations[index]:>10d}")
+    return "\n".join(lines)
+
+
+def write_heatmap(tracked, path, fmt=None):
+    """
+    Write the per set matrix of every level
+    :param tracked: dict of level name to SetStats
+    :param path: output file path
+    :param fmt: "csv" (one row per level and set) or "json" ({level: {metric: [count per set]}}), defaults from
+                the extension, csv otherwise
+    :return: None
+    """
+    fmt = fmt or ("json" if path.endswith(".json") else "csv")
+    if fmt == "json":
+        with open(path, "w") as f:
+            json.dump({name: {metric: list(getattr(stats, metric)) for metric in METRICS}
+                       for name, stats in tracked.items()}, f, indent=4)
+    elif fmt == "csv":
+        with open(path, "w", newline="") as f:
+            writer = csv.writer(f)
+            writer.writerow(["level", "set"] + list(METRICS))
+            for name, stats in tracked.items():
+                for index, row in enumerate(stats.matrix()):
+                    writer.writerow([name, index] + row)
+    else:
+        raise ValueError(f"Unknown heatmap format: {fmt}")
@@ -0,0 +1,264 @@
+import math
+from collections import Counter
+from trace_parser import TraceParser
+from mem_hierarchy.data_structures.mem_levels.translation_front_end import TranslationFrontEnd
+from .stack_distance import MAX_DC_SETS, MAX_L2_SETS, MAX_DTLB_SETS, MAX_ASSOCIATIVITY, _max_sets
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, sampled sets are filtered one access at a time without it
+    np = None
+
+HASH_BITS = 24
+_HASH_MODULUS = 1 << HASH_BITS
+_HASH_MULTIPLIER = 0x9E3779B97F4A7C15
+# below this many sampled sets the estimate is too noisy, so small set counts are tracked exactly
+MIN_SAMPLED_SETS = 32
+
+
+def spatial_hash(value):
+    """
+    Fibonacci hash of an address field onto [0, 2^HASH_BITS)
+    """
+    return ((value * _HASH_MULTIPLIER) & 0xFFFFFFFFFFFFFFFF) >> (64 - HASH_BITS)
+
+
+class SampledSetStacks:
+    """
+    LRU stacks for a spatially hashed sample of the sets of one set count. Blocks are sampled by hashing the set
+    index bits of their address, so a sampled set sees every block that maps to it and its stack stays exact.
+    Stacks are cut off at the largest associativity of interest, so memory is bounded by the sampled sets.
+    """
+    def __init__(self, num_sets, max_associativity, rate=None, budget=None):
+        self.num_sets = num_sets
+        self.max_associativity = max_associativity
+        self._set_mask = num_sets - 1
+        if budget is not None:
+            # fixed size sample, keep the sets with the smallest hash values
+            chosen = sorted(range(num_sets), key=spatial_hash)[:budget]
+        elif rate is not None:
+            threshold = rate * _HASH_MODULUS
+            chosen = [index for index in range(num_sets) if spatial_hash(index) < threshold]
+            if len(chosen) < MIN_SAMPLED_SETS:
+                chosen = sorted(range(num_sets), key=spatial_hash)[:MIN_SAMPLED_SETS]
+        else:
+            chosen = range(num_sets)
+        self.sampled = bytearray(num_sets)
+        for index in chosen:
+            self.sampled[index] = 1
+        self.n_sampled = sum(self.sampled)
+        self.rate = self.n_sampled / num_sets
+        self._sampled_np = np.frombuffer(bytes(self.sampled), dtype=np.uint8).astype(bool) if np is not None else None
+        self.stacks = {}
+        self.set_accesses = Counter()
+        self.set_hits = {}
+
+    def access(self, block):
+        index = block & self._set_mask
+        if not self.sampled[index]:
+            return
+        self._access_sampled(block, index)
+
+    def _access_sampled(self, block, index):
+        stack = self.stacks.get(index)
+        if stack is None:
+            stack = self.stacks[index] = []
+            self.set_hits[index] = [0] * self.max_associativity
+        self.set_accesses[index] += 1
+        # MRU first, so the position of a block is its stack distance
+        if block in stack:
+            distance = stack.index(block)
+            del stack[distance]
+            self.set_hits[index][distance] += 1
+        elif len(stack) == self.max_associativity:
+            stack.pop()
+        stack.insert(0, block)
+
+    def access_many(self, blocks):
+        """
+        Feed a batch of blocks, only the ones in sampled sets are visited
+        :param blocks: list of int block numbers
+        :return: None
+        """
+        mask = self._set_mask
+        if self._sampled_np is None:
+            sampled = self.sampled
+            for block in blocks:
+                index = block & mask
+                if sampled[index]:
+                    self._access_sampled(block, index)
+            return
+        arr = np.asarray(blocks, dtype=np.int64)
+        for i in np.flatnonzero(self._sampled_np[arr & mask]).tolist():
+            block = blocks[i]
+            self._access_sampled(block, block & mask)
+
+    def _set_misses(self, associativity):
+        return {index: accesses - sum(self.set_hits[index][:associativity])
+                for index, accesses in self.set_accesses.items()}
+
+    def miss_ratio(self, associativity):
+        """
+        Ratio estimate of the miss ratio from the sampled sets
+        """
+        total = sum(self.set_accesses.values())
+        if total == 0:
+            return 0
+        return sum(self._set_misses(associativity).values()) / total
+
+    def standard_error(self, associativity):
+        """
+        Standard error of the miss ratio, treating each sampled set as a cluster of a cluster sample
+        """
+        n = self.n_sampled
+        if n == self.num_sets or n < 2:
+            return 0.0
+        total = sum(self.set_accesses.values())
+        if total == 0:
+            return 0.0
+        ratio = self.miss_ratio(associativity)
+        misses = self._set_misses(associativity)
+        # sampled sets that were never touched still count as clusters with no accesses and no misses
+        residuals = sum((misses[index] - ratio * accesses) ** 2 for index, accesses in self.set_accesses.items())
+        mean_accesses = total / n
+        variance = (1 - self.rate) * residuals / (n - 1) / n
+        return math.sqrt(variance) / mean_accesses
+
+    def tracked_entries(self):
+        return sum(len(stack) for stack in self.stacks.values())
+
+
+class ShardsProfiler:
+    """
+    Sampled miss ratio curve estimation for one level. Uses a fixed sampling rate or a fixed budget of sampled
+    sets per set count, and runs in memory bounded by the sample rather than by the trace.
+    """
+    def __init__(self, name, block_bits, max_sets, max_associativity=MAX_ASSOCIATIVITY, rate=None, budget=None):
+        self.name = name
+        self.block_bits = block_bits
+        self.block_size = 1 << block_bits
+        self.max_associativity = max_associativity
+        self.stacks = []
+        num_sets = 1
+        while num_sets <= max_sets:
+            self.stacks.append(SampledSetStacks(num_sets, max_associativity, rate=rate, budget=budget))
+            num_sets <<= 1
+
+    def access(self, address):
+        block = address >> self.block_bits
+        for stacks in self.stacks:
+            stacks.access(block)
+
+    def access_many(self, addresses):
+        blocks = [address >> self.block_bits for address in addresses]
+        for stacks in self.stacks:
+            stacks.access_many(blocks)
+
+    def miss_ratio_curves(self):
+        """
+        :return: dict of number of sets to a list of estimated miss ratios for associativity 1..max_associativity
+        """
+        return {stacks.num_sets: [stacks.miss_ratio(a) for a in range(1, self.max_associativity + 1)]
+                for stacks in self.stacks}
+
+    def error_estimates(self):
+        """
+        :return: dict of number of sets to a list of standard errors for associativity 1..max_associativity
+        """
+        return {stacks.num_sets: [stacks.standard_error(a) for a in range(1, self.max_associativity + 1)]
+                for stacks in self.stacks}
+
+    def tracked_entries(self):
+        return sum(stacks.tracked_entries() for stacks in self.stacks)
+
+    def format_curves(self):
+        """
+        Render the estimated curves with 95% confidence half widths as a fixed width table
+        :return: string
+        """
+        header = "sets   rate    " + " ".join(f"{'assoc ' + str(a):>17s}" for a in
+                                                range(1, self.max_associativity + 1))
+        print_str = f"{self.name} sampled miss ratio curves ({self.block_size} byte blocks, " \
+                    f"{self.tracked_entries()} tracked entries)\n"
+        print_str += header + "\n"
+        print_str += "-" * len(header) + "\n"
+        errors = self.error_estimates()
+        for stacks, (num_sets, ratios) in zip(self.stacks, self.miss_ratio_curves().items()):
+            cells = [f"{ratio:8.6f}+-{1.96 * error:7.5f}" for ratio, error in zip(ratios, errors[num_sets])]
+            print_str += f"{num_sets:<6d} {stacks.rate:<7.4f} " + " ".join(cells) + "\n"
+        return print_str
+
+
+def sample_trace(config, trace, rate=None, budget=None, max_associativity=MAX_ASSOCIATIVITY, batch_size=4096):
+    """
+    Estimate miss ratio curves for the DTLB (page granularity, virtual stream), DC, and L2 (configured line sizes,
+    physical stream) from a spatially hashed sample. Pass either a sampling rate or a per set count budget of
+    sampled sets, with neither every set is tracked.
+    :param config: Config
+    :param trace: trace file path
+    :return: dict of level name to ShardsProfiler
+    """
+    phys_bits = config.physical_address_bits
+    profilers = {}
+    if config.virtual_addresses and config.dtlb_enabled:
+        profilers["dtlb"] = ShardsProfiler(
+            "DTLB", config.bits.page_offset_bits,
+            _max_sets(MAX_DTLB_SETS, config.virtual_address_bits, config.bits.page_offset_bits),
+            max_associativity, rate=rate, budget=budget)
+    profilers["dc"] = ShardsProfiler(
+        "DC", config.bits.dc_offset_bits, _max_sets(MAX_DC_SETS, phys_bits, config.bits.dc_offset_bits),
+        max_associativity, rate=rate, budget=budget)
+    if config.l2_enabled:
+        profilers["l2"] = ShardsProfiler(
+            "L2", config.bits.l2_offset_bits, _max_sets(MAX_L2_SETS, phys_bits, config.bits.l2_offset_bits),
+            max_associativity, rate=rate, budget=budget)
+
+    front_end = TranslationFrontEnd(config) if config.virtual_addresses else None
+    for ops, addrs in TraceParser(trace, addr_bits=config.address_bits).iter_batches(batch_size):
+        if front_end is None:
+            physical = addrs
+        else:
+            _, physical, _ = front_end.translate_many(ops, addrs)
+        if "dtlb" in profilers:
+            profilers["dtlb"].access_many(addrs)
+        profilers["dc"].access_many(physical)
+        if "l2" in profilers:
+            profilers["l2"].access_many(physical)
+    return profilers
+
+
+def validate_against_simulator(config, trace, profilers):
+    """
+    Compare estimated miss ratios at the configured geometry with a full simulator run.
+    The DC and DTLB compare directly, the L2 estimate is compared with L2 read misses per reference, its global
+    miss ratio. Inclusion back invalidations, page evictions and write-through no-allocate are not modelled by
+    the curves, so those configs show a systematic gap on top of the sampling error.
+    :param config: Config
+    :param trace: trace file path
+    :param profilers: dict from sample_trace or profile_trace
+    :return: dict of level name to (simulated, estimated, standard error or None)
+    """
+    # imported here since the simulator pulls in the whole hierarchy
+    from mem_hierarchy.simulator import MemoryHierarchySimulator
+    simulator = MemoryHierarchySimulator(config)
+    simulator.simulate(trace, verbose=False)
+    stats = simulator.get_stats()
+    references = stats["reads"] + stats["writes"]
+    simulated = {"dc": (1 - stats["dc"]["hit rate"], config.dc.num_sets, config.dc.associativity)}
+    if "dtlb" in stats:
+        simulated["dtlb"] = (1 - stats["dtlb"]["hit rate"], config.dtlb.num_sets, config.dtlb.associativity)
+    if simulator.l2 is not None and references:
+        simulated["l2"] = (simulator.l2.cache.read_misses / references, config.l2.num_sets, config.l2.associativity)
+
+    comparison = {}
+    for level, (sim_ratio, num_sets, associativity) in simulated.items():
+        profiler = profilers.get(level)
+        if profiler is None:
+            continue
+        curves = profiler.miss_ratio_curves()
+        if num_sets not in curves or associativity > profiler.max_associativity:
+            continue
+        estimate = curves[num_sets][associativity - 1]
+        error = profiler.error_estimates()[num_sets][associativity - 1] \
+            if hasattr(profiler, "error_estimates") else None
+        comparison[level] = (sim_ratio, estimate, error)
+    return comparison
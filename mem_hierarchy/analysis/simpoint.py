@@ -0,0 +1,246 @@
+import json
+import random
+from collections import Counter
+from trace_parser import TraceParser
+from .sampled_simulation import LEVELS, _level_counts, run_lines, skip_lines
+
+# signature key of each access, from the trace address
+GRANULARITIES = ("block", "page")
+
+
+def _key_shift(config, granularity):
+    if granularity == "block":
+        return config.bits.dc_offset_bits
+    if granularity == "page":
+        return config.bits.page_offset_bits
+    raise ValueError(f"Unknown signature granularity: {granularity}")
+
+
+class RandomProjection:
+    """
+    Projects sparse access count vectors onto a few dimensions. Every key gets a fixed random direction derived
+    from the seed, so the full vector over all blocks or pages never has to be built.
+    """
+    def __init__(self, dimensions=15, seed=0):
+        self.dimensions = dimensions
+        self.seed = seed
+        self._directions = {}
+
+    def direction(self, key):
+        direction = self._directions.get(key)
+        if direction is None:
+            rng = random.Random(self.seed * 0x9E3779B1 + key)
+            direction = self._directions[key] = [rng.uniform(-1.0, 1.0) for _ in range(self.dimensions)]
+        return direction
+
+    def project(self, counts, total):
+        """
+        :param counts: Counter of key to accesses
+        :param total: accesses in the interval, the vector is normalized to frequencies
+        :return: list of floats
+        """
+        signature = [0.0] * self.dimensions
+        for key, count in counts.items():
+            weight = count / total
+            for d, value in enumerate(self.direction(key)):
+                signature[d] += weight * value
+        return signature
+
+
+def interval_signatures(config, trace, interval_size, granularity="block", dimensions=15, seed=0):
+    """
+    Split a trace into fixed size intervals and build a projected access vector for each
+    :param config: Config, gives the block and page sizes
+    :param trace: trace file path
+    :param interval_size: accesses per interval, the last interval may be shorter
+    :param granularity: "block" for DC lines or "page" for pages
+    :return: (list of signatures, list of interval lengths)
+    """
+    if interval_size < 1:
+        raise ValueError("Interval size must be at least 1.")
+    shift = _key_shift(config, granularity)
+    projection = RandomProjection(dimensions, seed)
+    signatures = []
+    lengths = []
+    counts = Counter()
+    length = 0
+    for _, address, _ in TraceParser(trace, addr_bits=config.address_bits):
+        counts[address >> shift] += 1
+        length += 1
+        if length == interval_size:
+            signatures.append(projection.project(counts, length))
+            lengths.append(length)
+            counts = Counter()
+            length = 0
+    if length:
+        signatures.append(projection.project(counts, length))
+        lengths.append(length)
+    return signatures, lengths
+
+
+def _distance(a, b):
+    return sum((x - y) ** 2 for x, y in zip(a, b))
+
+
+def kmeans(points, k, seed=0, iterations=100):
+    """
+    k-means with k-means++ seeding
+    :param points: list of equal length float lists
+    :return: (list of centroids, list of cluster labels per point)
+    """
+    rng = random.Random(seed)
+    k = min(k, len(points))
+    centroids = [list(rng.choice(points))]
+    nearest = [_distance(point, centroids[0]) for point in points]
+    while len(centroids) < k:
+        total = sum(nearest)
+        if total == 0:
+            # fewer distinct points than clusters
+            break
+        pick = rng.uniform(0, total)
+        for i, distance in enumerate(nearest):
+            pick -= distance
+            if pick <= 0:
+                break
+        centroids.append(list(points[i]))
+        nearest = [min(distance, _distance(point, centroids[-1])) for distance, point in zip(nearest, points)]
+    labels = None
+    for _ in range(iterations):
+        new_labels = [min(range(len(centroids)), key=lambda c: _distance(point, centroids[c])) for point in points]
+        if new_labels == labels:
+            break
+        labels = new_labels
+        for c in range(len(centroids)):
+            members = [point for point, label in zip(points, labels) if label == c]
+            if members:
+                centroids[c] = [sum(values) / len(members) for values in zip(*members)]
+    return centroids, labels
+
+
+class SimPoints:
+    """
+    Representative intervals of a trace and their weights, in the style of SimPoint. Intervals are clustered by
+    their access vectors and the interval closest to each centroid stands in for its cluster, weighted by the
+    fraction of the trace's accesses the cluster covers.
+    """
+    def __init__(self, interval_size, points, intervals, accesses):
+        """
+        :param interval_size: accesses per interval
+        :param points: list of (interval index, weight), in trace order
+        :param intervals: number of intervals in the trace
+        :param accesses: accesses in the trace
+        """
+        self.interval_size = interval_size
+        self.points = points
+        self.intervals = intervals
+        self.accesses = accesses
+
+    @classmethod
+    def analyze(cls, config, trace, interval_size=100000, k=10, granularity="block", dimensions=15, seed=0):
+        """
+        Pick the representative intervals of a trace
+        :param k: number of clusters, capped at the number of intervals
+        :return: SimPoints
+        """
+        if k < 1:
+            raise ValueError("Number of clusters must be at least 1.")
+        signatures, lengths = interval_signatures(config, trace, interval_size, granularity, dimensions, seed)
+        if not signatures:
+            return cls(interval_size, [], 0, 0)
+        centroids, labels = kmeans(signatures, k, seed)
+        total = sum(lengths)
+        points = []
+        for c, centroid in enumerate(centroids):
+            members = [i for i, label in enumerate(labels) if label == c]
+            if not members:
+                continue
+            representative = min(members, key=lambda i: _distance(signatures[i], centroid))
+            points.append((representative, sum(lengths[i] for i in members) / total))
+        return cls(interval_size, sorted(points), len(signatures), total)
+
+    def save(self, path):
+        with open(path, "w") as f:
+            json.dump({"interval size": self.interval_size, "intervals": self.intervals, "accesses": self.accesses,
+                       "points": [{"interval": index, "weight": weight} for index, weight in self.points]},
+                      f, indent=4)
+            f.write("\n")
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            data = json.load(f)
+        return cls(data["interval size"], [(point["interval"], point["weight"]) for point in data["points"]],
+                   data["intervals"], data["accesses"])
+
+    def format(self):
+        print_str = f"{len(self.points)} simulation points over {self.intervals} intervals of " \
+                    f"{self.interval_size} accesses\n"
+        for index, weight in self.points:
+            print_str += f"interval {index:<8d} starts at access {index * self.interval_size:<10d} weight {weight:.4f}\n"
+        return print_str
+
+
+def simulate_simpoints(config, trace, simpoints, warmup=0, batch_size=4096):
+    """
+    Simulate only the representative intervals, each after warmup accesses that are simulated but not measured,
+    and combine the per interval miss rates by their weights. Everything else is skipped without decoding, so
+    state left from the previous representative carries over into the warmup.
+    :param config: Config
+    :param trace: trace file path
+    :param simpoints: SimPoints
+    :param warmup: accesses simulated before each representative interval
+    :return: dict of weighted miss rates per level and run totals
+    """
+    if warmup < 0:
+        raise ValueError("Warmup must not be negative.")
+    # imported here since the simulator pulls in the whole hierarchy
+    from mem_hierarchy.simulator import MemoryHierarchySimulator
+    simulator = MemoryHierarchySimulator(config)
+    mask = (1 << config.address_bits) - 1
+    lines = TraceParser(trace, addr_bits=config.address_bits).iter_lines()
+    position = 0
+    simulated = 0
+    # per level: weighted miss rate sum, weight of the intervals that reached the level
+    weighted = {}
+    memory_refs = 0.0
+    for index, weight in simpoints.points:
+        start = index * simpoints.interval_size
+        warm_start = max(position, start - warmup)
+        skipped = skip_lines(lines, warm_start - position)
+        position += skipped
+        if position < warm_start:
+            break
+        consumed = run_lines(simulator, lines, start - warm_start, mask, batch_size)
+        position += consumed
+        simulated += consumed
+        before = _level_counts(simulator.get_stats())
+        memory_before = simulator.memory.reads + simulator.memory.writes
+        consumed = run_lines(simulator, lines, simpoints.interval_size, mask, batch_size)
+        position += consumed
+        simulated += consumed
+        if not consumed:
+            break
+        for level, (misses, accesses) in _level_counts(simulator.get_stats()).items():
+            interval_accesses = accesses - before[level][1]
+            if interval_accesses:
+                total, level_weight = weighted.get(level, (0.0, 0.0))
+                weighted[level] = (total + weight * (misses - before[level][0]) / interval_accesses,
+                                   level_weight + weight)
+        memory_refs += weight * (simulator.memory.reads + simulator.memory.writes - memory_before) / consumed
+    lines.close()
+    levels = {level: weighted[level][0] / weighted[level][1] for level in LEVELS if level in weighted}
+    return {"levels": levels, "memory refs per access": memory_refs, "points": len(simpoints.points),
+            "accesses simulated": simulated, "accesses": simpoints.accesses}
+
+
+def format_simpoint_estimates(estimates):
+    """
+    Render the weighted estimates of simulate_simpoints
+    :return: string
+    """
+    print_str = f"simulated {estimates['accesses simulated']} of {estimates['accesses']} accesses " \
+                f"over {estimates['points']} simulation points\n"
+    for level, miss_rate in estimates["levels"].items():
+        print_str += f"{level + ' miss rate':<21s}: {miss_rate:.6f}\n"
+    print_str += f"{'memory refs/access':<21s}: {estimates['memory refs per access']:.6f}\n"
+    return print_str
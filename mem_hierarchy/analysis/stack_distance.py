@@ -0,0 +1,239 @@
+from collections import Counter
+from trace_parser import TraceParser
+from mem_hierarchy.data_structures.mem_levels.translation_front_end import TranslationFrontEnd
+
+# largest set counts the config validation allows per level
+MAX_DC_SETS = 8192
+MAX_L2_SETS = 8192
+MAX_DTLB_SETS = 256
+MAX_ASSOCIATIVITY = 8
+
+
+class FenwickTree:
+    """
+    Growable binary indexed tree over access timestamps, used as the order statistic structure for stack distances
+    """
+    def __init__(self):
+        self.tree = [0]
+
+    def __len__(self):
+        return len(self.tree) - 1
+
+    def append(self, value):
+        """
+        Add a new position at the end of the tree
+        :param value: int value at the new position
+        :return: the 1-based position that was added
+        """
+        i = len(self.tree)
+        total = value
+        # node i covers (i - lowbit(i), i], fold in the child nodes below it
+        j = i - 1
+        stop = i - (i & -i)
+        while j > stop:
+            total += self.tree[j]
+            j -= j & -j
+        self.tree.append(total)
+        return i
+
+    def add(self, i, delta):
+        tree = self.tree
+        n = len(tree)
+        while i < n:
+            tree[i] += delta
+            i += i & -i
+
+    def prefix(self, i):
+        """
+        Sum of positions 1..i
+        """
+        tree = self.tree
+        total = 0
+        while i > 0:
+            total += tree[i]
+            i -= i & -i
+        return total
+
+    @classmethod
+    def of_ones(cls, n):
+        """
+        Build a tree with n positions all set to one in O(n)
+        """
+        fenwick = cls()
+        fenwick.tree = [0] + [i & -i for i in range(1, n + 1)]
+        return fenwick
+
+
+class SetStacks:
+    """
+    LRU stack distances for a single set count. Each set keeps its own timestamp line in a Fenwick tree with a
+    marker at the latest access of every block, so the distance of a re-reference is the number of markers after
+    the block's previous access.
+    """
+    def __init__(self, num_sets):
+        self.num_sets = num_sets
+        self._set_mask = num_sets - 1
+        self.trees = {}
+        self.last_seen = {}
+        self.histogram = Counter()
+        self.cold_misses = 0
+        self.accesses = 0
+
+    def _compact(self, index):
+        """
+        Renumber the timestamps of a set so its tree only holds the latest access of each block
+        """
+        seen = self.last_seen[index]
+        for position, block in enumerate(sorted(seen, key=seen.get), start=1):
+            seen[block] = position
+        self.trees[index] = FenwickTree.of_ones(len(seen))
+
+    def access(self, block):
+        """
+        Record an access to a block
+        :param block: int block number (address with the offset shifted out)
+        :return: the stack distance within the set, or None for a first reference
+        """
+        self.accesses += 1
+        index = block & self._set_mask
+        tree = self.trees.get(index)
+        if tree is None:
+            tree = self.trees[index] = FenwickTree()
+            seen = self.last_seen[index] = {}
+        else:
+            seen = self.last_seen[index]
+        previous = seen.get(block)
+        if previous is None:
+            distance = None
+            self.cold_misses += 1
+        else:
+            # markers after the previous access are the distinct blocks touched since
+            distance = len(seen) - tree.prefix(previous)
+            self.histogram[distance] += 1
+            tree.add(previous, -1)
+        seen[block] = tree.append(1)
+        # keep the tree bounded by the number of distinct blocks in the set
+        if len(tree) > 2 * len(seen) + 64:
+            self._compact(index)
+        return distance
+
+    def miss_ratio(self, associativity):
+        """
+        Miss ratio of an LRU cache with this many sets and the given associativity
+        """
+        if self.accesses == 0:
+            return 0
+        hits = sum(count for distance, count in self.histogram.items() if distance < associativity)
+        return 1 - hits / self.accesses
+
+
+class StackDistanceProfiler:
+    """
+    Single pass Mattson profiler for one level. Tracks the LRU stack distance of every reference for every power
+    of two set count at a fixed block size, so a whole set count by associativity grid comes out of one trace pass.
+    """
+    def __init__(self, name, block_bits, max_sets, max_associativity=MAX_ASSOCIATIVITY):
+        self.name = name
+        self.block_bits = block_bits
+        self.block_size = 1 << block_bits
+        self.max_associativity = max_associativity
+        self.stacks = []
+        num_sets = 1
+        while num_sets <= max_sets:
+            self.stacks.append(SetStacks(num_sets))
+            num_sets <<= 1
+
+    def access(self, address):
+        block = address >> self.block_bits
+        for stacks in self.stacks:
+            stacks.access(block)
+
+    def miss_ratio_curves(self):
+        """
+        Miss ratio for every set count and associativity
+        :return: dict of number of sets to a list of miss ratios for associativity 1..max_associativity
+        """
+        return {stacks.num_sets: [stacks.miss_ratio(a) for a in range(1, self.max_associativity + 1)]
+                for stacks in self.stacks}
+
+    def format_curves(self):
+        """
+        Render the curves as a fixed width table
+        :return: string
+        """
+        header = "sets   " + " ".join(f"{'assoc ' + str(a):>9s}" for a in range(1, self.max_associativity + 1))
+        print_str = f"{self.name} miss ratio curves ({self.block_size} byte blocks)\n"
+        print_str += header + "\n"
+        print_str += "-" * len(header) + "\n"
+        for num_sets, ratios in self.miss_ratio_curves().items():
+            print_str += f"{num_sets:<6d} " + " ".join(f"{ratio:9.6f}" for ratio in ratios) + "\n"
+        return print_str
+
+
+def _max_sets(limit, addr_bits, block_bits):
+    """
+    Largest power of two set count that still leaves a non negative tag for the given address width
+    """
+    index_bits = max(addr_bits - block_bits, 0)
+    return min(limit, 1 << index_bits)
+
+
+def build_profilers(config, max_associativity=MAX_ASSOCIATIVITY):
+    """
+    Build the profilers for every level the config enables, keyed by level name
+    :param config: Config
+    :return: dict of level name to StackDistanceProfiler
+    """
+    phys_bits = config.physical_address_bits
+    profilers = {}
+    if config.virtual_addresses and config.dtlb_enabled:
+        profilers["dtlb"] = StackDistanceProfiler(
+            "DTLB", config.bits.page_offset_bits,
+            _max_sets(MAX_DTLB_SETS, config.virtual_address_bits, config.bits.page_offset_bits), max_associativity)
+    profilers["dc"] = StackDistanceProfiler(
+        "DC", config.bits.dc_offset_bits, _max_sets(MAX_DC_SETS, phys_bits, config.bits.dc_offset_bits),
+        max_associativity)
+    if config.l2_enabled:
+        profilers["l2"] = StackDistanceProfiler(
+            "L2", config.bits.l2_offset_bits, _max_sets(MAX_L2_SETS, phys_bits, config.bits.l2_offset_bits),
+            max_associativity)
+    return profilers
+
+
+def iter_physical_trace(config, trace):
+    """
+    Stream (operation, virtual address, physical address) for a trace. The page table's LRU order depends on which
+    accesses hit in the DTLB, so the page table cannot run on its own. The data caches never change a translation,
+    so the DTLB and page table running together give the exact physical stream the caches see.
+    :param config: Config
+    :param trace: trace file path
+    :return: generator of tuples
+    """
+    front_end = TranslationFrontEnd(config) if config.virtual_addresses else None
+    for operation, address, _ in TraceParser(trace, addr_bits=config.address_bits):
+        if front_end is None:
+            yield operation, address, address
+        else:
+            yield operation, address, front_end.translate(operation, address)[0]
+
+
+def profile_trace(config, trace, max_associativity=MAX_ASSOCIATIVITY):
+    """
+    Compute miss ratio curves for the DTLB (page granularity, virtual stream), DC, and L2 (configured line sizes,
+    physical stream) in a single pass. Curves model LRU caches that allocate on every access, so they match
+    write-back/write-allocate levels; the L2 curve is its global miss ratio over the full reference stream.
+    :param config: Config
+    :param trace: trace file path
+    :return: dict of level name to StackDistanceProfiler
+    """
+    profilers = build_profilers(config, max_associativity)
+    dtlb = profilers.get("dtlb")
+    dc = profilers["dc"]
+    l2 = profilers.get("l2")
+    for _, virtual_address, physical_address in iter_physical_trace(config, trace):
+        if dtlb:
+            dtlb.access(virtual_address)
+        dc.access(physical_address)
+        if l2:
+            l2.access(physical_address)
+    return profilers
@@ -0,0 +1,285 @@
+import json
+import os
+import zlib
+from collections import Counter
+from mem_hierarchy.fused import _vm_signature, _index_signature
+from mem_hierarchy.sharded import CACHE_COUNTERS, LEVEL_COUNTERS
+from mem_hierarchy.data_structures.caches.data_cache import CacheEntry
+from mem_hierarchy.data_structures.caches.translation_cache import TranslationEntry
+from mem_hierarchy.protocols.prefetchers import PrefetchStats
+
+# bumped whenever the snapshot layout changes, older snapshots are refused
+CHECKPOINT_VERSION = 1
+_MAGIC = b"MHCK"
+# CacheCore counters the DTLB keeps, the data cache only ones are in CACHE_COUNTERS
+_TLB_COUNTERS = ("reads", "writes", "read_hits", "write_hits", "read_misses", "write_misses", "evictions")
+_PT_COUNTERS = ("hits", "misses", "accesses", "disk_references")
+
+
+def geometry_signature(config):
+    """
+    The config fields that shape the hierarchy's state. A snapshot restores into any config that agrees on these
+    and on the write policies.
+    """
+    signature = list(_vm_signature(config)) + [config.physical_address_bits, config.dc.num_sets,
+                                               config.dc.associativity, config.dc.line_size,
+                                               *_index_signature(config.dc)]
+    if config.l2_enabled:
+        signature += [config.l2.num_sets, config.l2.associativity, config.l2.line_size, *_index_signature(config.l2)]
+    return signature
+
+
+def write_policies(config):
+    """
+    Whether each data cache writes through. A write-back snapshot can hold dirty lines, which a write-through
+    cache never has, so snapshots only restore into the same write policies.
+    """
+    return [config.dc.policy, config.l2.policy if config.l2_enabled else None]
+
+
+def _ways_state(cache, state):
+    # skewed caches also need the way every line holds, set mapped ones leave their snapshot as it was
+    if cache.skewed:
+        state["ways"] = [[tag, frames.index(tag)] for frames, set_dict in zip(cache.ways, cache.sets)
+                         for tag in set_dict]
+    return state
+
+
+def _restore_ways(cache, state):
+    if cache.skewed:
+        ways = dict(state.get("ways", []))
+        for frames, set_dict in zip(cache.ways, cache.sets):
+            frames[:] = [None] * cache.associativity
+            for tag in set_dict:
+                frames[ways[tag]] = tag
+
+
+def _prefetch_state(level, state):
+    # prefetching levels also need the lines still waiting for their first use and the prefetcher's training
+    if level.prefetcher is not None:
+        state["prefetch"] = {"prefetcher": level.prefetcher.state(), "stats": level.prefetch_stats.state()}
+    return state
+
+
+def _restore_prefetch(level, state, counters):
+    if level.prefetcher is None:
+        return
+    prefetch = state.get("prefetch")
+    level.prefetcher.load_state(prefetch["prefetcher"] if prefetch else None)
+    pending = dict(prefetch["stats"]["pending"]) if prefetch else {}
+    for set_dict in level.cache.sets:
+        for entry in set_dict.values():
+            entry.prefetched = entry.address in pending
+    level.prefetch_stats = PrefetchStats()
+    if counters and prefetch:
+        level.prefetch_stats.load_state(prefetch["stats"])
+    else:
+        # the demand access clock starts over with the counters, leads count from the restore
+        level.prefetch_stats.pending = dict.fromkeys(pending, 0)
+
+
+def _write_buffer_state(level, state):
+    # buffered stores have not reached the level below yet, they drain after the restore
+    if level.write_buffer is not None:
+        state["write buffer"] = level.write_buffer.state()
+    return state
+
+
+def _data_cache_state(level):
+    cache = level.cache
+    return _write_buffer_state(level, _prefetch_state(level, _ways_state(cache, {
+        "mru counter": cache.mru_counter,
+        # per set, in recency order: tag, block address, dirty, inserted at, last used
+        "sets": [[[tag, entry.address, int(entry.dirty), entry.inserted_at, entry.last_used]
+                  for tag, entry in set_dict.items()] for set_dict in cache.sets],
+        "counters": {counter: getattr(cache, counter) for counter in CACHE_COUNTERS},
+        "dirty evictions per set": sorted(cache.dirty_evictions_per_set.items()),
+        "level counters": {counter: getattr(level, counter) for counter in LEVEL_COUNTERS},
+    })))
+
+
+def _restore_data_cache(level, state, counters):
+    cache = level.cache
+    cache.mru_counter = state["mru counter"]
+    for index, (set_dict, entries) in enumerate(zip(cache.sets, state["sets"])):
+        set_dict.clear()
+        for tag, address, dirty, inserted_at, last_used in entries:
+            entry = CacheEntry(tag, index, address, inserted_at, dirty=bool(dirty))
+            entry.last_used = last_used
+            set_dict[tag] = entry
+    _restore_ways(cache, state)
+    _restore_prefetch(level, state, counters)
+    if level.write_buffer is not None:
+        level.write_buffer.load_state(state.get("write buffer"), counters)
+    if counters:
+        for counter, value in state["counters"].items():
+            setattr(cache, counter, value)
+        cache.dirty_evictions_per_set = Counter(dict(state["dirty evictions per set"]))
+        for counter, value in state["level counters"].items():
+            setattr(level, counter, value)
+
+
+def _dtlb_state(level):
+    cache = level.dtlb_cache
+    return _ways_state(cache, {
+        "mru counter": cache.mru_counter,
+        # per set, in recency order: tag, ppn, inserted at, last used
+        "sets": [[[tag, entry.ppn, entry.inserted_at, entry.last_used] for tag, entry in set_dict.items()]
+                 for set_dict in cache.sets],
+        "counters": {counter: getattr(cache, counter) for counter in _TLB_COUNTERS},
+    })
+
+
+def _restore_dtlb(level, state, counters):
+    cache = level.dtlb_cache
+    cache.mru_counter = state["mru counter"]
+    for set_dict, entries in zip(cache.sets, state["sets"]):
+        set_dict.clear()
+        for tag, ppn, inserted_at, last_used in entries:
+            entry = TranslationEntry(ppn, inserted_at)
+            entry.last_used = last_used
+            set_dict[tag] = entry
+    _restore_ways(cache, state)
+    if counters:
+        for counter, value in state["counters"].items():
+            setattr(cache, counter, value)
+
+
+def _page_table_state(level):
+    page_table = level.page_table
+    return {
+        "mappings": sorted(page_table.vpn_to_ppn.items()),
+        "free ppns": page_table.free_ppns,
+        "lru ppns": page_table.lru_ppns,
+        "counters": {counter: getattr(page_table, counter) for counter in _PT_COUNTERS},
+    }
+
+
+def _restore_page_table(level, state, counters):
+    page_table = level.page_table
+    page_table.vpn_to_ppn = {vpn: ppn for vpn, ppn in state["mappings"]}
+    page_table.ppn_to_vpn = {ppn: vpn for vpn, ppn in state["mappings"]}
+    page_table.free_ppns = list(state["free ppns"])
+    page_table.lru_ppns = list(state["lru ppns"])
+    if counters:
+        for counter, value in state["counters"].items():
+            setattr(page_table, counter, value)
+
+
+def snapshot(simulator, trace_position=None):
+    """
+    Capture the full state of a simulator: cache contents with dirty and recency state, DTLB entries, page table
+    mappings and LRU order, every counter, and how far into the trace the run is
+    :param simulator: MemoryHierarchySimulator
+    :param trace_position: accesses of the trace already simulated, defaults to the simulator's reads plus writes
+    :return: dict of plain data
+    """
+    if trace_position is None:
+        trace_position = simulator.reads + simulator.writes
+    state = {
+        "version": CHECKPOINT_VERSION,
+        "geometry": geometry_signature(simulator.config),
+        "write policies": write_policies(simulator.config),
+        "trace position": trace_position,
+        "reads": simulator.reads,
+        "writes": simulator.writes,
+        "memory": {"reads": simulator.memory.reads, "writes": simulator.memory.writes,
+                   "prefetch reads": simulator.memory.prefetch_reads,
+                   "by origin": dict(simulator.memory.by_origin)},
+        "dc": _data_cache_state(simulator.dc),
+        "l2": _data_cache_state(simulator.l2) if simulator.l2 else None,
+        "dtlb": _dtlb_state(simulator.dtlb) if simulator.dtlb else None,
+        "page table": _page_table_state(simulator.pt) if simulator.pt else None,
+    }
+    return state
+
+
+def restore(simulator, state, counters=True):
+    """
+    Load a snapshot into a simulator built from a config with the same geometry
+    :param simulator: MemoryHierarchySimulator
+    :param state: dict from snapshot
+    :param counters: restore the stats too, False starts them from zero on the restored (warm) state
+    :return: the trace position stored in the snapshot
+    """
+    if state.get("version") != CHECKPOINT_VERSION:
+        raise ValueError(f"Checkpoint version {state.get('version')} is not supported, "
+                         f"expected {CHECKPOINT_VERSION}.")
+    if state["geometry"] != geometry_signature(simulator.config):
+        raise ValueError("Checkpoint was taken from a hierarchy with a different geometry.")
+    if state.get("write policies", write_policies(simulator.config)) != write_policies(simulator.config):
+        raise ValueError("Checkpoint was taken from a hierarchy with different write policies.")
+    _restore_data_cache(simulator.dc, state["dc"], counters)
+    if simulator.l2:
+        _restore_data_cache(simulator.l2, state["l2"], counters)
+    if simulator.dtlb:
+        _restore_dtlb(simulator.dtlb, state["dtlb"], counters)
+    if simulator.pt:
+        _restore_page_table(simulator.pt, state["page table"], counters)
+    if counters:
+        simulator.reads = state["reads"]
+        simulator.writes = state["writes"]
+        simulator.memory.reads = state["memory"]["reads"]
+        simulator.memory.writes = state["memory"]["writes"]
+        simulator.memory.prefetch_reads = state["memory"].get("prefetch reads", 0)
+        simulator.memory.by_origin.clear()
+        simulator.memory.by_origin.update(state["memory"]["by origin"])
+    return state["trace position"]
+
+
+def empty_state(simulator):
+    """
+    The state of a freshly built hierarchy, for restoring a simulator back to the start without rebuilding it
+    :param simulator: MemoryHierarchySimulator
+    :return: dict for restore
+    """
+    def cache_state(cache, counters, level_counters=None):
+        state = {"mru counter": 0, "sets": [[] for _ in range(cache.num_sets)],
+                 "counters": {counter: 0 for counter in counters}}
+        if level_counters is not None:
+            state["dirty evictions per set"] = []
+            state["level counters"] = {counter: 0 for counter in level_counters}
+        return state
+
+    state = {
+        "version": CHECKPOINT_VERSION,
+        "geometry": geometry_signature(simulator.config),
+        "write policies": write_policies(simulator.config),
+        "trace position": 0,
+        "reads": 0,
+        "writes": 0,
+        "memory": {"reads": 0, "writes": 0, "by origin": {}},
+        "dc": cache_state(simulator.dc.cache, CACHE_COUNTERS, LEVEL_COUNTERS),
+        "l2": cache_state(simulator.l2.cache, CACHE_COUNTERS, LEVEL_COUNTERS) if simulator.l2 else None,
+        "dtlb": cache_state(simulator.dtlb.dtlb_cache, _TLB_COUNTERS) if simulator.dtlb else None,
+        "page table": None,
+    }
+    if simulator.pt:
+        state["page table"] = {"mappings": [], "free ppns": list(range(simulator.pt.page_table.n_physical_pages)),
+                               "lru ppns": [], "counters": {counter: 0 for counter in _PT_COUNTERS}}
+    return state
+
+
+def save_checkpoint(simulator, path, trace_position=None):
+    """
+    Write a compressed snapshot. The file is replaced atomically, so a crash mid write keeps the previous one.
+    :return: None
+    """
+    data = _MAGIC + zlib.compress(json.dumps(snapshot(simulator, trace_position),
+                                             separators=(",", ":")).encode())
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    """
+    Read a snapshot written by save_checkpoint
+    :return: dict for restore
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(_MAGIC):
+        raise ValueError(f"{path} is not a checkpoint file.")
+    return json.loads(zlib.decompress(data[len(_MAGIC):]))
@@ -0,0 +1,215 @@
+import json
+import math
+import os
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from config import Config
+from mem_hierarchy.simulator import MemoryHierarchySimulator
+from mem_hierarchy.analysis.sampled_simulation import run_lines
+
+# built hierarchies each worker keeps around for reuse, least recently used are dropped
+HIERARCHIES_PER_WORKER = 8
+# line that ends a streamed trace
+END_OF_STREAM = "END"
+BATCH_SIZE = 4096
+
+# per worker process state
+_worker_hierarchies = OrderedDict()
+
+
+def _warm_worker():
+    """
+    Runs once in each worker so the first job does not pay for the imports
+    """
+    return os.getpid()
+
+
+def _hierarchy(config_text):
+    """
+    A hierarchy for this config, reset to a cold start when one was built by an earlier job
+    """
+    simulator = _worker_hierarchies.pop(config_text, None)
+    if simulator is None:
+        simulator = MemoryHierarchySimulator(Config.from_config_text(config_text))
+    else:
+        simulator.reset()
+    _worker_hierarchies[config_text] = simulator
+    while len(_worker_hierarchies) > HIERARCHIES_PER_WORKER:
+        _worker_hierarchies.popitem(last=False)
+    return simulator
+
+
+def _run_job(config_text, trace=None, trace_text=None):
+    """
+    Simulate one job in a worker process
+    :return: the pprint_stats dict
+    """
+    simulator = _hierarchy(config_text)
+    if trace is not None:
+        return simulator.simulate(trace, verbose=False, batch_size=BATCH_SIZE)
+    mask = (1 << simulator.config.address_bits) - 1
+    run_lines(simulator, iter(trace_text.splitlines()), math.inf, mask, BATCH_SIZE)
+    return simulator.finish()
+
+
+class _Handler(socketserver.StreamRequestHandler):
+    """
+    One client connection. Each request is a JSON line answered by a JSON line, a connection may send several.
+    """
+    def handle(self):
+        for raw in self.rfile:
+            if not raw.strip():
+                continue
+            try:
+                request = json.loads(raw)
+                response = self.server.daemon.dispatch(request, self.rfile)
+            except Exception as e:
+                response = {"ok": False, "error": f"{type(e).__name__}: {e}"}
+            self.wfile.write(json.dumps(response).encode() + b"\n")
+            self.wfile.flush()
+            if response.get("shutdown"):
+                threading.Thread(target=self.server.shutdown, daemon=True).start()
+                return
+
+
+class _Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+class SimulatorDaemon:
+    """
+    Long lived simulator service on a Unix domain socket. A pool of worker processes is started and warmed up
+    front, each keeps the hierarchies it built and resets them for later jobs with the same config, and every
+    connection is served on its own thread so jobs from different clients run on different workers at once.
+
+    Requests are JSON lines:
+        {"config": <config file text>, "trace": <trace path>}
+        {"config": <config file text>, "trace_text": <trace lines>}
+        {"config": <config file text>, "stream": true} followed by trace lines and a line reading END
+        {"command": "ping"} or {"command": "shutdown"}
+    and each is answered with {"ok": true, "stats": <pprint_stats dict>} or {"ok": false, "error": <message>}.
+    """
+    def __init__(self, path, workers=None):
+        self.path = path
+        self.workers = workers or os.cpu_count() or 1
+        self.pool = None
+        self.server = None
+        self.jobs = 0
+
+    def dispatch(self, request, rfile):
+        """
+        Handle one decoded request
+        :param rfile: the connection, read further for streamed traces
+        :return: response dict
+        """
+        command = request.get("command")
+        if command == "ping":
+            return {"ok": True, "workers": self.workers, "jobs": self.jobs}
+        if command == "shutdown":
+            return {"ok": True, "shutdown": True}
+        if command is not None:
+            raise ValueError(f"Unknown command: {command}")
+        config_text = request.get("config")
+        if config_text is None:
+            raise ValueError("Request needs a config.")
+        # parse here so a bad config is reported without occupying a worker
+        Config.from_config_text(config_text)
+        if request.get("stream"):
+            lines = []
+            for raw in rfile:
+                line = raw.decode()
+                if line.strip() == END_OF_STREAM:
+                    break
+                lines.append(line)
+            future = self.pool.submit(_run_job, config_text, trace_text="".join(lines))
+        elif "trace_text" in request:
+            future = self.pool.submit(_run_job, config_text, trace_text=request["trace_text"])
+        elif "trace" in request:
+            if not os.path.exists(request["trace"]):
+                raise ValueError(f"trace file not found: {request['trace']}")
+            future = self.pool.submit(_run_job, config_text, trace=request["trace"])
+        else:
+            raise ValueError("Request needs a trace, trace_text, or stream.")
+        stats = future.result()
+        self.jobs += 1
+        return {"ok": True, "stats": stats}
+
+    def serve_forever(self):
+        """
+        Start the workers and serve until a shutdown request, then clean up the socket
+        :return: None
+        """
+        if os.path.exists(self.path):
+            os.unlink(self.path)
+        self.pool = ProcessPoolExecutor(max_workers=self.workers)
+        try:
+            # start every worker now, the pool only spawns them on demand
+            for future in [self.pool.submit(_warm_worker) for _ in range(self.workers)]:
+                future.result()
+            self.server = _Server(self.path, _Handler)
+            self.server.daemon = self
+            with self.server:
+                self.server.serve_forever()
+        finally:
+            self.pool.shutdown(cancel_futures=True)
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+
+
+class DaemonClient:
+    """
+    Connection to a SimulatorDaemon
+    """
+    def __init__(self, path):
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile("rb")
+
+    def _request(self, request, stream=None):
+        data = json.dumps(request).encode() + b"\n"
+        if stream is not None:
+            data += b"".join(line.encode() if line.endswith("\n") else (line + "\n").encode() for line in stream)
+            data += (END_OF_STREAM + "\n").encode()
+        self.sock.sendall(data)
+        response = json.loads(self.rfile.readline())
+        if not response["ok"]:
+            raise ValueError(response["error"])
+        return response
+
+    def simulate(self, config_text, trace=None, trace_text=None, stream=None):
+        """
+        Run one job
+        :param config_text: config file contents
+        :param trace: trace file path the daemon can read
+        :param trace_text: trace contents
+        :param stream: iterable of trace lines sent after the request
+        :return: the pprint_stats dict
+        """
+        if trace is not None:
+            request = {"config": config_text, "trace": os.path.abspath(trace)}
+        elif trace_text is not None:
+            request = {"config": config_text, "trace_text": trace_text}
+        elif stream is not None:
+            request = {"config": config_text, "stream": True}
+        else:
+            raise ValueError("Give a trace, trace_text, or stream.")
+        return self._request(request, stream)["stats"]
+
+    def ping(self):
+        return self._request({"command": "ping"})
+
+    def shutdown(self):
+        return self._request({"command": "shutdown"})
+
+    def close(self):
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
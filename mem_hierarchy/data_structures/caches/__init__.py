@@ -1,4 +1,5 @@
 from .data_cache import DCCache, L2Cache
 from .translation_cache import DTLB
+from .write_buffer import WriteBuffer
 
-__all__ = ['DCCache', 'L2Cache', 'DTLB']
\ No newline at end of file
+__all__ = ['DCCache', 'L2Cache', 'DTLB', 'WriteBuffer']
\ No newline at end of file
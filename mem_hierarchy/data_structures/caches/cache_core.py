@@ -1,14 +1,19 @@
 from collections import OrderedDict
 from mem_hierarchy.data_structures.result_structures.access_results import AccessResult
+from .indexing import make_index_function
 import copy
 import pprint
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, batched address decomposition falls back to pure python
+    np = None
 
 class CacheCore:
     """
     A class representing a generic cache, can be inherited by specific cache types
     """
     def __init__(self, name, num_sets, associativity, tag_bits, index_bits, *, offset_bits=0, phys_bits=None,
-                 ppn_bits=None, page_offset_bits=None, policy=None, line_size=None,):
+                 ppn_bits=None, page_offset_bits=None, policy=None, line_size=None, index_function="modulo"):
         self.name = name
         self.num_sets = num_sets
         self.associativity = associativity
@@ -30,6 +35,15 @@ class CacheCore:
         self.sets = [OrderedDict() for _ in range(self.num_sets)]
         self.policy = policy
         self.line_size = line_size
+        # optional ReplacementPolicy overriding LRU victim choice
+        self.replacement = None
+
+        # set index function, None for plain modulo bit slicing
+        self.indexing = index_function
+        self.index_function = make_index_function(index_function, num_sets, index_bits, associativity)
+        self.skewed = index_function == "skewed"
+        # skewed only: block number held in each way of each set, None for an empty frame
+        self.ways = [[None] * associativity for _ in range(self.num_sets)] if self.skewed else None
 
         # stats
         self.reads = self.writes = 0
@@ -55,11 +69,118 @@ class CacheCore:
         :param address: int
         :return: integer tag, index, and offset
         """
+        if self.index_function is not None:
+            tag, index = self._split(address >> self.offset_bits)
+            return tag, index, address & self._offset_mask
         offset = address & self._offset_mask
         index = (address >> self.offset_bits) & self._index_mask
         tag = address >> (self.index_bits + self.offset_bits)
         return tag, index, offset
 
+    def decompose_many(self, addresses):
+        """
+        Parse a whole batch of addresses into block base, tag, and index columns at once
+        :param addresses: sequence of int addresses
+        :return: lists of integer block bases, tags, and indices
+        """
+        tag_shift = self.index_bits + self.offset_bits
+        if self.index_function is not None:
+            # skewed caches get the way 0 index, touch finds the set a line actually sits in
+            if np is None:
+                blocks = [address & ~self._offset_mask for address in addresses]
+                tags, indices = self.index_function.split_many([block >> self.offset_bits for block in blocks])
+                return blocks, tags, indices
+            blocks = np.asarray(addresses, dtype=np.int64) & ~self._offset_mask
+            tags, indices = self.index_function.split_many(blocks >> self.offset_bits)
+            return blocks.tolist(), tags, indices
+        if np is None:
+            blocks = [address & ~self._offset_mask for address in addresses]
+            tags = [block >> tag_shift for block in blocks]
+            indices = [(block >> self.offset_bits) & self._index_mask for block in blocks]
+            return blocks, tags, indices
+        addrs = np.asarray(addresses, dtype=np.int64)
+        blocks = addrs & ~self._offset_mask
+        tags = blocks >> tag_shift
+        indices = (blocks >> self.offset_bits) & self._index_mask
+        return blocks.tolist(), tags.tolist(), indices.tolist()
+
+    def _split(self, number):
+        """
+        Tag and index of a block number under a hashed index function
+        """
+        if self.skewed:
+            return number, self._skewed_frame(number)[0]
+        return self.index_function.split(number)
+
+    def _resident_set(self, number):
+        """
+        Set a skewed cache holds a block number in, or None when it is not resident
+        """
+        for way, index in enumerate(self.index_function.candidates(number)):
+            if self.ways[index][way] == number:
+                return index
+        return None
+
+    def _skewed_frame(self, number):
+        """
+        (set, way) of a skewed cache holding a block number, or the one a fill of it takes: the first empty
+        candidate frame, else the least recently used line over every way's candidate
+        """
+        candidates = self.index_function.candidates(number)
+        for way, index in enumerate(candidates):
+            if self.ways[index][way] == number:
+                return index, way
+        victim = None
+        for way, index in enumerate(candidates):
+            occupant = self.ways[index][way]
+            if occupant is None:
+                return index, way
+            entry = self.sets[index][occupant]
+            recency = (entry.last_used, entry.inserted_at)
+            if victim is None or recency < victim[0]:
+                victim = recency, index, way
+        return victim[1], victim[2]
+
+    def set_of(self, address):
+        """
+        Set index of the line an address falls in. Skewed caches report the set a resident line sits in, or the
+        one a fill of it would take, so callers that just evicted or invalidated a line pass its set on instead.
+        :param address: int
+        :return: integer index
+        """
+        return self.parse_address(self._block_base(address))[1]
+
+    def remove(self, index, tag):
+        """
+        Drop a resident line from its set, freeing its frame in a skewed cache
+        :param index: integer set index
+        :param tag: integer tag
+        :return: the removed entry
+        """
+        if self.skewed:
+            frames = self.ways[index]
+            frames[frames.index(tag)] = None
+        return self.sets[index].pop(tag)
+
+    def touch(self, index, tag):
+        """
+        Bump an already parsed entry to most recently used if it is present
+        :param index: integer set index
+        :param tag: integer tag
+        :return: the cache entry, or None if not present
+        """
+        if self.skewed:
+            index = self._resident_set(tag)
+            if index is None:
+                return None
+        set_dict = self.sets[index]
+        entry = set_dict.get(tag)
+        if entry is not None:
+            self.mru_counter += 1
+            entry.last_used = self.mru_counter
+            set_dict.move_to_end(tag)
+        return entry
+
     #@staticmethod
     def get_update_mru_new(self, index, tag):
         """
@@ -97,6 +218,8 @@ class CacheCore:
         return cache_entry
 
     def choose_victim(self, index):
+        if self.replacement is not None:
+            return self.replacement.choose_victim(self, index)
         set_dict = self.sets[index]
         # LRU with stable tie-break on insertion time
         victim_tag, victim_entry = min(
@@ -113,6 +236,12 @@ class CacheCore:
         """
         tag, index, _ = self.parse_address(self._block_base(address))
         set_dict = self.sets[index]
+        if self.skewed:
+            # a skewed fill takes the frame _skewed_frame picks and replaces whatever holds it
+            index, way = self._skewed_frame(tag)
+            occupant = self.ways[index][way]
+            self.ways[index][way] = tag
+            return None if occupant is None else set_dict.pop(occupant)
         if len(set_dict) < self.associativity:
             return None
         victim_tag, victim_entry = self.choose_victim(index)
@@ -187,7 +316,7 @@ class CacheCore:
         """
         tag, index, offset = self.parse_address(address)
         if tag in self.sets[index]:
-            self.sets[index].pop(tag)
+            self.remove(index, tag)
             return True
         return False
 
@@ -211,7 +340,7 @@ class CacheCore:
         """
         shift = self.phys_bits - self.ppn_bits
         entries = []
-        for set_dict in self.sets:
+        for index, set_dict in enumerate(self.sets):
             tags_to_invalidate = []
             for tag, entry in set_dict.items():
                 physical_address = self._coerce_addr(entry.address) & self._phys_mask
@@ -220,7 +349,7 @@ class CacheCore:
                     tags_to_invalidate.append(tag)
                     entries.append(entry)
             for tag in tags_to_invalidate:
-                set_dict.pop(tag)
+                self.remove(index, tag)
         return entries
 
     def get_stats(self):
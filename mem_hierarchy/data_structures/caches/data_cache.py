@@ -7,13 +7,15 @@ class CacheEntry:
     """
     Represents a single cache entry in a data cache.
     """
-    def __init__(self, tag, index, address, inserted_at, dirty=False):
+    def __init__(self, tag, index, address, inserted_at, dirty=False, prefetched=False):
         self.tag = tag
         self.index = index
         self.address = address
         self.dirty = dirty
         self.inserted_at = inserted_at
         self.last_used = inserted_at
+        # filled by a prefetch and not used by a demand access since
+        self.prefetched = prefetched
 
     def mark_dirty(self):
         """
@@ -36,7 +38,7 @@ class DataCache(CacheCore):
     Wrapper around CacheCore for data caches (DC, L2, other future caches)
     """
     def __init__(self, name, num_sets, associativity, tag_bits, index_bits, *, offset_bits, phys_bits, ppn_bits,
-                 page_offset_bits, policy=None, line_size):
+                 page_offset_bits, policy=None, line_size, index_function="modulo"):
         self.alloc_on_write_miss = 0
         self.writebacks_during_run = 0
         self.l2_lower_R_calls = 0  # number of times L2 calls its lower level with "R"
@@ -46,7 +48,7 @@ class DataCache(CacheCore):
         self.dirty_evictions_per_set = collections.Counter()
         super().__init__(name, num_sets, associativity, tag_bits, index_bits, offset_bits=offset_bits,
                          phys_bits=phys_bits, ppn_bits=ppn_bits, page_offset_bits=page_offset_bits, policy=policy,
-                         line_size=line_size)
+                         line_size=line_size, index_function=index_function)
 
     # def get_update_mru_new(self, index, tag):
     #     """
@@ -108,19 +110,20 @@ class DataCache(CacheCore):
         #     return evicted
         # return None
 
-    def back_fill(self, operation, address, dirty=False):
+    def back_fill(self, operation, address, dirty=False, prefetched=False):
         """
         Fills the cache with a new entry for the given address, possibly evicting from the relevant set.
         :param operation: string "R" or "W"
         :param address: binary string address
         :param dirty: bool indicating if the new entry should be marked dirty
+        :param prefetched: bool indicating if the fill is a prefetch rather than a demand miss
         :return: AccessResult indicating the result of the back fill operation
         """
         base = self._block_base(address)  # <— add
         tag, index, offset = self.parse_address(base)  # (now parse the base)
         evicted = self.possibly_evict(base)
         self.mru_counter += 1
-        cache_entry = CacheEntry(tag, index, base, self.mru_counter, dirty=False)
+        cache_entry = CacheEntry(tag, index, base, self.mru_counter, dirty=False, prefetched=prefetched)
         if dirty and operation == "W":
             cache_entry.mark_dirty()
         if operation == "R":
@@ -156,7 +159,7 @@ class DCCache(DataCache):
         phys_bits = ppn_bits + page_offset_bits
         super().__init__("DC", num_sets, associativity, tag_bits, index_bits, offset_bits=offset_bits,
                          phys_bits=phys_bits, ppn_bits=ppn_bits, page_offset_bits=page_offset_bits, policy=policy,
-                         line_size=line_size)
+                         line_size=line_size, index_function=config.dc.index_function)
 
 class L2Cache(DataCache):
     """
@@ -175,4 +178,4 @@ class L2Cache(DataCache):
         phys_bits = ppn_bits + page_offset_bits
         super().__init__("L2", num_sets, associativity, tag_bits, index_bits, offset_bits=offset_bits,
                          phys_bits=phys_bits, ppn_bits=ppn_bits, page_offset_bits=page_offset_bits, policy=policy,
-                         line_size=line_size)
\ No newline at end of file
+                         line_size=line_size, index_function=config.l2.index_function)
\ No newline at end of file
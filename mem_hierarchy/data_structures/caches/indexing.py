@@ -0,0 +1,179 @@
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, batched indexing falls back to pure python
+    np = None
+
+
+def _fold(tag, index_bits, index_mask):
+    """
+    XOR every index wide chunk of a tag together
+    """
+    folded = 0
+    while tag:
+        folded ^= tag & index_mask
+        tag >>= index_bits
+    return folded
+
+
+def _fold_many(tags, index_bits, index_mask):
+    folded = np.zeros_like(tags)
+    tags = tags.copy()
+    while tags.any():
+        folded ^= tags & index_mask
+        tags >>= index_bits
+    return folded
+
+
+class XorIndex:
+    """
+    XOR folded indexing: the index bits of a block number XOR every index wide chunk of the bits above them. The
+    tag is the same upper bits as with modulo indexing, and since the fold only depends on the tag the block
+    number is recovered from the tag and index.
+    """
+    name = "xor"
+
+    def __init__(self, num_sets, index_bits):
+        self.num_sets = num_sets
+        self.index_bits = index_bits
+        self._index_mask = (1 << index_bits) - 1
+
+    def split(self, number):
+        """
+        :param number: block number (address without its offset bits), or VPN for the DTLB
+        :return: integer tag and index
+        """
+        if not self.index_bits:
+            return number, 0
+        tag = number >> self.index_bits
+        return tag, (number ^ _fold(tag, self.index_bits, self._index_mask)) & self._index_mask
+
+    def split_many(self, numbers):
+        """
+        :param numbers: sequence of block numbers
+        :return: lists of integer tags and indices
+        """
+        if not self.index_bits:
+            return list(numbers), [0] * len(numbers)
+        if np is None:
+            tags, indices = [], []
+            for number in numbers:
+                tag, index = self.split(number)
+                tags.append(tag)
+                indices.append(index)
+            return tags, indices
+        numbers = np.asarray(numbers, dtype=np.int64)
+        tags = numbers >> self.index_bits
+        indices = (numbers ^ _fold_many(tags, self.index_bits, self._index_mask)) & self._index_mask
+        return tags.tolist(), indices.tolist()
+
+    def join(self, tag, index):
+        """
+        :return: the block number a tag and index came from
+        """
+        if not self.index_bits:
+            return tag
+        return (tag << self.index_bits) | ((index ^ _fold(tag, self.index_bits, self._index_mask)) & self._index_mask)
+
+
+class PrimeIndex:
+    """
+    Prime modulo indexing: the index is the block number modulo the largest prime no larger than the number of
+    sets, the tag is the quotient. Sets from that prime up stay unused, the capacity real prime indexed caches
+    give up for spreading power of two strides over every set they do use.
+    """
+    name = "prime"
+
+    def __init__(self, num_sets, index_bits):
+        self.num_sets = num_sets
+        self.index_bits = index_bits
+        self.prime = largest_prime(num_sets)
+
+    def split(self, number):
+        return divmod(number, self.prime)
+
+    def split_many(self, numbers):
+        if np is None:
+            tags, indices = [], []
+            for number in numbers:
+                tags.append(number // self.prime)
+                indices.append(number % self.prime)
+            return tags, indices
+        numbers = np.asarray(numbers, dtype=np.int64)
+        return (numbers // self.prime).tolist(), (numbers % self.prime).tolist()
+
+    def join(self, tag, index):
+        return tag * self.prime + index
+
+
+class SkewedIndex:
+    """
+    Skewed associative indexing (Seznec): every way has its own index function, so blocks that conflict in one way
+    are spread over different sets in the others. Way w indexes with the index bits XOR the folded tag rotated w
+    bits left within the index field, way 0 is plain XOR folding. A block can live in set index(block, w) of any
+    way w, so a skewed cache tags its lines with the whole block number and tracks the way each one occupies.
+    """
+    name = "skewed"
+
+    def __init__(self, num_sets, index_bits, ways):
+        self.num_sets = num_sets
+        self.index_bits = index_bits
+        self.ways = ways
+        self._index_mask = (1 << index_bits) - 1
+
+    def _rotate(self, value, amount):
+        amount %= self.index_bits
+        return ((value << amount) | (value >> (self.index_bits - amount))) & self._index_mask
+
+    def candidates(self, number):
+        """
+        :param number: block number
+        :return: list of the set index of each way
+        """
+        if not self.index_bits:
+            return [0] * self.ways
+        low = number & self._index_mask
+        folded = _fold(number >> self.index_bits, self.index_bits, self._index_mask)
+        return [low ^ self._rotate(folded, way) for way in range(self.ways)]
+
+    def split(self, number):
+        """
+        :return: the block number as tag, and the way 0 index
+        """
+        return number, self.candidates(number)[0]
+
+    def split_many(self, numbers):
+        numbers = list(numbers)
+        return numbers, [self.candidates(number)[0] for number in numbers]
+
+    def join(self, tag, index):
+        return tag
+
+
+def largest_prime(n):
+    """
+    :return: the largest prime no larger than n, or 1 when there is none
+    """
+    for candidate in range(n, 1, -1):
+        if all(candidate % divisor for divisor in range(2, int(candidate ** 0.5) + 1)):
+            return candidate
+    return 1
+
+
+def make_index_function(name, num_sets, index_bits, ways):
+    """
+    Build a level's index function
+    :param name: "modulo", "xor", "prime", or "skewed"
+    :param num_sets: sets of the level
+    :param index_bits: bits of the plain modulo index
+    :param ways: associativity of the level
+    :return: index function object, or None for modulo, which CacheCore slices inline
+    """
+    if name == "modulo":
+        return None
+    if name == "xor":
+        return XorIndex(num_sets, index_bits)
+    if name == "prime":
+        return PrimeIndex(num_sets, index_bits)
+    if name == "skewed":
+        return SkewedIndex(num_sets, index_bits, ways)
+    raise ValueError(f"Unknown index function: {name}")
@@ -1,4 +1,4 @@
-from .cache_core import CacheCore
+from .cache_core import CacheCore, np
 from mem_hierarchy.data_structures.result_structures.access_results import AccessResult
 #from collections import OrderedDict
 
@@ -9,10 +9,11 @@ class TranslationEntry:
         self.last_used = insertes_at
 
 class TranslationCache(CacheCore):
-    def __init__(self, name, ppn_bits, num_sets, associativity, dtlb_tag_bits, dtlb_index_bits, page_offset_bits):
+    def __init__(self, name, ppn_bits, num_sets, associativity, dtlb_tag_bits, dtlb_index_bits, page_offset_bits,
+                 index_function="modulo"):
         super().__init__(name, num_sets, associativity, dtlb_tag_bits, dtlb_index_bits, offset_bits=0,
                          phys_bits=ppn_bits + page_offset_bits, ppn_bits=ppn_bits, page_offset_bits=page_offset_bits,
-                         policy=None, line_size=None)
+                         policy=None, line_size=None, index_function=index_function)
 
         # precompute masks
         self._dtlb_index_mask = (1 << self.index_bits) - 1
@@ -26,11 +27,32 @@ class TranslationCache(CacheCore):
 
     def parse_address(self, address):
         vpn = self.addr_to_vpn(address)
-        index = vpn & self._dtlb_index_mask
-        tag = vpn >> self.index_bits
+        if self.index_function is not None:
+            tag, index = self._split(vpn)
+        else:
+            index = vpn & self._dtlb_index_mask
+            tag = vpn >> self.index_bits
         offset = self.addr_to_offset(address)
         return tag, index, offset
 
+    def decompose_many(self, addresses):
+        """
+        Parse a whole batch of virtual addresses into page base, tag, and index columns at once
+        :param addresses: sequence of int virtual addresses
+        :return: lists of integer page bases, tags, and indices
+        """
+        if self.index_function is not None:
+            vpns = [address >> self.page_offset_bits for address in addresses]
+            tags, indices = self.index_function.split_many(vpns)
+            return [vpn << self.page_offset_bits for vpn in vpns], tags, indices
+        if np is None:
+            vpns = [address >> self.page_offset_bits for address in addresses]
+            return ([vpn << self.page_offset_bits for vpn in vpns], [vpn >> self.index_bits for vpn in vpns],
+                    [vpn & self._dtlb_index_mask for vpn in vpns])
+        vpns = np.asarray(addresses, dtype=np.int64) >> self.page_offset_bits
+        pages = vpns << self.page_offset_bits
+        return pages.tolist(), (vpns >> self.index_bits).tolist(), (vpns & self._dtlb_index_mask).tolist()
+
     def probe(self, operation, address):
         tag, index, offset = self.parse_address(address)
         page_offset = self.addr_to_offset(address)
@@ -68,18 +90,23 @@ class TranslationCache(CacheCore):
                             allocated=True, evicted_entry=evicted)
 
     def invalidate(self, evicted_entry):
-        for set_dict in self.sets:
+        for index, set_dict in enumerate(self.sets):
             kill = [tag for tag, entry in set_dict.items() if entry.ppn == evicted_entry.ppn]
             for tag in kill:
-                set_dict.pop(tag)
+                self.remove(index, tag)
 
     def invalidate_vpn(self, vpn):
         # Remove any entry for this VPN (per-set)
-        index = vpn & self._dtlb_index_mask
-        tag = vpn >> self.index_bits # or your parse function
+        if self.index_function is not None:
+            tag, index = self._split(vpn)
+        else:
+            index = vpn & self._dtlb_index_mask
+            tag = vpn >> self.index_bits # or your parse function
         set_dict = self.sets[index]
         if tag in set_dict:
-            set_dict.pop(tag)
+            self.remove(index, tag)
+            return True
+        return False
 
 
 class DTLB(TranslationCache):
@@ -93,4 +120,5 @@ class DTLB(TranslationCache):
             dtlb_tag_bits=config.bits.dtlb_tag_bits,
             dtlb_index_bits=config.bits.dtlb_index_bits,
             page_offset_bits=config.bits.page_offset_bits,
+            index_function=config.dtlb.index_function,
         )
\ No newline at end of file
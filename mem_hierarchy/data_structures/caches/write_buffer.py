@@ -0,0 +1,118 @@
+from collections import OrderedDict
+
+
+class WriteBuffer:
+    """
+    Bounded FIFO of the blocks a write-through cache still has to write to its lower level. A store to a block
+    that is already buffered coalesces into that entry, so the lower level sees one write per entry instead of
+    one per store. The oldest entry drains when a store finds the buffer full (a drain stall, the store waits
+    for it), and an entry drains early when a read of its block has to go to the lower level, so the read
+    never overtakes the buffered data. Whatever is left drains at the end of the run.
+    """
+    def __init__(self, entries, offset_bits):
+        """
+        :param entries: blocks the buffer holds
+        :param offset_bits: offset bits of the cache's lines, stores coalesce per line
+        """
+        self.entries = entries
+        self._block_mask = ~((1 << offset_bits) - 1)
+        # block address to the stores coalesced into it, oldest first
+        self.blocks = OrderedDict()
+        self.stores = 0
+        self.coalesced = 0
+        # entries written to the lower level, and why
+        self.drains = 0
+        self.drain_stalls = 0
+        self.conflict_drains = 0
+        self.page_drains = 0
+
+    def write(self, address):
+        """
+        Buffer a store
+        :param address: int address
+        :return: the block address that drained to make room, or None
+        """
+        block = address & self._block_mask
+        self.stores += 1
+        if block in self.blocks:
+            self.blocks[block] += 1
+            self.coalesced += 1
+            return None
+        drained = None
+        if len(self.blocks) >= self.entries:
+            drained = self.blocks.popitem(last=False)[0]
+            self.drains += 1
+            self.drain_stalls += 1
+        self.blocks[block] = 1
+        return drained
+
+    def take(self, address):
+        """
+        Drain the entry a read of an address conflicts with
+        :param address: int address about to be read from the lower level
+        :return: the block address to write down first, or None when nothing is buffered for it
+        """
+        block = address & self._block_mask
+        if block not in self.blocks:
+            return None
+        del self.blocks[block]
+        self.drains += 1
+        self.conflict_drains += 1
+        return block
+
+    def take_page(self, ppn, page_shift, phys_mask):
+        """
+        Drain every entry in an evicted page
+        :param ppn: physical page number
+        :param page_shift: bits below the ppn in a physical address
+        :param phys_mask: mask of the physical address bits
+        :return: list of block addresses, oldest first
+        """
+        blocks = [block for block in self.blocks if (block & phys_mask) >> page_shift == ppn]
+        for block in blocks:
+            del self.blocks[block]
+        self.drains += len(blocks)
+        self.page_drains += len(blocks)
+        return blocks
+
+    def take_all(self):
+        """
+        Drain every entry, at the end of a run
+        :return: list of block addresses, oldest first
+        """
+        blocks = list(self.blocks)
+        self.blocks.clear()
+        self.drains += len(blocks)
+        return blocks
+
+    def summary(self):
+        """
+        :return: dict of the counters and the derived rates. The lower write reduction compares the writes the
+                 lower level got with the stores it would have got without the buffer, blocks still buffered in
+                 the middle of a run count as not written yet.
+        """
+        return {
+            "stores": self.stores,
+            "coalesced": self.coalesced,
+            "lower writes": self.drains,
+            "drain stalls": self.drain_stalls,
+            "conflict drains": self.conflict_drains,
+            "page drains": self.page_drains,
+            "buffered": len(self.blocks),
+            "coalescing rate": self.coalesced / self.stores if self.stores else 0,
+            "lower write reduction": 1 - self.drains / self.stores if self.stores else 0,
+        }
+
+    def state(self):
+        return {"blocks": list(self.blocks.items()),
+                "counters": [self.stores, self.coalesced, self.drains, self.drain_stalls, self.conflict_drains,
+                             self.page_drains]}
+
+    def load_state(self, state, counters=True):
+        """
+        Load the buffered blocks from state(), None empties the buffer
+        :param counters: also load the counters, False starts them from zero
+        """
+        self.blocks = OrderedDict((block, stores) for block, stores in state["blocks"]) if state else OrderedDict()
+        (self.stores, self.coalesced, self.drains, self.drain_stalls, self.conflict_drains,
+         self.page_drains) = state["counters"] if state and counters else (0,) * 6
@@ -2,5 +2,6 @@ from .data_cache_level import DataCacheLevel
 from .main_mem_level import MainMemoryLevel
 from .virtual_memory_level import VirtualMemoryLevel
 from .dtlb_level import DTLBLevel
+from .translation_front_end import TranslationFrontEnd
 
-__all__ = ["DataCacheLevel", "MainMemoryLevel", "VirtualMemoryLevel", "DTLBLevel"]
\ No newline at end of file
+__all__ = ["DataCacheLevel", "MainMemoryLevel", "VirtualMemoryLevel", "DTLBLevel", "TranslationFrontEnd"]
\ No newline at end of file
@@ -1,6 +1,8 @@
 from .level_core import MemoryLevel
-from ...protocols import WriteBackWriteAllocate
-from mem_hierarchy.data_structures.result_structures.access_results import AccessResult
+from ...protocols import WriteBackWriteAllocate, PrefetchStats
+from mem_hierarchy.data_structures.result_structures.access_results import AccessResult, AccessLine
+from mem_hierarchy.data_structures.result_structures import miss_stream
+from mem_hierarchy import tracepoints
 
 class DataCacheLevel(MemoryLevel):
     def __init__(self, name, cache, write_policy, inclusion_policy, lower_level=None, invalidation_bus=None):
@@ -12,6 +14,40 @@ class DataCacheLevel(MemoryLevel):
         if invalidation_bus:
             invalidation_bus.register_listener(self)
         self.inclusions = 0
+        # lines dropped because the lower level evicted them while they were resident here
+        self.back_invalidations = 0
+        # MissStreamWriter recording what this level sends to its lower level, None when not capturing
+        self.miss_stream = None
+        # Tracepoints to fire, None while nobody subscribes to this level's events
+        self.tracer = None
+        # SetStats counting per set activity (see analysis.set_conflicts), None when not tracking
+        self.set_stats = None
+        # Prefetcher picking lines to fill ahead of demand (see protocols.prefetchers), None when not prefetching
+        self.prefetcher = None
+        self.prefetch_stats = PrefetchStats()
+        # WriteBuffer between a write-through cache and its lower level, None when stores go straight down
+        self.write_buffer = None
+
+    def capture_miss_stream(self, writer):
+        """
+        Record everything this level sends to its lower level, plus its own evictions, from now on
+        :param writer: MissStreamWriter, or None to stop capturing
+        :return: None
+        """
+        self.miss_stream = writer
+
+    def _record(self, kind, address):
+        if self.miss_stream is not None:
+            self.miss_stream.record(kind, address)
+
+    def _trace(self, event, address, index=None, **detail):
+        """
+        Fire a tracepoint for a line of this cache, only called once self.tracer is known to be set
+        :param index: set the line sat in, for lines no longer resident
+        """
+        if index is None:
+            index = self.cache.set_of(address)
+        self.tracer.emit(event, self.name, self.cache._block_base(address), index, **detail)
 
     @staticmethod
     def update_line(access_result, line):
@@ -24,23 +60,70 @@ class DataCacheLevel(MemoryLevel):
             line.l2_index = int(access_result.index)
             line.l2_result = access_result.hit
 
-    def lower_eviction_inclusion(self, lower_read, line):
+    def touch(self, address, operation="R"):
+        """
+        Make a resident line recently used without counting an access, for hits of the level above and writebacks
+        from it
+        :return: AccessResult of the probe
+        """
+        result = self.cache.probe(operation, address, update_mru=True)
+        if result.hit and self.set_stats is not None:
+            self.set_stats.touched(self.cache._block_base(address))
+        return result
+
+    def lower_eviction_inclusion(self, lower_read, line,
+                                 origin=" read miss lower eviction enforce inclusion (writeback)"):
+        """
+        Drop the line the lower level evicted for a fill from this level too, writing it down first when dirty
+        :param origin: origin of that writeback, after this level's name
+        """
         if lower_read.evicted_entry and hasattr(self.lower_level, "cache"):
+            # the set is looked up before the invalidation frees the line's frame
+            index = (self.cache.set_of(lower_read.evicted_entry.address)
+                     if self.tracer is not None or self.set_stats is not None else None)
             hit, was_dirty = self.inclusion_policy.on_lower_eviction(
                 self.cache, lower_read.evicted_entry.address
             )
+            self.back_invalidations += hit
+            if hit and self.tracer is not None:
+                self._trace(tracepoints.BACK_INVALIDATION, lower_read.evicted_entry.address, index, dirty=was_dirty)
+            if hit and self.set_stats is not None:
+                self.set_stats.back_invalidated(index)
             if hit and was_dirty:
                 # push dirty data downward
-                self.lower_level.access("W", lower_read.evicted_entry.address, line,
-                                        origin=self.name + " read miss lower eviction enforce inclusion (writeback)",
+                self._record(miss_stream.INCLUSION_WRITEBACK, lower_read.evicted_entry.address)
+                self.cache.write_backs += 1
+                if self.tracer is not None:
+                    self._trace(tracepoints.WRITEBACK, lower_read.evicted_entry.address, index, cause="inclusion")
+                self.lower_level.access("W", lower_read.evicted_entry.address, line, origin=self.name + origin,
                                         is_writeback=True)
                 self.runtime_writebacks += 1
 
-    def manage_backfill(self, address, line):
-        back_filled = self.cache.back_fill("R", address)
+    def manage_backfill(self, address, line, prefetched=False):
+        back_filled = self.cache.back_fill("R", address, prefetched=prefetched)
+        if self.tracer is not None:
+            if prefetched:
+                self._trace(tracepoints.FILL, address, op="R", prefetch=True)
+            else:
+                self._trace(tracepoints.FILL, address, op="R")
 
+        if back_filled.evicted_entry:
+            self._record(miss_stream.EVICT, back_filled.evicted_entry.address)
+            self.cache.evictions += 1
+            if back_filled.evicted_entry.prefetched:
+                self.prefetch_stats.evicted_unused(back_filled.evicted_entry.address)
+            if self.tracer is not None:
+                self._trace(tracepoints.EVICTION, back_filled.evicted_entry.address, back_filled.evicted_entry.index,
+                            dirty=back_filled.evicted_entry.dirty)
+            if self.set_stats is not None:
+                self.set_stats.evicted(back_filled.evicted_entry.index, back_filled.evicted_entry.dirty)
         # if backfill evicted a dirty line, write it down to lower level
         if back_filled.evicted_entry and back_filled.evicted_entry.dirty and self.lower_level:
+            self._record(miss_stream.WRITEBACK, back_filled.evicted_entry.address)
+            self.cache.write_backs += 1
+            if self.tracer is not None:
+                self._trace(tracepoints.WRITEBACK, back_filled.evicted_entry.address, back_filled.evicted_entry.index,
+                            cause="eviction")
             self.lower_level.access("W", back_filled.evicted_entry.address, line,
                                     origin=self.name + " read miss backfill dirty eviction so writeback",
                                     is_writeback=True)
@@ -52,11 +135,16 @@ class DataCacheLevel(MemoryLevel):
         self.cache.reads += 1
         if update_line:
             self.update_line(first_read, line)
+        if self.set_stats is not None:
+            self.set_stats.access(first_read.index, self.cache._block_base(address), first_read.hit)
 
         if first_read.hit:
             self.cache.read_hits += 1
             if self.lower_level and hasattr(self.lower_level, "cache"):
-                self.lower_level.cache.probe("R", address, update_mru=True)
+                self._record(miss_stream.TOUCH, address)
+                self.lower_level.touch(address)
+            if self.prefetcher is not None:
+                self._train_prefetcher(first_read, address)
             return first_read
 
         # miss
@@ -64,15 +152,97 @@ class DataCacheLevel(MemoryLevel):
         self.cache.l2_read_miss_calls += 1
 
         if self.lower_level:
+            if self.write_buffer is not None:
+                self._drain_conflict(address)
+            self._record(miss_stream.READ, address)
             lower_read = self.lower_level.access("R", address, line,
                                                  origin=self.name + " read miss so lower read")
             # inclusion on lower eviction
             self.lower_eviction_inclusion(lower_read, line)
 
-        return self.manage_backfill(address, line)
+        back_filled = self.manage_backfill(address, line)
+        if self.prefetcher is not None:
+            self._train_prefetcher(first_read, address)
+        return back_filled
+
+    def _train_prefetcher(self, demand, address):
+        """
+        Show the prefetcher a demand access, then fill the lines it asks for
+        :param demand: AccessResult of the demand probe
+        """
+        stats = self.prefetch_stats
+        prefetch_hit = False
+        if demand.hit:
+            entry = self.cache.sets[demand.index].get(demand.tag)
+            if entry is not None and entry.prefetched:
+                entry.prefetched = False
+                prefetch_hit = True
+                stats.used(entry.address, self.cache.reads + self.cache.writes)
+        for target in self.prefetcher.observe(address, demand.hit, prefetch_hit):
+            stats.requests += 1
+            if self.cache.contains(target):
+                stats.redundant += 1
+                continue
+            self._prefetch_fill(target, prefetched=True)
+
+    def _prefetch_fill(self, address, prefetched):
+        """
+        Fill a line no demand access asked for, one this level's prefetcher picked, or one a prefetching level
+        above reads through this one. Nothing here is a demand access, so the hit and miss counters and the
+        rendered line are left alone.
+        :param prefetched: mark the line as prefetched, for this level's own prefetches
+        :return: AccessResult
+        """
+        if self.cache.contains(address):
+            # only a level above can ask for a resident line, its fill still makes the line recently used here
+            return self.touch(address)
+        if self.lower_level:
+            if self.write_buffer is not None:
+                self._drain_conflict(address)
+            self._record(miss_stream.PREFETCH, address)
+            lower_read = self.lower_level.access("R", address, None, update_line=False,
+                                                 origin=self.name + " prefetch", is_prefetch=True)
+            self.lower_eviction_inclusion(lower_read, None)
+        back_filled = self.manage_backfill(address, None, prefetched=prefetched)
+        if prefetched:
+            self.prefetch_stats.filled(self.cache._block_base(address), self.cache.reads + self.cache.writes)
+        return back_filled
+
+    def _write_through(self, address, line):
+        """
+        Send a write-through store down, or into the write buffer when there is one
+        """
+        if self.write_buffer is None:
+            self._record(miss_stream.WRITE_THROUGH, address)
+            self.lower_level.access("W", address, line, origin=self.name + " write needs lower write")
+            return
+        drained = self.write_buffer.write(address)
+        if drained is not None:
+            self._drain(drained)
+
+    def _drain(self, block):
+        # a drained block is not the rendered access's own write, so the line is left alone
+        self._record(miss_stream.WRITE_THROUGH, block)
+        self.lower_level.access("W", block, None, update_line=False, origin=self.name + " write needs lower write")
+
+    def _drain_conflict(self, address):
+        """
+        Write the buffered stores of a block down before reading it from the lower level
+        """
+        block = self.write_buffer.take(address)
+        if block is not None:
+            self._drain(block)
+
+    def drain_write_buffer(self):
+        """
+        Write every buffered store down, at the end of a run
+        """
+        if self.write_buffer is not None and self.lower_level:
+            for block in self.write_buffer.take_all():
+                self._drain(block)
 
     def _write_back(self, address, line, update_line, **kwargs):
-        pre = self.cache.probe("W", address, update_mru=True)
+        pre = self.touch(address, "W")
         if pre.hit:
             self.cache.write_hits += 1
             self.cache.mark_dirty(address)
@@ -80,6 +250,7 @@ class DataCacheLevel(MemoryLevel):
                 self.update_line(pre, line)
             return pre
         if self.lower_level:
+            self._record(miss_stream.PASS_THROUGH_WRITEBACK, address)
             self.lower_level.access("W", address, line,
                                     origin=(kwargs.get("origin") or (self.name + " pass-through writeback")),
                                     is_writeback=True)
@@ -89,21 +260,12 @@ class DataCacheLevel(MemoryLevel):
 
     def _rfo(self, address, line, is_wb_wa, pre):
         if self.lower_level and is_wb_wa and not pre.hit:
+            self._record(miss_stream.RFO, address)
             lower_read = self.lower_level.access(
                 "R", address, line, update_line=True,
                 origin=self.name + " write miss RFO"
             )
-            if hasattr(self.lower_level, "cache") and lower_read.evicted_entry:
-                hit, was_dirty = self.inclusion_policy.on_lower_eviction(
-                    self.cache, lower_read.evicted_entry.address
-                )
-                if hit and was_dirty:
-                    self.lower_level.access(
-                        "W", lower_read.evicted_entry.address, line,
-                        origin=self.name + " inclusion dirty writeback",
-                        is_writeback=True
-                    )
-                    self.runtime_writebacks += 1
+            self.lower_eviction_inclusion(lower_read, line, origin=" inclusion dirty writeback")
 
     def write_access(self, address, line, update_line, **kwargs):
         is_wb = kwargs.get("is_writeback", False)
@@ -112,6 +274,8 @@ class DataCacheLevel(MemoryLevel):
 
         is_wb_wa = isinstance(self.write_policy, WriteBackWriteAllocate)
         pre = self.cache.probe("W", address, update_mru=False)
+        if self.set_stats is not None:
+            self.set_stats.access(pre.index, self.cache._block_base(address), pre.hit)
 
         # Miss RFO first
         self._rfo(address, line, is_wb_wa, pre)
@@ -121,35 +285,127 @@ class DataCacheLevel(MemoryLevel):
 
         # If the policy needs a lower write (WT/NWA), propagate it down
         if first_write.needs_lower_write and self.lower_level:
-            self.lower_level.access("W", address, line,
-                                    origin=self.name + " write needs lower write")
+            self._write_through(address, line)
 
+        if first_write.allocated and self.tracer is not None:
+            self._trace(tracepoints.FILL, address, op="W")
+        if first_write.evicted_entry:
+            self._record(miss_stream.EVICT, first_write.evicted_entry.address)
+            self.cache.evictions += 1
+            if first_write.evicted_entry.prefetched:
+                self.prefetch_stats.evicted_unused(first_write.evicted_entry.address)
+            if self.tracer is not None:
+                self._trace(tracepoints.EVICTION, first_write.evicted_entry.address, first_write.evicted_entry.index,
+                            dirty=first_write.evicted_entry.dirty)
+            if self.set_stats is not None:
+                self.set_stats.evicted(first_write.evicted_entry.index, first_write.evicted_entry.dirty)
         # If this level evicted a dirty victim, write it back
         if first_write.evicted_entry and first_write.evicted_entry.dirty and self.lower_level:
+            self._record(miss_stream.WRITEBACK, first_write.evicted_entry.address)
+            self.cache.write_backs += 1
+            if self.tracer is not None:
+                self._trace(tracepoints.WRITEBACK, first_write.evicted_entry.address, first_write.evicted_entry.index,
+                            cause="eviction")
             self.lower_level.access(
                 "W", first_write.evicted_entry.address, line,
                 origin=self.name + " write back dirty eviction",
                 is_writeback=True
             )
 
+        if self.prefetcher is not None:
+            self._train_prefetcher(pre, address)
         if line and update_line:
             self.update_line(first_write, line)
         return first_write
 
     def access(self, operation, address, line, update_line=True, origin=None, **kwargs):
         if operation == "R":
+            if kwargs.get("is_prefetch", False):
+                return self._prefetch_fill(address, prefetched=False)
             return self.read_access(address, line, update_line)
         elif operation == "W":
             return self.write_access(address, line, update_line, **kwargs)
         else:
             raise ValueError(f"Unknown op: {operation}")
 
+    def access_many(self, ops, addrs):
+        """
+        Run a batch of accesses through this level. Tags and indices for this level and the lower cache are
+        derived for the whole batch up front, hits are resolved inline on plain ints and counted per batch,
+        and anything that needs the lower level goes through the regular access path.
+        :param ops: sequence of "R" or "W"
+        :param addrs: sequence of int addresses
+        :return: None
+        """
+        # scratch line for the lower levels, nothing is rendered in batch mode
+        line = AccessLine(0)
+        if self.set_stats is not None or self.prefetcher is not None or \
+                getattr(self.lower_level, "set_stats", None) is not None:
+            # per set tracking and the prefetcher have to see every access, and a tracked lower level every touch,
+            # so the hit loop below is skipped
+            for operation, address in zip(ops, addrs):
+                self.access(operation, address, line, update_line=False)
+            return
+        cache = self.cache
+        _, tags, indices = cache.decompose_many(addrs)
+        lower_cache = getattr(self.lower_level, "cache", None) if self.lower_level else None
+        if lower_cache is not None:
+            _, lower_tags, lower_indices = lower_cache.decompose_many(addrs)
+        is_wb_wa = isinstance(self.write_policy, WriteBackWriteAllocate)
+        write_origin = self.name + " write needs lower write"
+        capture = self.miss_stream
+        write_buffer = self.write_buffer
+        read_hits = write_hits = 0
+
+        for i, operation in enumerate(ops):
+            entry = cache.touch(indices[i], tags[i])
+            if entry is not None:
+                if operation == "R":
+                    read_hits += 1
+                    if lower_cache is not None:
+                        if capture is not None:
+                            capture.record(miss_stream.TOUCH, addrs[i])
+                        lower_cache.touch(lower_indices[i], lower_tags[i])
+                    continue
+                if operation == "W":
+                    write_hits += 1
+                    if is_wb_wa:
+                        entry.mark_dirty()
+                    elif self.lower_level:
+                        if write_buffer is not None:
+                            self._write_through(addrs[i], line)
+                            continue
+                        if capture is not None:
+                            capture.record(miss_stream.WRITE_THROUGH, addrs[i])
+                        self.lower_level.access("W", addrs[i], line, origin=write_origin)
+                    continue
+            # misses (and unknown ops) take the full path
+            self.access(operation, addrs[i], line, update_line=False)
+
+        cache.reads += read_hits
+        cache.read_hits += read_hits
+        cache.writes += write_hits
+        cache.write_hits += write_hits
+
     def on_page_evicted(self, evicted_entry):
+        if self.write_buffer is not None and self.lower_level:
+            cache = self.cache
+            for block in self.write_buffer.take_page(evicted_entry.ppn, cache.phys_bits - cache.ppn_bits,
+                                                     cache._phys_mask):
+                # the lower level may have dropped the page already, so like a dirty line the buffered data is
+                # written back without allocating
+                self._record(miss_stream.PAGE_WRITEBACK, block)
+                self.lower_level.access("W", block, line=None, origin=self.name + " page eviction writeback",
+                                        is_writeback=True)
         entries_in_page = self.cache.entries_in_page(evicted_entry)
 
         # for each dirty entry, write back to lower (L2) as a WRITEBACK
         for entry in entries_in_page:
             if entry.dirty and self.lower_level:
+                self._record(miss_stream.PAGE_WRITEBACK, entry.address)
+                self.cache.write_backs += 1
+                if self.tracer is not None:
+                    self._trace(tracepoints.WRITEBACK, entry.address, entry.index, cause="page eviction")
                 self.lower_level.access(
                     "W", entry.address, line=None,
                     origin=self.name + " page eviction writeback",
@@ -157,6 +413,102 @@ class DataCacheLevel(MemoryLevel):
                 )
                 self.runtime_writebacks += 1
         self.cache.invalidate_page(evicted_entry)
+        self._record(miss_stream.PAGE_EVICTED, evicted_entry.ppn)
+
+    def register_metrics(self, registry):
+        """
+        Register this level's counters, read from the cache when the registry is collected
+        :param registry: MetricsRegistry
+        :return: None
+        """
+        cache = self.cache
+        labels = {"level": self.name}
+        for counter, description in (("reads", "Reads that reached the cache"),
+                                     ("writes", "Writes that reached the cache"),
+                                     ("read_hits", "Read hits"), ("write_hits", "Write hits"),
+                                     ("read_misses", "Read misses"), ("write_misses", "Write misses"),
+                                     ("evictions", "Lines replaced to make room for a fill"),
+                                     ("write_backs", "Dirty lines written to the level below"),
+                                     ("alloc_on_write_miss", "Write misses that allocated a line")):
+            registry.counter(f"cache_{counter}", description, labels,
+                             source=lambda counter=counter: getattr(cache, counter))
+        hits = registry.counter("cache_hits", "Read and write hits", labels,
+                                source=lambda: cache.read_hits + cache.write_hits)
+        misses = registry.counter("cache_misses", "Read and write misses", labels,
+                                  source=lambda: cache.read_misses + cache.write_misses)
+        hit_rate = registry.gauge("cache_hit_rate", "Share of accesses that hit", labels,
+                                  source=lambda: cache.get_stats()["hit rate"])
+        # the report's L2 labels are a column narrower than the DC's
+        title, width = ("L2", 16) if self.name == "l2" else (self.name, 17)
+        registry.report(f"{title + ' hits':<{width}s}", f"{self.name} hits", hits)
+        registry.report(f"{title + ' misses':<{width}s}", f"{self.name} misses", misses)
+        registry.report(f"{title + ' hit rate':<{width}s}", f"{self.name} hit rate", hit_rate, ".6f", gap=True)
+        registry.counter("cache_back_invalidations", "Lines dropped because the level below evicted them", labels,
+                         source=lambda: self.back_invalidations)
+        registry.counter("cache_runtime_writebacks", "Dirty lines written back during the run, page evictions included",
+                         labels, source=lambda: self.runtime_writebacks)
+        registry.counter("cache_lower_read_miss_calls", "Read misses that read the level below", labels,
+                         source=lambda: cache.l2_read_miss_calls)
+        registry.counter("cache_dirty_evictions", "Dirty lines evicted per set", labels, by="set",
+                         source=lambda: cache.dirty_evictions_per_set)
+        registry.gauge("cache_resident_lines", "Valid lines", labels,
+                       source=lambda: sum(len(set_dict) for set_dict in cache.sets))
+        registry.gauge("cache_dirty_lines", "Dirty lines", labels,
+                       source=lambda: sum(1 for _ in cache.iter_dirty_entries()))
+        registry.histogram("cache_set_occupancy", "Valid lines per set", range(cache.associativity + 1), labels,
+                           source=lambda: ((len(set_dict), 1) for set_dict in cache.sets))
+        if self.prefetcher is not None:
+            prefetch = {}
+            for counter, description in (("requests", "Lines the prefetcher asked for"),
+                                         ("redundant", "Prefetch requests for resident lines, dropped"),
+                                         ("fills", "Lines filled by a prefetch"),
+                                         ("useful", "Prefetched lines a demand access used"),
+                                         ("unused_evictions", "Prefetched lines evicted before any use")):
+                prefetch[counter] = registry.counter(
+                    f"cache_prefetch_{counter}", description, labels,
+                    source=lambda counter=counter: getattr(self.prefetch_stats, counter))
+            for key, description in (("accuracy", "Share of prefetch fills a demand access used"),
+                                     ("coverage", "Share of would-be demand misses a prefetch served"),
+                                     ("mean lead", "Mean accesses from a prefetch fill to its first use")):
+                prefetch[key] = registry.gauge(f"cache_prefetch_{key.replace(' ', '_')}", description, labels,
+                                               source=lambda key=key: self.get_stats()["prefetch"][key])
+            for label, key, fmt in (("prefetch fills", "fills", None), ("prefetch useful", "useful", None),
+                                    ("prefetch accuracy", "accuracy", ".6f"),
+                                    ("prefetch coverage", "coverage", ".6f"),
+                                    ("prefetch mean lead", "mean lead", ".2f"),
+                                    ("prefetch unused evictions", "unused_evictions", None)):
+                registry.report(f"{self.name} {label:<25s}", f"{self.name} {label}", prefetch[key], fmt,
+                                gap=key == "unused_evictions")
+        if self.write_buffer is not None:
+            write_buffer = self.write_buffer
+            buffered = {}
+            for counter, description in (("stores", "Write-through stores that entered the write buffer"),
+                                         ("coalesced", "Stores merged into an already buffered block"),
+                                         ("drains", "Buffered blocks written to the level below"),
+                                         ("drain_stalls", "Stores that waited for the full buffer to drain"),
+                                         ("conflict_drains", "Blocks drained early for a read of the same block")):
+                buffered[counter] = registry.counter(f"cache_write_buffer_{counter}", description, labels,
+                                                     source=lambda counter=counter: getattr(write_buffer, counter))
+            registry.gauge("cache_write_buffer_blocks", "Blocks waiting in the write buffer", labels,
+                           source=lambda: len(write_buffer.blocks))
+            for key, description in (("coalescing rate", "Share of stores merged into a buffered block"),
+                                     ("lower write reduction", "Share of stores that never became a lower write")):
+                buffered[key] = registry.gauge(f"cache_write_buffer_{key.replace(' ', '_')}", description, labels,
+                                               source=lambda key=key: write_buffer.summary()[key])
+            for label, key, fmt in (("write buffer stores", "stores", None),
+                                    ("write buffer coalesced", "coalesced", None),
+                                    ("write buffer lower writes", "drains", None),
+                                    ("write buffer drain stalls", "drain_stalls", None),
+                                    ("write buffer read drains", "conflict_drains", None),
+                                    ("write buffer coalescing", "coalescing rate", ".6f"),
+                                    ("write buffer reduction", "lower write reduction", ".6f")):
+                registry.report(f"{self.name} {label:<25s}", f"{self.name} {label}", buffered[key], fmt,
+                                gap=key == "lower write reduction")
 
     def get_stats(self):
-        return self.cache.get_stats()
\ No newline at end of file
+        stats = self.cache.get_stats()
+        if self.prefetcher is not None:
+            stats["prefetch"] = self.prefetch_stats.summary(self.cache.read_misses + self.cache.write_misses)
+        if self.write_buffer is not None:
+            stats["write buffer"] = self.write_buffer.summary()
+        return stats
\ No newline at end of file
@@ -1,9 +1,12 @@
 from .level_core import MemoryLevel
+from mem_hierarchy import tracepoints
 
 class DTLBLevel(MemoryLevel):
     def __init__(self, dtlb_cache, lower_level=None, invalidation_bus=None):
         super().__init__("DTLB", lower_level)
         self.dtlb_cache = dtlb_cache
+        # Tracepoints to fire on shootdowns, None while nobody subscribes
+        self.tracer = None
         if invalidation_bus:
             invalidation_bus.register_listener(self)
 
@@ -15,7 +18,11 @@ class DTLBLevel(MemoryLevel):
         if vpn is None:
             # Fallback: derive from PPN only if you maintain a reverse map; otherwise bail quietly.
             return
-        self.dtlb_cache.invalidate_vpn(vpn)
+        page = vpn << self.dtlb_cache.page_offset_bits
+        # the set is looked up before the invalidation frees the entry's frame
+        index = self.dtlb_cache.set_of(page) if self.tracer is not None else None
+        if self.dtlb_cache.invalidate_vpn(vpn) and self.tracer is not None:
+            self.tracer.emit(tracepoints.TLB_SHOOTDOWN, "dtlb", page, index, vpn=vpn, ppn=evicted_entry.ppn)
 
     @staticmethod
     def update_line(access_result, line):
@@ -47,6 +54,50 @@ class DTLBLevel(MemoryLevel):
         if backfill_result.evicted_entry:
             self.dtlb_cache.evictions += 1
 
+    def access_many(self, ops, addrs):
+        """
+        Batched translation lookups. Every op is a DTLB read, fills still go through access("W", ...)
+        :param ops: sequence of "R" or "W" for the original accesses
+        :param addrs: sequence of int virtual addresses
+        :return: list with the cached ppn for each hit, None for each miss
+        """
+        cache = self.dtlb_cache
+        _, tags, indices = cache.decompose_many(addrs)
+        ppns = []
+        hits = 0
+        for tag, index in zip(tags, indices):
+            entry = cache.touch(index, tag)
+            if entry is None:
+                ppns.append(None)
+            else:
+                hits += 1
+                ppns.append(entry.ppn)
+        cache.reads += len(ppns)
+        cache.read_hits += hits
+        cache.read_misses += len(ppns) - hits
+        return ppns
+
+    def register_metrics(self, registry):
+        """
+        Register the DTLB's counters, read from the cache when the registry is collected
+        :param registry: MetricsRegistry
+        :return: None
+        """
+        cache = self.dtlb_cache
+        for name, counter, description in (("tlb_lookups", "reads", "Translations looked up"),
+                                           ("tlb_hits", "read_hits", "Lookups that hit"),
+                                           ("tlb_misses", "read_misses", "Lookups that missed"),
+                                           ("tlb_fills", "writes", "Translations filled after a miss"),
+                                           ("tlb_evictions", "evictions", "Translations replaced by a fill")):
+            registry.counter(name, description, source=lambda counter=counter: getattr(cache, counter))
+        registry.gauge("tlb_resident_entries", "Valid translations",
+                       source=lambda: sum(len(set_dict) for set_dict in cache.sets))
+        hit_rate = registry.gauge("tlb_hit_rate", "Share of lookups that hit",
+                                  source=lambda: cache.get_stats()["hit rate"])
+        registry.report("dtlb hits        ", "dtlb hits", registry.get("tlb_hits"))
+        registry.report("dtlb misses      ", "dtlb misses", registry.get("tlb_misses"))
+        registry.report("dtlb hit rate    ", "dtlb hit rate", hit_rate, ".6f", gap=True)
+
     def get_stats(self):
         return self.dtlb_cache.get_stats()
 
@@ -7,12 +7,16 @@ class MainMemoryLevel(MemoryLevel):
         super().__init__("Main Memory")
         self.reads = 0
         self.writes = 0
+        # reads a prefetch sent here, the traffic prefetching adds on top of demand
+        self.prefetch_reads = 0
         self.by_origin = defaultdict(lambda x: 0)
 
     def access(self, operation, address, line, update_line=False, is_flush=False, origin="unknown", **kwargs):
         self.by_origin[origin] = self.by_origin.get(origin, 0) + 1
         if operation == "R":
             self.reads += 1
+            if kwargs.get("is_prefetch", False):
+                self.prefetch_reads += 1
         elif operation == "W":
             #if not is_flush:
             self.writes += 1
@@ -20,10 +24,50 @@ class MainMemoryLevel(MemoryLevel):
             raise ValueError(f"Unknown op: {operation}")
         return AccessResult(self.name, operation, address, True, 0, 0, 0)
 
+    def access_many(self, ops, addrs, origin="batch access"):
+        """
+        Count a batch of accesses in one go
+        :param ops: sequence of "R" or "W"
+        :param addrs: sequence of int addresses
+        :return: None
+        """
+        reads = writes = 0
+        for operation in ops:
+            if operation == "R":
+                reads += 1
+            elif operation == "W":
+                writes += 1
+            else:
+                raise ValueError(f"Unknown op: {operation}")
+        self.reads += reads
+        self.writes += writes
+        self.by_origin[origin] = self.by_origin.get(origin, 0) + reads + writes
+
+    def register_metrics(self, registry):
+        """
+        Register the memory's counters, read when the registry is collected
+        :param registry: MetricsRegistry
+        :return: None
+        """
+        registry.counter("memory_reads", "Reads that reached main memory", source=lambda: self.reads)
+        registry.counter("memory_writes", "Writes that reached main memory", source=lambda: self.writes)
+        prefetch_reads = registry.counter("memory_prefetch_reads", "Reads main memory served for a prefetch",
+                                          source=lambda: self.prefetch_reads)
+        accesses = registry.counter("memory_accesses", "Reads and writes that reached main memory",
+                                    source=lambda: self.reads + self.writes)
+        registry.report("main memory refs ", "main memory refs", accesses)
+        registry.report("  for prefetches ", "main memory prefetch refs", prefetch_reads,
+                        when=lambda: self.prefetch_reads)
+        registry.counter("memory_accesses_by_origin", "Main memory accesses per requesting path", by="origin",
+                         source=lambda: self.by_origin)
+
     def get_stats(self):
         total = self.reads + self.writes
-        return {
+        stats = {
             "mem_accesses": total,
             "mem_reads": self.reads,
             "mem_writes": self.writes,
-        }
\ No newline at end of file
+        }
+        if self.prefetch_reads:
+            stats["mem_prefetch_reads"] = self.prefetch_reads
+        return stats
\ No newline at end of file
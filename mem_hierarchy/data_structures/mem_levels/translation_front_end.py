@@ -0,0 +1,74 @@
+from .level_core import MemoryLevel
+from .dtlb_level import DTLBLevel
+from .virtual_memory_level import VirtualMemoryLevel
+from ..caches.translation_cache import DTLB
+from ..virtual_mem.page_table import PageTable
+from ..result_structures.access_results import AccessLine
+from ...protocols.invalidation_bus import InvalidationBus
+
+
+class TranslationFrontEnd(MemoryLevel):
+    """
+    The DTLB and page table with no caches behind them. Translation state never depends on the data caches, but
+    the page table's LRU order does depend on the DTLB (DTLB hits skip the page table), so the two always run
+    together.
+    Sits under the VirtualMemoryLevel as its lower level and collects the physical addresses it emits, along with
+    the page evictions published in between.
+    """
+    def __init__(self, config):
+        super().__init__("Translation")
+        self.invalidation_bus = InvalidationBus()
+        self.dtlb = None
+        if config.dtlb_enabled:
+            self.dtlb = DTLBLevel(DTLB(config), lower_level=None, invalidation_bus=self.invalidation_bus)
+        self.pt = VirtualMemoryLevel(PageTable(config), self.invalidation_bus, dtlb_level=self.dtlb, lower_level=self)
+        self.invalidation_bus.register_listener(self)
+        self._line = AccessLine(0)
+        self.ops = []
+        self.physical_addresses = []
+        self.evictions = []
+
+    def access(self, operation, address, line, **kwargs):
+        self.ops.append(operation)
+        self.physical_addresses.append(address)
+
+    def access_many(self, ops, addrs):
+        self.ops.extend(ops)
+        self.physical_addresses.extend(addrs)
+
+    def on_page_evicted(self, evicted_entry):
+        # the DTLB miss path publishes the same eviction twice, keep one marker
+        if self.evictions and self.evictions[-1][1] is evicted_entry:
+            return
+        self.evictions.append((len(self.physical_addresses), evicted_entry))
+
+    def _drain(self):
+        result = self.ops, self.physical_addresses, self.evictions
+        self.ops = []
+        self.physical_addresses = []
+        self.evictions = []
+        return result
+
+    def translate(self, operation, address):
+        """
+        Translate one virtual address
+        :return: physical address and the list of page evictions it caused
+        """
+        self.pt.access(operation, address, self._line)
+        _, physical_addresses, evictions = self._drain()
+        return physical_addresses[0], [evicted_entry for _, evicted_entry in evictions]
+
+    def translate_many(self, ops, addrs):
+        """
+        Translate a batch of virtual addresses
+        :return: ops, physical addresses, and (position, EvictedPageTableEntry) markers where position is the
+                 number of physical addresses emitted before the eviction
+        """
+        self.pt.access_many(ops, addrs)
+        return self._drain()
+
+    def get_stats(self):
+        stats = {"page table": self.pt.get_stats()}
+        if self.dtlb:
+            stats["dtlb"] = self.dtlb.get_stats()
+        return stats
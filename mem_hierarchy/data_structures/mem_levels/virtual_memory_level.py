@@ -51,5 +51,79 @@ class VirtualMemoryLevel(MemoryLevel):
                 self.invalidation_bus.publish_page_evicted(translation_info.evicted_entry)
         return self.lower_level.access(operation, physical_address, line)
 
+    def access_many(self, ops, addrs):
+        """
+        Translate a batch of virtual addresses and hand the physical addresses to the lower level in batches.
+        Pending accesses are flushed downward before any page eviction is published so invalidations land in
+        the same order as in the serial path, and before a traced page fault so its events do too.
+        :param ops: sequence of "R" or "W"
+        :param addrs: sequence of int virtual addresses
+        :return: None
+        """
+        page_table = self.page_table
+        offset_bits = page_table.page_offset_bits
+        offset_mask = (1 << offset_bits) - 1
+        dtlb_level = self.dtlb_level
+        if dtlb_level:
+            dtlb_cache = dtlb_level.dtlb_cache
+            _, dtlb_tags, dtlb_indices = dtlb_cache.decompose_many(addrs)
+        dtlb_hits = dtlb_misses = 0
+        pending_ops = []
+        pending_addrs = []
+
+        for i, address in enumerate(addrs):
+            if dtlb_level:
+                entry = dtlb_cache.touch(dtlb_indices[i], dtlb_tags[i])
+                if entry is not None:
+                    dtlb_hits += 1
+                    pending_ops.append(ops[i])
+                    pending_addrs.append((entry.ppn << offset_bits) | (address & offset_mask))
+                    continue
+                dtlb_misses += 1
+            if pending_ops and page_table.tracer is not None and not page_table.is_mapped(address):
+                # the fault fires its tracepoints inside translate
+                self.lower_level.access_many(pending_ops, pending_addrs)
+                pending_ops = []
+                pending_addrs = []
+            translation_info = page_table.translate(address)
+            if translation_info.evicted_entry:
+                if pending_ops:
+                    self.lower_level.access_many(pending_ops, pending_addrs)
+                    pending_ops = []
+                    pending_addrs = []
+                self.invalidation_bus.publish_page_evicted(translation_info.evicted_entry)
+            if dtlb_level:
+                dtlb_level.access("W", address, translation_info)
+            pending_ops.append(ops[i])
+            pending_addrs.append(translation_info.physical_address)
+
+        if pending_ops:
+            self.lower_level.access_many(pending_ops, pending_addrs)
+        if dtlb_level:
+            dtlb_cache.reads += dtlb_hits + dtlb_misses
+            dtlb_cache.read_hits += dtlb_hits
+            dtlb_cache.read_misses += dtlb_misses
+
+    def register_metrics(self, registry):
+        """
+        Register the page table's counters, read when the registry is collected
+        :param registry: MetricsRegistry
+        :return: None
+        """
+        page_table = self.page_table
+        for name, counter, description in (("page_table_accesses", "accesses", "Translations through the page table"),
+                                           ("page_table_hits", "hits", "Pages already mapped"),
+                                           ("page_table_misses", "misses", "Page faults"),
+                                           ("disk_references", "disk_references", "Pages read from disk")):
+            registry.counter(name, description, source=lambda counter=counter: getattr(page_table, counter))
+        registry.gauge("page_table_resident_pages", "Mapped physical pages",
+                       source=lambda: len(page_table.vpn_to_ppn))
+        registry.gauge("page_table_free_pages", "Unmapped physical pages", source=lambda: len(page_table.free_ppns))
+        hit_rate = registry.gauge("page_table_hit_rate", "Share of translations whose page was mapped",
+                                  source=lambda: page_table.get_stats()["hit rate"])
+        registry.report("pt hits          ", "pt hits", registry.get("page_table_hits"))
+        registry.report("pt misses        ", "pt misses", registry.get("page_table_misses"))
+        registry.report("pt hit rate      ", "pt hit rate", hit_rate, ".6f", gap=True)
+
     def get_stats(self):
         return self.page_table.get_stats()
\ No newline at end of file
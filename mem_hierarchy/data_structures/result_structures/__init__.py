@@ -1,3 +1,7 @@
 from .access_results import AccessResult, AccessLine
+from .miss_stream import MissStreamWriter, MissStreamReader
+from .interval_series import IntervalSeriesWriter, interval_counters
+from .access_output import TextLineWriter, ColumnarAccessWriter, ColumnarAccessReader, format_line
 
-__all__ = ["AccessResult", "AccessLine"]
\ No newline at end of file
+__all__ = ["AccessResult", "AccessLine", "MissStreamWriter", "MissStreamReader", "IntervalSeriesWriter",
+           "interval_counters", "TextLineWriter", "ColumnarAccessWriter", "ColumnarAccessReader", "format_line"]
\ No newline at end of file
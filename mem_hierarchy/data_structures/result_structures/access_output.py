@@ -0,0 +1,212 @@
+import csv
+import json
+import struct
+from array import array
+
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, columns load as plain arrays without it
+    np = None
+
+MAGIC = b"ACCESSCL"
+VERSION = 1
+# magic, version, offset of the json trailer
+_HEADER = struct.Struct("<8sHQ")
+_COUNT = struct.Struct("<I")
+
+# raw per access fields in column order, with the array typecode each is stored as. Numeric fields hold -1 and
+# hit/miss flags hold -1 where the access did not reach that part of the hierarchy.
+FIELDS = (
+    ("address", "q"), ("vpn", "q"), ("page_offset", "q"),
+    ("dtlb_tag", "q"), ("dtlb_index", "q"), ("dtlb_hit", "b"), ("page_table_hit", "b"), ("ppn", "q"),
+    ("dc_tag", "q"), ("dc_index", "q"), ("dc_hit", "b"),
+    ("l2_tag", "q"), ("l2_index", "q"), ("l2_hit", "b"),
+)
+# AccessLine attribute behind each field
+_ATTRIBUTES = ("address", "vpn", "page_offset", "dtlb_tag", "dtlb_index", "dtlb_result", "page_table_result", "ppn",
+               "dc_tag", "dc_index", "dc_result", "l2_tag", "l2_index", "l2_result")
+_FORMATS = {"binary", "csv"}
+
+
+def format_line(line):
+    """
+    Render an AccessLine exactly like AccessLine.__str__ with one expression instead of a helper call per field
+    :param line: AccessLine
+    :return: string
+    """
+    vpn, page_offset, dtlb_tag, dtlb_index = line.vpn, line.page_offset, line.dtlb_tag, line.dtlb_index
+    dtlb_result, page_table_result, ppn = line.dtlb_result, line.page_table_result, line.ppn
+    dc_tag, dc_index, dc_result = line.dc_tag, line.dc_index, line.dc_result
+    l2_tag, l2_index, l2_result = line.l2_tag, line.l2_index, line.l2_result
+    return (f"{line.address:08x} "
+            f"{'      ' if vpn is None else format(vpn, '>6x')} "
+            f"{'    ' if page_offset is None else format(page_offset, '>4x')} "
+            f"{'      ' if dtlb_tag is None else format(dtlb_tag, '>6x')} "
+            f"{'   ' if dtlb_index is None else format(dtlb_index, '>3x')} "
+            f"{'    ' if dtlb_result is None else (' hit' if dtlb_result else 'miss')} "
+            f"{'    ' if page_table_result is None else (' hit' if page_table_result else 'miss')} "
+            f"{'    ' if ppn is None else format(ppn, '>4x')} "
+            f"{'      ' if dc_tag is None else format(dc_tag, '>6x')} "
+            f"{'   ' if dc_index is None else format(dc_index, '>3x')} "
+            f"{'    ' if dc_result is None else (' hit' if dc_result else 'miss')} "
+            f"{'      ' if l2_tag is None else format(l2_tag, '>6x')} "
+            f"{'   ' if l2_index is None else format(l2_index, '>3x')} "
+            f"{'    ' if l2_result is None else (' hit' if l2_result else 'miss')}")
+
+
+class TextLineWriter:
+    """
+    Writes the fixed width per access table through a buffer. Lines are formatted with format_line and written
+    a batch at a time as one joined string, instead of one print call per access.
+    """
+    def __init__(self, out, buffer_lines=8192):
+        """
+        :param out: open text file, usually sys.stdout
+        :param buffer_lines: lines held before a write
+        """
+        self.out = out
+        self.buffer_lines = buffer_lines
+        self._buffer = []
+
+    def write(self, line):
+        """
+        Queue one access
+        :param line: AccessLine
+        """
+        self._buffer.append(format_line(line))
+        if len(self._buffer) >= self.buffer_lines:
+            self.flush()
+
+    def write_text(self, text):
+        """
+        Queue a message that has to stay in order with the table rows
+        """
+        self._buffer.append(text)
+        if len(self._buffer) >= self.buffer_lines:
+            self.flush()
+
+    def flush(self):
+        if self._buffer:
+            self._buffer.append("")
+            self.out.write("\n".join(self._buffer))
+            self._buffer = []
+        self.out.flush()
+
+
+class ColumnarAccessWriter:
+    """
+    Writes the raw fields of every access as columns, for tools that load them directly instead of parsing the
+    text table. The binary format is a header, then chunks of a record count followed by each column's array in
+    FIELDS order, then a json trailer with the field list and run metadata. The csv format is one row per access
+    with empty cells for missing fields and 1/0 flags.
+    """
+    def __init__(self, path, fmt=None, chunk_size=1 << 16):
+        """
+        :param path: output file path
+        :param fmt: "binary" or "csv", defaults to csv for a .csv path and binary otherwise
+        :param chunk_size: accesses held before a chunk is written
+        """
+        self.path = path
+        self.fmt = fmt or ("csv" if path.endswith(".csv") else "binary")
+        if self.fmt not in _FORMATS:
+            raise ValueError(f"Unknown access column format: {self.fmt}")
+        self.chunk_size = chunk_size
+        self.records = 0
+        if self.fmt == "csv":
+            self._file = open(path, "w", newline="")
+            self._csv = csv.writer(self._file)
+            self._csv.writerow([name for name, _ in FIELDS])
+        else:
+            self._file = open(path, "wb")
+            self._file.write(_HEADER.pack(MAGIC, VERSION, 0))
+        self._columns = [array(typecode) for _, typecode in FIELDS]
+        self._appends = [column.append for column in self._columns]
+
+    def write(self, line):
+        """
+        Add one access
+        :param line: AccessLine
+        """
+        for append, attribute in zip(self._appends, _ATTRIBUTES):
+            value = getattr(line, attribute)
+            append(-1 if value is None else int(value))
+        if len(self._columns[0]) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        count = len(self._columns[0])
+        if not count:
+            return
+        if self.fmt == "csv":
+            self._csv.writerows([["" if value == -1 else value for value in row] for row in zip(*self._columns)])
+        else:
+            self._file.write(_COUNT.pack(count))
+            for column in self._columns:
+                column.tofile(self._file)
+        self.records += count
+        self._columns = [array(typecode) for _, typecode in FIELDS]
+        self._appends = [column.append for column in self._columns]
+
+    def close(self, metadata=None):
+        """
+        Write the remaining accesses and, for the binary format, the trailer
+        :param metadata: json serializable dict stored in the binary trailer
+        :return: None
+        """
+        self._flush()
+        if self.fmt == "binary":
+            trailer_offset = self._file.tell()
+            self._file.write(_COUNT.pack(0))
+            self._file.write(json.dumps(dict(metadata or {}, fields=FIELDS, records=self.records)).encode())
+            self._file.seek(0)
+            self._file.write(_HEADER.pack(MAGIC, VERSION, trailer_offset))
+        self._file.close()
+
+
+class ColumnarAccessReader:
+    """
+    Reads a binary file written by ColumnarAccessWriter
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            magic, version, trailer_offset = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not an access column file")
+            if version != VERSION:
+                raise ValueError(f"{path} has access column version {version}, expected {VERSION}")
+            if trailer_offset == 0:
+                raise ValueError(f"{path} was not closed, the run did not finish")
+            f.seek(trailer_offset + _COUNT.size)
+            self.metadata = json.loads(f.read().decode())
+        self._trailer_offset = trailer_offset
+
+    def iter_chunks(self):
+        """
+        Stream the columns a chunk at a time
+        :return: generator of dicts of field name to array
+        """
+        with open(self.path, "rb") as f:
+            f.seek(_HEADER.size)
+            while f.tell() < self._trailer_offset:
+                count, = _COUNT.unpack(f.read(_COUNT.size))
+                chunk = {}
+                for name, typecode in FIELDS:
+                    column = array(typecode)
+                    column.fromfile(f, count)
+                    chunk[name] = column
+                yield chunk
+
+    def columns(self):
+        """
+        Every column in full
+        :return: dict of field name to numpy array when numpy is installed, array otherwise
+        """
+        columns = {name: array(typecode) for name, typecode in FIELDS}
+        for chunk in self.iter_chunks():
+            for name, column in chunk.items():
+                columns[name].extend(column)
+        if np is not None:
+            return {name: np.frombuffer(column, dtype=np.int64 if column.typecode == "q" else np.int8)
+                    for name, column in columns.items()}
+        return columns
@@ -0,0 +1,104 @@
+import csv
+import json
+
+
+def interval_counters(simulator):
+    """
+    Cumulative counters of a simulator, read straight off the levels
+    :param simulator: MemoryHierarchySimulator
+    :return: dict of counter name to int, the same names for the whole run
+    """
+    counters = {}
+    if simulator.dtlb:
+        cache = simulator.dtlb.dtlb_cache
+        counters["dtlb_hits"] = cache.read_hits + cache.write_hits
+        counters["dtlb_misses"] = cache.read_misses + cache.write_misses
+    if simulator.pt:
+        page_table = simulator.pt.page_table
+        counters["pt_hits"] = page_table.hits
+        counters["pt_misses"] = page_table.misses
+    for name in ("dc", "l2"):
+        level = getattr(simulator, name)
+        if level is None:
+            continue
+        cache = level.cache
+        counters[f"{name}_hits"] = cache.read_hits + cache.write_hits
+        counters[f"{name}_misses"] = cache.read_misses + cache.write_misses
+        counters[f"{name}_evictions"] = cache.evictions
+        counters[f"{name}_writebacks"] = cache.write_backs
+    counters["mem_reads"] = simulator.memory.reads
+    counters["mem_writes"] = simulator.memory.writes
+    if simulator.pt:
+        counters["disk_refs"] = simulator.pt.page_table.disk_references
+    return counters
+
+
+class IntervalSeriesWriter:
+    """
+    Streams per interval counter deltas to a JSONL or CSV file, one row every interval accesses plus one for
+    a final partial interval. Only the previous interval's cumulative counters are kept, rows go straight to
+    the file and are flushed so a long run can be followed while it goes.
+    """
+    def __init__(self, path, interval, fmt=None):
+        """
+        :param path: output file path
+        :param interval: accesses per row
+        :param fmt: "jsonl" or "csv", defaults to csv for a .csv path and jsonl otherwise
+        """
+        if interval < 1:
+            raise ValueError("Metrics interval must be at least 1.")
+        self.path = path
+        self.interval = interval
+        self.fmt = fmt or ("csv" if path.endswith(".csv") else "jsonl")
+        if self.fmt not in ("jsonl", "csv"):
+            raise ValueError(f"Unknown metrics format: {self.fmt}")
+        self._file = open(path, "w", newline="")
+        self._csv = None
+        self._last = None
+        self.remaining = interval
+        self.position = 0
+        self.rows = 0
+
+    def start(self, simulator, position=0):
+        """
+        Take the baseline counters before the first access
+        :param position: accesses of the trace already simulated, for a resumed run
+        """
+        self._last = interval_counters(simulator)
+        self.position = position
+
+    def advance(self, simulator, accesses):
+        """
+        Count accesses that just ran, they must not cross the end of the current interval
+        :param accesses: at most self.remaining
+        :return: None
+        """
+        self.position += accesses
+        self.remaining -= accesses
+        if self.remaining == 0:
+            self._write_row(simulator, self.interval)
+            self.remaining = self.interval
+
+    def _write_row(self, simulator, accesses):
+        current = interval_counters(simulator)
+        row = {"interval": self.rows, "end": self.position, "accesses": accesses}
+        for name, value in current.items():
+            row[name] = value - self._last[name]
+        self._last = current
+        if self.fmt == "csv":
+            if self._csv is None:
+                self._csv = csv.DictWriter(self._file, fieldnames=list(row))
+                self._csv.writeheader()
+            self._csv.writerow(row)
+        else:
+            self._file.write(json.dumps(row) + "\n")
+        self._file.flush()
+        self.rows += 1
+
+    def close(self, simulator):
+        """
+        Write the final partial interval, if any, and close the file
+        """
+        if self.remaining != self.interval:
+            self._write_row(simulator, self.interval - self.remaining)
+        self._file.close()
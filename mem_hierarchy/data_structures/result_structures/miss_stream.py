@@ -0,0 +1,133 @@
+import json
+import struct
+from array import array
+
+MAGIC = b"MISSSTRM"
+VERSION = 1
+# magic, version, offset of the json trailer
+_HEADER = struct.Struct("<8sHQ")
+_COUNT = struct.Struct("<I")
+
+# record kinds, one byte each
+READ = 0                    # read miss, lower read
+RFO = 1                     # write miss read for ownership
+WRITE_THROUGH = 2           # write-through store
+WRITEBACK = 3               # dirty eviction writeback
+INCLUSION_WRITEBACK = 4     # dirty line dropped by a lower eviction
+PAGE_WRITEBACK = 5          # dirty line written back on a page eviction
+PASS_THROUGH_WRITEBACK = 6  # writeback from above that missed and passed through
+TOUCH = 7                   # read hit, lower level recency update only
+EVICT = 8                   # line left the cache, not sent down, keeps replay residency in step
+PAGE_EVICTED = 9            # page eviction published, address field holds the ppn
+PREFETCH = 10               # prefetch fill, lower read that is not a demand access
+
+# origin tags the recording level passes to its lower level, prefixed with the level name
+ORIGINS = {
+    READ: " read miss so lower read",
+    RFO: " write miss RFO",
+    WRITE_THROUGH: " write needs lower write",
+    WRITEBACK: " write back dirty eviction",
+    INCLUSION_WRITEBACK: " inclusion dirty writeback",
+    PAGE_WRITEBACK: " page eviction writeback",
+    PASS_THROUGH_WRITEBACK: " pass-through writeback",
+    TOUCH: " read hit lower touch",
+    EVICT: " eviction",
+    PAGE_EVICTED: " page evicted",
+    PREFETCH: " prefetch",
+}
+WRITEBACK_KINDS = frozenset((WRITEBACK, INCLUSION_WRITEBACK, PAGE_WRITEBACK, PASS_THROUGH_WRITEBACK))
+
+
+class MissStreamWriter:
+    """
+    Writes the stream a cache level sends to its lower level as fixed width binary records, one kind byte and one
+    32 bit address each, in chunks. Run level metadata goes in a json trailer when the writer is closed.
+    Repeated touches of the same block with nothing in between only move that block to MRU again, so they are
+    collapsed into one record.
+    """
+    def __init__(self, path, block_offset_bits, chunk_size=1 << 16):
+        self.path = path
+        self.chunk_size = chunk_size
+        self._block_mask = ~((1 << block_offset_bits) - 1)
+        self._file = open(path, 'wb')
+        self._file.write(_HEADER.pack(MAGIC, VERSION, 0))
+        self._kinds = bytearray()
+        self._addresses = array('I')
+        self._last_kind = None
+        self._last_address = None
+        self.records = 0
+
+    def record(self, kind, address):
+        if kind == TOUCH and self._last_kind in (TOUCH, READ) and \
+                (address ^ self._last_address) & self._block_mask == 0:
+            return
+        if kind == PAGE_EVICTED and self._last_kind == PAGE_EVICTED and address == self._last_address:
+            # the DTLB miss path publishes the same eviction twice
+            return
+        self._last_kind = kind
+        self._last_address = address
+        self._kinds.append(kind)
+        self._addresses.append(address)
+        if len(self._kinds) >= self.chunk_size:
+            self._flush()
+
+    def _flush(self):
+        if not self._kinds:
+            return
+        self._file.write(_COUNT.pack(len(self._kinds)))
+        self._file.write(self._kinds)
+        self._addresses.tofile(self._file)
+        self.records += len(self._kinds)
+        self._kinds = bytearray()
+        self._addresses = array('I')
+
+    def close(self, metadata):
+        """
+        Flush the remaining records and write the metadata trailer
+        :param metadata: json serializable dict
+        :return: None
+        """
+        self._flush()
+        trailer_offset = self._file.tell()
+        self._file.write(_COUNT.pack(0))
+        self._file.write(json.dumps(dict(metadata, records=self.records)).encode())
+        self._file.seek(0)
+        self._file.write(_HEADER.pack(MAGIC, VERSION, trailer_offset))
+        self._file.close()
+
+
+class MissStreamReader:
+    """
+    Reads a file written by MissStreamWriter, the metadata is available before the records are streamed
+    """
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as f:
+            magic, version, trailer_offset = _HEADER.unpack(f.read(_HEADER.size))
+            if magic != MAGIC:
+                raise ValueError(f"{path} is not a miss stream file")
+            if version != VERSION:
+                raise ValueError(f"{path} has miss stream version {version}, expected {VERSION}")
+            if trailer_offset == 0:
+                raise ValueError(f"{path} was not closed, the capture did not finish")
+            f.seek(trailer_offset + _COUNT.size)
+            self.metadata = json.loads(f.read().decode())
+        self._trailer_offset = trailer_offset
+
+    def iter_chunks(self):
+        """
+        Stream the records a chunk at a time
+        :return: generator of (kinds bytes, addresses array) pairs
+        """
+        with open(self.path, 'rb') as f:
+            f.seek(_HEADER.size)
+            while f.tell() < self._trailer_offset:
+                count, = _COUNT.unpack(f.read(_COUNT.size))
+                kinds = f.read(count)
+                addresses = array('I')
+                addresses.fromfile(f, count)
+                yield kinds, addresses
+
+    def __iter__(self):
+        for kinds, addresses in self.iter_chunks():
+            yield from zip(kinds, addresses)
@@ -1,3 +1,4 @@
+from mem_hierarchy import tracepoints
 #from mem_hierarchy.data_structures.result_structures.access_results import EvictedPageTableEntry, TranslationResult
 
 class EvictedPageTableEntry:
@@ -49,6 +50,8 @@ class PageTable:
         self.free_ppns = [elem for elem in range(self.n_physical_pages)]
         #self.free_ppns = [format(elem, f'0{self.ppn_bits}b') for elem in range(self.n_physical_pages)]
         self.lru_ppns = []
+        # Tracepoints to fire on page faults and evictions, None while nobody subscribes
+        self.tracer = None
 
         # stats for tracking
         self.hits = 0
@@ -111,6 +114,14 @@ class PageTable:
         """
         return ((ppn & self._ppn_mask) << self.page_offset_bits | (offset & self._offset_mask)) & self._phys_mask
 
+    def is_mapped(self, virtual_address):
+        """
+        Check if the page of a virtual address is resident, without counting an access
+        :param virtual_address: int
+        :return: boolean
+        """
+        return self.parse_address(virtual_address)[1] in self.vpn_to_ppn
+
     def translate(self, virtual_address):
         """
         Translate a virtual address to a physical address
@@ -135,6 +146,11 @@ class PageTable:
         self.vpn_to_ppn[vpn] = ppn
         self.ppn_to_vpn[ppn] = vpn
         self._touch_ppn_mru(ppn)
+        if self.tracer is not None:
+            self.tracer.emit(tracepoints.PAGE_FAULT, "page table", vpn << self.page_offset_bits, vpn=vpn, ppn=ppn)
+            if evicted_entry is not None:
+                self.tracer.emit(tracepoints.PAGE_EVICTION, "page table", evicted_entry.vpn << self.page_offset_bits,
+                                 vpn=evicted_entry.vpn, ppn=evicted_entry.ppn)
         physical_address = self.build_physical_address(ppn, page_offset)
         return TranslationResult(False, vpn, ppn, physical_address, page_offset, evicted_entry=evicted_entry)
 
@@ -0,0 +1,84 @@
+from trace_parser import TraceParser
+from mem_hierarchy.simulator import MemoryHierarchySimulator
+from mem_hierarchy.data_structures.mem_levels.translation_front_end import TranslationFrontEnd
+
+
+def _vm_signature(config):
+    """
+    The config fields that decide translation, configs that agree on these can share a front end
+    """
+    signature = (config.virtual_addresses, config.address_bits)
+    if config.virtual_addresses:
+        signature += (config.pt.n_virtual_pages, config.pt.n_physical_pages, config.pt.page_size, config.dtlb_enabled)
+        if config.dtlb_enabled:
+            signature += (config.dtlb.num_sets, config.dtlb.associativity) + _index_signature(config.dtlb)
+    return signature
+
+
+def _index_signature(level_config):
+    """
+    A level's index function for a signature, empty for modulo so signatures from before hashed indexing still match
+    """
+    return () if level_config.index_function == "modulo" else (level_config.index_function,)
+
+
+def feed_translated(simulator, ops, physical_addresses, evictions):
+    """
+    Drive a simulator's caches with an already translated batch, publishing each page eviction after the accesses
+    that preceded it
+    :param simulator: MemoryHierarchySimulator built with a shared front end
+    :param ops: list of "R" or "W"
+    :param physical_addresses: list of int physical addresses
+    :param evictions: (position, EvictedPageTableEntry) markers from TranslationFrontEnd.translate_many
+    :return: None
+    """
+    start = 0
+    for position, evicted_entry in evictions:
+        if position > start:
+            simulator.top_level.access_many(ops[start:position], physical_addresses[start:position])
+            start = position
+        simulator.invalidation_bus.publish_page_evicted(evicted_entry)
+    if start < len(ops):
+        simulator.top_level.access_many(ops[start:], physical_addresses[start:])
+
+
+class FusedSimulator:
+    """
+    Simulates several cache configurations that share one VM config in a single trace pass. The trace is decoded
+    once and translated once by a shared DTLB and page table, then every hierarchy's DC/L2 chain is driven from
+    the same physical stream, with page evictions published to each hierarchy at the same point as a serial run.
+    """
+    def __init__(self, configs):
+        if not configs:
+            raise ValueError("At least one config is required.")
+        signature = _vm_signature(configs[0])
+        for config in configs[1:]:
+            if _vm_signature(config) != signature:
+                raise ValueError("Fused configs must share the same virtual memory and DTLB configuration.")
+        self.configs = configs
+        self.front_end = TranslationFrontEnd(configs[0]) if configs[0].virtual_addresses else None
+        self.simulators = [MemoryHierarchySimulator(config, front_end=self.front_end) for config in configs]
+
+    def simulate(self, trace, batch_size=4096):
+        """
+        Run the trace through every configuration
+        :param trace: trace file path
+        :return: list of stat dicts, one per config in order
+        """
+        address_bits = self.configs[0].address_bits
+        for ops, addrs in TraceParser(trace, addr_bits=address_bits).iter_batches(batch_size):
+            reads = 0
+            for operation in ops:
+                if operation == "R":
+                    reads += 1
+                elif operation != "W":
+                    raise ValueError(f"Unknown op: {operation}")
+            if self.front_end is not None:
+                ops, physical_addresses, evictions = self.front_end.translate_many(ops, addrs)
+            else:
+                physical_addresses, evictions = addrs, []
+            for simulator in self.simulators:
+                simulator.reads += reads
+                simulator.writes += len(ops) - reads
+                feed_translated(simulator, ops, physical_addresses, evictions)
+        return [simulator.finish() for simulator in self.simulators]
@@ -0,0 +1,310 @@
+import csv
+import io
+import json
+from array import array
+from bisect import bisect_left
+
+COUNTER = "counter"
+GAUGE = "gauge"
+HISTOGRAM = "histogram"
+# prefix of every exported prometheus metric
+NAMESPACE = "memhier"
+
+
+class Metric:
+    """
+    One registered counter or gauge, value holds what its source returned at the last collect. A metric registered
+    with a label in by holds one value per key of the dict its source returns, that key going under the label.
+    """
+    def __init__(self, name, kind, description, labels, source, by=None):
+        self.name = name
+        self.kind = kind
+        self.description = description
+        self.labels = labels
+        self.source = source
+        self.by = by
+        self.value = {} if by else 0
+
+    def samples(self):
+        """
+        :return: list of (labels, value)
+        """
+        if self.by is None:
+            return [(self.labels, self.value)]
+        return [(dict(self.labels, **{self.by: str(key)}), value) for key, value in sorted(self.value.items())]
+
+
+class Histogram:
+    """
+    Fixed bucket histogram, bucket counts in a preallocated array. Bounds are inclusive upper bounds, the last
+    bucket catches everything above them.
+    """
+    kind = HISTOGRAM
+
+    def __init__(self, name, description, bounds, labels, source):
+        self.name = name
+        self.description = description
+        self.bounds = list(bounds)
+        self.labels = labels
+        self.source = source
+        self.counts = array('q', [0] * (len(self.bounds) + 1))
+        self.sum = 0
+        self.count = 0
+
+    def observe(self, value, n=1):
+        self.counts[bisect_left(self.bounds, value)] += n
+        self.sum += value * n
+        self.count += n
+
+    def reset(self):
+        for i in range(len(self.counts)):
+            self.counts[i] = 0
+        self.sum = 0
+        self.count = 0
+
+    def cumulative(self):
+        """
+        :return: list of (upper bound, observations at or below it), ending with (inf, count)
+        """
+        buckets = []
+        total = 0
+        for bound, count in zip(self.bounds + [float("inf")], self.counts):
+            total += count
+            buckets.append((bound, total))
+        return buckets
+
+
+class ReportRow:
+    """
+    One line of the simulation statistics report, showing a metric's value
+    """
+    __slots__ = ("label", "key", "metric", "fmt", "gap", "when")
+
+    def __init__(self, label, key, metric, fmt=None, gap=False, when=None):
+        self.label = label
+        self.key = key
+        self.metric = metric
+        self.fmt = fmt
+        self.gap = gap
+        self.when = when
+
+    def value(self):
+        """
+        :return: the metric's value from the last collect, formatted with fmt when given
+        """
+        return self.metric.value if self.fmt is None else format(self.metric.value, self.fmt)
+
+
+class MetricsRegistry:
+    """
+    Named, typed metrics of a hierarchy. The levels keep their counts as attributes and register a source for
+    each, read only when the registry is collected, which keeps their access paths untouched. The levels also lay
+    out the simulation statistics report over their metrics, so pprint_stats and every exporter read the same
+    values.
+    """
+    def __init__(self):
+        self.metrics = []
+        self.rows = []
+        self._names = set()
+
+    def _check(self, name, labels):
+        key = (name, tuple(sorted(labels.items())))
+        if key in self._names:
+            raise ValueError(f"Metric already registered: {name} {labels}")
+        self._names.add(key)
+
+    def _register(self, name, kind, description, labels, source, by):
+        labels = labels or {}
+        self._check(name, labels)
+        metric = Metric(name, kind, description, labels, source, by)
+        self.metrics.append(metric)
+        return metric
+
+    def counter(self, name, description, labels=None, *, source, by=None):
+        """
+        Register a monotonically increasing count
+        :param source: callable returning the current value
+        :param by: label name, when given source returns a dict of that label's values to counts
+        :return: Metric
+        """
+        return self._register(name, COUNTER, description, labels, source, by)
+
+    def gauge(self, name, description, labels=None, *, source, by=None):
+        """
+        Register a value that can go up and down
+        """
+        return self._register(name, GAUGE, description, labels, source, by)
+
+    def histogram(self, name, description, bounds, labels=None, *, source):
+        """
+        Register a histogram
+        :param bounds: sorted inclusive bucket upper bounds
+        :param source: callable returning (value, count) observations to rebuild it from
+        :return: Histogram
+        """
+        labels = labels or {}
+        self._check(name, labels)
+        histogram = Histogram(name, description, bounds, labels, source)
+        self.metrics.append(histogram)
+        return histogram
+
+    def get(self, name, labels=None):
+        """
+        A registered metric
+        :return: Metric or Histogram
+        """
+        labels = labels or {}
+        for metric in self.metrics:
+            if metric.name == name and metric.labels == labels:
+                return metric
+        raise ValueError(f"Metric not registered: {name} {labels}")
+
+    def report(self, label, key, metric, fmt=None, gap=False, when=None):
+        """
+        Add a line to the simulation statistics report, lines print in the order they are added
+        :param label: text before the colon, padded the way the report prints it
+        :param key: key of the value in the pprint_stats dict
+        :param metric: Metric the value comes from
+        :param fmt: format spec for the value, e.g. ".6f", None shows it as it is
+        :param gap: follow the line with a blank one, ending its group
+        :param when: callable, the line is left out when it returns false
+        :return: None
+        """
+        self.rows.append(ReportRow(label, key, metric, fmt, gap, when))
+
+    def collect(self):
+        """
+        Refresh every metric from its level
+        :return: self
+        """
+        for metric in self.metrics:
+            if metric.kind == HISTOGRAM:
+                metric.reset()
+                for value, count in metric.source():
+                    metric.observe(value, count)
+            elif metric.by is not None:
+                metric.value = dict(metric.source())
+            else:
+                metric.value = metric.source()
+        return self
+
+    def samples(self):
+        """
+        Flat (name, labels, value) samples, histograms expand to _bucket, _sum, and _count
+        """
+        for metric in self.metrics:
+            if metric.kind == HISTOGRAM:
+                for bound, total in metric.cumulative():
+                    yield f"{metric.name}_bucket", dict(metric.labels, le=_format_bound(bound)), total
+                yield f"{metric.name}_sum", metric.labels, metric.sum
+                yield f"{metric.name}_count", metric.labels, metric.count
+            else:
+                for labels, value in metric.samples():
+                    yield metric.name, labels, value
+
+
+def _format_bound(bound):
+    return "+Inf" if bound == float("inf") else str(bound)
+
+
+def _format_labels(labels):
+    return ",".join(f'{key}="{value}"' for key, value in labels.items())
+
+
+def _report_rows(registry):
+    return [row for row in registry.rows if row.when is None or row.when()]
+
+
+def report_stats(registry):
+    """
+    Values of the simulation statistics report by stat key, as pprint_stats returns them
+    :return: dict
+    """
+    return {row.key: row.value() for row in _report_rows(registry)}
+
+
+def export_text(registry):
+    """
+    The simulation statistics report
+    :return: string
+    """
+    text = ""
+    for row in _report_rows(registry):
+        text += f"{row.label}: {row.value()}\n"
+        if row.gap:
+            text += "\n"
+    return text
+
+
+def export_json(registry):
+    metrics = []
+    for metric in registry.metrics:
+        entry = {"name": metric.name, "type": metric.kind, "help": metric.description, "labels": metric.labels}
+        if metric.kind == HISTOGRAM:
+            entry["buckets"] = [[_format_bound(bound), total] for bound, total in metric.cumulative()]
+            entry["sum"] = metric.sum
+            entry["count"] = metric.count
+        elif metric.by is not None:
+            entry["by"] = metric.by
+            entry["values"] = {str(key): value for key, value in sorted(metric.value.items())}
+        else:
+            entry["value"] = metric.value
+        metrics.append(entry)
+    return json.dumps(metrics, indent=4) + "\n"
+
+
+def export_csv(registry):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(["name", "labels", "value"])
+    for name, labels, value in registry.samples():
+        writer.writerow([name, _format_labels(labels), value])
+    return out.getvalue()
+
+
+def export_prometheus(registry):
+    """
+    Prometheus text exposition format
+    :return: string
+    """
+    families = {}
+    for metric in registry.metrics:
+        families.setdefault(metric.name, []).append(metric)
+    lines = []
+    # every sample of a family has to follow its HELP and TYPE lines
+    for family in families.values():
+        name = f"{NAMESPACE}_{family[0].name}"
+        if family[0].kind == COUNTER:
+            name += "_total"
+        lines.append(f"# HELP {name} {family[0].description}")
+        lines.append(f"# TYPE {name} {family[0].kind}")
+        for metric in family:
+            labels = f"{{{_format_labels(metric.labels)}}}" if metric.labels else ""
+            if metric.kind == HISTOGRAM:
+                for bound, total in metric.cumulative():
+                    lines.append(f"{name}_bucket{{{_format_labels(dict(metric.labels, le=_format_bound(bound)))}}} "
+                                 f"{total}")
+                lines.append(f"{name}_sum{labels} {metric.sum}")
+                lines.append(f"{name}_count{labels} {metric.count}")
+            else:
+                for sample_labels, value in metric.samples():
+                    sample_labels = f"{{{_format_labels(sample_labels)}}}" if sample_labels else ""
+                    lines.append(f"{name}{sample_labels} {value}")
+    return "\n".join(lines) + "\n"
+
+
+EXPORTERS = {"text": export_text, "json": export_json, "csv": export_csv, "prometheus": export_prometheus}
+
+
+def write_metrics(registry, path, fmt=None):
+    """
+    Collect and export a registry to a file
+    :param fmt: one of EXPORTERS, defaults from the extension (.json, .csv, .prom) and text otherwise
+    :return: None
+    """
+    if fmt is None:
+        fmt = {".json": "json", ".csv": "csv", ".prom": "prometheus"}.get(path[path.rfind("."):], "text")
+    if fmt not in EXPORTERS:
+        raise ValueError(f"Unknown metrics format: {fmt}")
+    with open(path, "w", newline="") as f:
+        f.write(EXPORTERS[fmt](registry.collect()))
@@ -0,0 +1,196 @@
+import multiprocessing
+import queue
+import struct
+from array import array
+from trace_parser import TraceParser
+from mem_hierarchy.simulator import MemoryHierarchySimulator
+from mem_hierarchy.fused import feed_translated
+from mem_hierarchy.data_structures.mem_levels.translation_front_end import TranslationFrontEnd
+from mem_hierarchy.data_structures.virtual_mem.page_table import EvictedPageTableEntry
+
+# slot header: number of accesses, number of eviction markers
+_SLOT_HEADER = struct.Struct("<II")
+# accesses value of the slot that ends the stream
+_END = 0xFFFFFFFF
+# seconds to wait on the ring before checking that the other stage is still alive
+_POLL_INTERVAL = 1.0
+
+
+class RingBuffer:
+    """
+    Single producer, single consumer ring of fixed size slots in shared memory. Each slot holds one translated
+    batch: the operation bytes, 32 bit physical addresses, and (position, ppn, vpn) page eviction markers.
+    Two semaphores count the free and the filled slots.
+    """
+    def __init__(self, batch_size, slots=8, context=None):
+        context = context or multiprocessing.get_context()
+        self.batch_size = batch_size
+        self.slots = slots
+        # ops, addresses, and at most one eviction marker per access
+        self.slot_size = _SLOT_HEADER.size + batch_size * (1 + 4 + 12)
+        self.shm = context.RawArray('b', self.slot_size * slots)
+        self.free = context.Semaphore(slots)
+        self.filled = context.Semaphore(0)
+        self._next = 0
+
+    def _acquire(self, semaphore, peer):
+        while not semaphore.acquire(timeout=_POLL_INTERVAL):
+            if peer is not None and not peer.is_alive():
+                raise RuntimeError("pipeline stage exited before the trace was finished")
+
+    def put(self, ops, addrs, evictions, peer=None):
+        """
+        Write one batch into the next slot, blocking while the ring is full
+        :param ops: list of "R" or "W"
+        :param addrs: list of int physical addresses
+        :param evictions: list of (position, EvictedPageTableEntry)
+        :param peer: consumer process to watch while blocked
+        :return: None
+        """
+        self._acquire(self.free, peer)
+        view = memoryview(self.shm).cast('B')
+        offset = self._next * self.slot_size
+        n = len(ops)
+        _SLOT_HEADER.pack_into(view, offset, n, len(evictions))
+        offset += _SLOT_HEADER.size
+        view[offset:offset + n] = "".join(ops).encode()
+        offset += n
+        view[offset:offset + 4 * n] = array('I', addrs).tobytes()
+        offset += 4 * n
+        markers = array('I')
+        for position, evicted_entry in evictions:
+            markers.extend((position, evicted_entry.ppn, evicted_entry.vpn))
+        view[offset:offset + 4 * len(markers)] = markers.tobytes()
+        view.release()
+        self._next = (self._next + 1) % self.slots
+        self.filled.release()
+
+    def close(self, peer=None):
+        """
+        Mark the end of the stream
+        """
+        self._acquire(self.free, peer)
+        view = memoryview(self.shm).cast('B')
+        _SLOT_HEADER.pack_into(view, self._next * self.slot_size, _END, 0)
+        view.release()
+        self.filled.release()
+
+    def get(self, page_offset_bits, peer=None):
+        """
+        Read the next batch, blocking while the ring is empty
+        :param page_offset_bits: carried into the rebuilt EvictedPageTableEntry markers
+        :param peer: producer process to watch while blocked
+        :return: (ops, addrs, evictions), or None at the end of the stream
+        """
+        self._acquire(self.filled, peer)
+        view = memoryview(self.shm).cast('B')
+        offset = self._next * self.slot_size
+        n, n_evictions = _SLOT_HEADER.unpack_from(view, offset)
+        if n == _END:
+            view.release()
+            return None
+        offset += _SLOT_HEADER.size
+        ops = list(bytes(view[offset:offset + n]).decode())
+        offset += n
+        addrs = array('I', bytes(view[offset:offset + 4 * n])).tolist()
+        offset += 4 * n
+        markers = array('I', bytes(view[offset:offset + 12 * n_evictions]))
+        view.release()
+        evictions = [(markers[i], EvictedPageTableEntry(markers[i + 1], markers[i + 2], page_offset_bits))
+                     for i in range(0, len(markers), 3)]
+        self._next = (self._next + 1) % self.slots
+        self.free.release()
+        return ops, addrs, evictions
+
+
+def _translation_stage(config, trace, ring, results, batch_size):
+    """
+    Stage 1: parse and translate the trace, then hand the DTLB and page table back for their stats
+    """
+    try:
+        front_end = TranslationFrontEnd(config)
+        for ops, addrs in TraceParser(trace, addr_bits=config.address_bits).iter_batches(batch_size):
+            for operation in ops:
+                if operation not in ("R", "W"):
+                    raise ValueError(f"Unknown op: {operation}")
+            ring.put(*front_end.translate_many(ops, addrs))
+        ring.close()
+        results.put((front_end.dtlb, front_end.pt))
+    except Exception as e:
+        results.put(e)
+
+
+def _wait_result(results, stage):
+    """
+    Wait for what the translation stage hands back, noticing if it dies without a word
+    """
+    while True:
+        try:
+            return results.get(timeout=_POLL_INTERVAL)
+        except queue.Empty:
+            if not stage.is_alive():
+                try:
+                    return results.get_nowait()
+                except queue.Empty:
+                    raise RuntimeError(f"translation stage exited with code {stage.exitcode}") from None
+
+
+class PipelinedSimulator:
+    """
+    Runs a virtual address config as two pipelined processes. Translation never depends on the caches, so a child
+    process runs the DTLB and page table and streams physical addresses plus page eviction markers through a
+    shared ring buffer, while this process applies the evictions and runs the DC, L2, and memory in the same order
+    a serial run would. Physically addressed configs have nothing to split off and run serially.
+    """
+    def __init__(self, config, batch_size=4096, slots=8):
+        self.config = config
+        self.batch_size = batch_size
+        self.slots = slots
+        if config.virtual_addresses:
+            # stands in for the translation levels until stage 1 hands back its own
+            self.simulator = MemoryHierarchySimulator(config, front_end=TranslationFrontEnd(config))
+        else:
+            self.simulator = MemoryHierarchySimulator(config)
+
+    def simulate(self, trace):
+        """
+        Simulate a trace
+        :param trace: trace file path
+        :return: the pprint_stats dict
+        """
+        simulator = self.simulator
+        if not self.config.virtual_addresses:
+            return simulator.simulate(trace, verbose=False, batch_size=self.batch_size)
+        context = multiprocessing.get_context()
+        ring = RingBuffer(self.batch_size, self.slots, context)
+        results = context.Queue()
+        stage = context.Process(target=_translation_stage, args=(self.config, trace, ring, results, self.batch_size),
+                                daemon=True)
+        stage.start()
+        page_offset_bits = self.config.bits.page_offset_bits
+        try:
+            while True:
+                try:
+                    batch = ring.get(page_offset_bits, peer=stage)
+                except RuntimeError:
+                    # the stage stopped early, it reports why on the results queue
+                    break
+                if batch is None:
+                    break
+                ops, physical_addresses, evictions = batch
+                reads = ops.count("R")
+                simulator.reads += reads
+                simulator.writes += len(ops) - reads
+                feed_translated(simulator, ops, physical_addresses, evictions)
+            result = _wait_result(results, stage)
+        except BaseException:
+            stage.terminate()
+            raise
+        finally:
+            stage.join()
+        if isinstance(result, Exception):
+            raise result
+        simulator.dtlb, simulator.pt = result
+        # the registry's sources still read the stage's levels from before they were pickled over
+        simulator.metrics = simulator._register_metrics()
+        return simulator.finish()
@@ -0,0 +1,205 @@
+import cProfile
+import sys
+import time
+from contextlib import contextmanager
+from trace_parser import TraceParser
+from mem_hierarchy.data_structures.result_structures.access_results import AccessLine
+from mem_hierarchy.data_structures.result_structures import access_output
+
+# phases in report order, also the frame names of the collapsed stacks
+PARSE = "parse"
+DTLB = "dtlb"
+PAGE_TABLE = "page_table"
+DC = "dc"
+L2 = "l2"
+MAIN_MEMORY = "main_memory"
+INVALIDATION_BUS = "invalidation_bus"
+OUTPUT = "output"
+PHASES = (PARSE, DTLB, PAGE_TABLE, DC, L2, MAIN_MEMORY, INVALIDATION_BUS, OUTPUT)
+# root frame of the collapsed stacks, its self time is the simulator's own loop and bookkeeping
+ROOT = "simulate"
+
+
+class _TimedOutput:
+    """
+    Stands in for sys.stdout so writing the rendered lines counts as output
+    """
+    def __init__(self, profiler, out):
+        self._profiler = profiler
+        self._out = out
+
+    def write(self, text):
+        self._profiler.enter(OUTPUT)
+        try:
+            return self._out.write(text)
+        finally:
+            self._profiler.exit()
+
+    def __getattr__(self, name):
+        return getattr(self._out, name)
+
+
+class PhaseProfiler:
+    """
+    Attributes wall time and call counts of a run to the phases of the hierarchy: trace parsing, DTLB probes,
+    page table translation, each data cache, main memory, invalidation bus dispatch, and output rendering.
+    The entry points of each level are wrapped on the instances for the length of the run with monotonic
+    timers on a phase stack, so every phase gets its self time only, the time spent in a lower level is that
+    level's. Nothing is wrapped outside of run, so an unprofiled simulator pays nothing.
+
+    In batch mode the page table level probes the DTLB inline, those probes count as page_table.
+    """
+    def __init__(self):
+        self.self_ns = dict.fromkeys(PHASES, 0)
+        self.calls = dict.fromkeys(PHASES, 0)
+        # ";" joined phase stack to self time, for the collapsed stack output
+        self.stacks = {}
+        self.wall_ns = 0
+        self._stack = []
+        self._clock = time.perf_counter_ns
+
+    def enter(self, phase):
+        self._stack.append([phase, self._clock(), 0])
+
+    def exit(self):
+        now = self._clock()
+        phase, started, children = self._stack.pop()
+        elapsed = now - started
+        self.self_ns[phase] += elapsed - children
+        self.calls[phase] += 1
+        key = ";".join([ROOT] + [frame[0] for frame in self._stack] + [phase])
+        self.stacks[key] = self.stacks.get(key, 0) + elapsed - children
+        if self._stack:
+            self._stack[-1][2] += elapsed
+
+    def _wrap(self, phase, method):
+        stack = self._stack
+
+        def timed(*args, **kwargs):
+            # a level calling back into itself (access_many falling back to access) stays one call
+            if stack and stack[-1][0] == phase:
+                return method(*args, **kwargs)
+            self.enter(phase)
+            try:
+                return method(*args, **kwargs)
+            finally:
+                self.exit()
+        return timed
+
+    def _timed_iter(self, phase, iterable):
+        iterator = iter(iterable)
+        while True:
+            self.enter(phase)
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                self.exit()
+            yield item
+
+    def _targets(self, simulator):
+        """
+        (object, method name, phase) for every entry point timed on a simulator
+        """
+        targets = []
+        if simulator.dtlb:
+            targets += [(simulator.dtlb, "access", DTLB), (simulator.dtlb, "access_many", DTLB)]
+        if simulator.pt:
+            targets += [(simulator.pt, "access", PAGE_TABLE), (simulator.pt, "access_many", PAGE_TABLE),
+                        (simulator.pt.page_table, "translate", PAGE_TABLE),
+                        (simulator.pt.invalidation_bus, "publish_page_evicted", INVALIDATION_BUS)]
+        else:
+            targets.append((simulator.invalidation_bus, "publish_page_evicted", INVALIDATION_BUS))
+        targets += [(simulator.dc, "access", DC), (simulator.dc, "access_many", DC)]
+        if simulator.l2:
+            targets += [(simulator.l2, "access", L2), (simulator.l2, "access_many", L2)]
+        targets += [(simulator.memory, "access", MAIN_MEMORY), (simulator.memory, "access_many", MAIN_MEMORY)]
+        return targets
+
+    @contextmanager
+    def _instrumented(self, simulator):
+        targets = self._targets(simulator)
+        # methods already wrapped on the instance (a TimingModel attached around this run) are put back after
+        previous = [owner.__dict__.get(name) for owner, name, _ in targets]
+        for owner, name, phase in targets:
+            setattr(owner, name, self._wrap(phase, getattr(owner, name)))
+        # the simulator builds its own parser and renders lines itself, so those are timed on the classes
+        profiler = self
+        parser_iter = TraceParser.__iter__
+        parser_batches = TraceParser.iter_batches
+        line_str = AccessLine.__str__
+        format_line = access_output.format_line
+        TraceParser.__iter__ = lambda parser: profiler._timed_iter(PARSE, parser_iter(parser))
+        TraceParser.iter_batches = lambda parser, batch_size=4096: profiler._timed_iter(
+            PARSE, parser_batches(parser, batch_size))
+        AccessLine.__str__ = self._wrap(OUTPUT, line_str)
+        access_output.format_line = self._wrap(OUTPUT, format_line)
+        stdout = sys.stdout
+        sys.stdout = _TimedOutput(self, stdout)
+        try:
+            yield
+        finally:
+            sys.stdout = stdout
+            TraceParser.__iter__ = parser_iter
+            TraceParser.iter_batches = parser_batches
+            AccessLine.__str__ = line_str
+            access_output.format_line = format_line
+            for (owner, name, _), method in zip(targets, previous):
+                if method is None:
+                    delattr(owner, name)
+                else:
+                    setattr(owner, name, method)
+
+    def run(self, simulator, trace, pstats_path=None, **kwargs):
+        """
+        Simulate a trace with every phase timed
+        :param simulator: MemoryHierarchySimulator
+        :param trace: trace file path
+        :param pstats_path: when given, also run under cProfile and dump its stats to this file
+        :param kwargs: passed on to simulator.simulate
+        :return: the stats dict from simulate
+        """
+        cprofile = cProfile.Profile() if pstats_path else None
+        with self._instrumented(simulator):
+            started = self._clock()
+            if cprofile is not None:
+                cprofile.enable()
+            try:
+                stats = simulator.simulate(trace, **kwargs)
+            finally:
+                if cprofile is not None:
+                    cprofile.disable()
+                self.wall_ns += self._clock() - started
+        if cprofile is not None:
+            cprofile.dump_stats(pstats_path)
+        return stats
+
+    def format(self):
+        """
+        Per phase calls, self time, and share of the wall time, with what no phase claims as the simulator's own
+        :return: string
+        """
+        lines = [f"{'phase':<18s} {'calls':>10s} {'time (s)':>10s} {'share':>7s}"]
+        wall = self.wall_ns or 1
+        for phase in PHASES:
+            if self.calls[phase]:
+                lines.append(f"{phase:<18s} {self.calls[phase]:>10d} {self.self_ns[phase] / 1e9:>10.4f} "
+                             f"{100 * self.self_ns[phase] / wall:>6.1f}%")
+        own = self.wall_ns - sum(self.self_ns.values())
+        lines.append(f"{ROOT:<18s} {'':>10s} {own / 1e9:>10.4f} {100 * own / wall:>6.1f}%")
+        lines.append(f"{'total':<18s} {'':>10s} {self.wall_ns / 1e9:>10.4f}")
+        return "\n".join(lines)
+
+    def write_collapsed(self, path):
+        """
+        Write the phase stacks in the collapsed format flamegraph.pl and speedscope read, one stack and its self
+        time in microseconds per line
+        :return: None
+        """
+        stacks = dict(self.stacks)
+        stacks[ROOT] = self.wall_ns - sum(self.self_ns.values())
+        with open(path, "w") as f:
+            for stack, ns in sorted(stacks.items()):
+                if ns // 1000 > 0:
+                    f.write(f"{stack} {ns // 1000}\n")
@@ -1,4 +1,9 @@
 from .invalidation_bus import InvalidationBus
 from .policies import InclusivePolicy, WriteBackWriteAllocate, WriteThroughNoWriteAllocate
+from .replacement import ReplacementPolicy, BeladyReplacement
+from .prefetchers import Prefetcher, NextLinePrefetcher, StridePrefetcher, StreamPrefetcher, PrefetchStats, \
+    make_prefetcher
 
-__all__ = ["InvalidationBus", "InclusivePolicy", "WriteBackWriteAllocate", "WriteThroughNoWriteAllocate"]
\ No newline at end of file
+__all__ = ["InvalidationBus", "InclusivePolicy", "WriteBackWriteAllocate", "WriteThroughNoWriteAllocate",
+           "ReplacementPolicy", "BeladyReplacement", "Prefetcher", "NextLinePrefetcher", "StridePrefetcher",
+           "StreamPrefetcher", "PrefetchStats", "make_prefetcher"]
\ No newline at end of file
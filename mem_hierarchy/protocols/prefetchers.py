@@ -0,0 +1,251 @@
+from abc import abstractmethod, ABC
+from collections import OrderedDict
+
+# regions the stride prefetcher keeps a stride for, least recently used dropped first
+STRIDE_TABLE_SIZE = 64
+# consecutive repeats of a stride before the stride prefetcher trusts it
+STRIDE_CONFIDENCE = 2
+# streams the stream prefetcher tracks at once, least recently used dropped first
+STREAM_TRACKERS = 16
+# lines from a stream's head a miss can be and still extend it
+STREAM_WINDOW = 16
+# accesses moving a stream the same way before it starts prefetching
+STREAM_CONFIRMATIONS = 2
+
+
+class Prefetcher(ABC):
+    """
+    Abstract base class for the hardware prefetchers a DataCacheLevel can drive. The level shows it every demand
+    access and fills the lines it asks for. Prefetchers work on block numbers and never cross a page, physical
+    pages next to each other in the address space are unrelated in the virtual one.
+    """
+    name = None
+
+    def __init__(self, offset_bits, page_bits, degree=1, distance=1):
+        """
+        :param offset_bits: offset bits of the cache's lines
+        :param page_bits: page offset bits, prefetches stay in the page of the access that set them off
+        :param degree: lines asked for per trigger
+        :param distance: lines ahead of the access the first prefetch is
+        """
+        self.offset_bits = offset_bits
+        self.page_shift = max(page_bits - offset_bits, 0)
+        self.degree = degree
+        self.distance = distance
+
+    def _ahead(self, block, step):
+        """
+        Addresses of the degree lines distance steps of step blocks ahead of a block, cut at the page boundary
+        """
+        page = block >> self.page_shift
+        addresses = []
+        for i in range(self.degree):
+            target = block + step * (self.distance + i)
+            if target < 0 or target >> self.page_shift != page:
+                break
+            addresses.append(target << self.offset_bits)
+        return addresses
+
+    @abstractmethod
+    def observe(self, address, hit, prefetch_hit):
+        """
+        Train on a demand access and pick lines to prefetch
+        :param address: int address of the access
+        :param hit: whether the access hit
+        :param prefetch_hit: whether it was the first use of a prefetched line
+        :return: list of int addresses to prefetch, possibly empty
+        """
+        pass
+
+    def state(self):
+        """
+        :return: the training state as plain data, for checkpoints
+        """
+        return None
+
+    def load_state(self, state):
+        """
+        Load training state from state(), None starts cold
+        :return: None
+        """
+        pass
+
+
+class NextLinePrefetcher(Prefetcher):
+    """
+    Tagged next line prefetching: a miss, or the first use of a line it prefetched, asks for the lines after it
+    """
+    name = "next-line"
+
+    def observe(self, address, hit, prefetch_hit):
+        if hit and not prefetch_hit:
+            return []
+        return self._ahead(address >> self.offset_bits, 1)
+
+
+class StridePrefetcher(Prefetcher):
+    """
+    Stride prefetching without instruction pointers: strides are learned per page instead of per load, from
+    the block distance between consecutive accesses to the page. A stride seen STRIDE_CONFIDENCE times in a row
+    prefetches along it.
+    """
+    name = "stride"
+
+    def __init__(self, offset_bits, page_bits, degree=1, distance=1):
+        super().__init__(offset_bits, page_bits, degree, distance)
+        # page to [last block, stride, confidence]
+        self.table = OrderedDict()
+
+    def observe(self, address, hit, prefetch_hit):
+        block = address >> self.offset_bits
+        page = block >> self.page_shift
+        entry = self.table.get(page)
+        if entry is None:
+            self.table[page] = [block, 0, 0]
+            if len(self.table) > STRIDE_TABLE_SIZE:
+                self.table.popitem(last=False)
+            return []
+        self.table.move_to_end(page)
+        stride = block - entry[0]
+        if not stride:
+            return []
+        if stride == entry[1]:
+            entry[2] = min(entry[2] + 1, STRIDE_CONFIDENCE)
+        else:
+            entry[1], entry[2] = stride, 0
+        entry[0] = block
+        if entry[2] < STRIDE_CONFIDENCE - 1:
+            return []
+        return self._ahead(block, stride)
+
+    def state(self):
+        return [[page] + entry for page, entry in self.table.items()]
+
+    def load_state(self, state):
+        self.table = OrderedDict((page, [block, stride, confidence])
+                                 for page, block, stride, confidence in (state or []))
+
+
+class StreamPrefetcher(Prefetcher):
+    """
+    Stream prefetching: a miss starts a tracker, and misses or first uses of prefetched lines within
+    STREAM_WINDOW lines of a tracker's head move it. Once a tracker moved the same way STREAM_CONFIRMATIONS
+    times it prefetches the lines ahead of its head in that direction, so ascending and descending sequential
+    streams with gaps are both followed.
+    """
+    name = "stream"
+
+    def __init__(self, offset_bits, page_bits, degree=1, distance=1):
+        super().__init__(offset_bits, page_bits, degree, distance)
+        # stream id to [head block, direction, confirmations]
+        self.trackers = OrderedDict()
+        self._next_id = 0
+
+    def observe(self, address, hit, prefetch_hit):
+        if hit and not prefetch_hit:
+            return []
+        block = address >> self.offset_bits
+        for stream, tracker in self.trackers.items():
+            step = block - tracker[0]
+            if not step or abs(step) > STREAM_WINDOW or block >> self.page_shift != tracker[0] >> self.page_shift:
+                continue
+            direction = 1 if step > 0 else -1
+            if direction == tracker[1]:
+                tracker[2] += 1
+            else:
+                tracker[1], tracker[2] = direction, 1
+            tracker[0] = block
+            self.trackers.move_to_end(stream)
+            if tracker[2] < STREAM_CONFIRMATIONS:
+                return []
+            return self._ahead(block, direction)
+        if not hit:
+            self.trackers[self._next_id] = [block, 0, 0]
+            self._next_id += 1
+            if len(self.trackers) > STREAM_TRACKERS:
+                self.trackers.popitem(last=False)
+        return []
+
+    def state(self):
+        return {"next id": self._next_id, "trackers": [[stream] + tracker for stream, tracker in self.trackers.items()]}
+
+    def load_state(self, state):
+        state = state or {"next id": 0, "trackers": []}
+        self._next_id = state["next id"]
+        self.trackers = OrderedDict((stream, [block, direction, confirmations])
+                                    for stream, block, direction, confirmations in state["trackers"])
+
+
+class PrefetchStats:
+    """
+    What a level's prefetcher did and how much of it paid off. A prefetched line is used by the first demand
+    access to it, a prefetch of the level above reading it does not count, that one would have fetched the line
+    anyway. Accuracy is the share of prefetch fills that were used, coverage the share of would be demand misses
+    they turned into hits. Fills are instant in this simulator, so no prefetch arrives late, timeliness is the
+    lead of each used prefetch instead, the demand accesses of the level between its fill and its first use,
+    and the prefetched lines evicted unused, which came too early or were never needed.
+    """
+    def __init__(self):
+        self.requests = 0
+        # requests for lines already resident, dropped
+        self.redundant = 0
+        self.fills = 0
+        self.useful = 0
+        self.unused_evictions = 0
+        self.lead_total = 0
+        # block address of every prefetched line not used yet to the demand access count at its fill
+        self.pending = {}
+
+    def filled(self, block, clock):
+        self.fills += 1
+        self.pending[block] = clock
+
+    def used(self, block, clock):
+        self.useful += 1
+        self.lead_total += clock - self.pending.pop(block, clock)
+
+    def evicted_unused(self, block):
+        self.unused_evictions += 1
+        self.pending.pop(block, None)
+
+    def summary(self, demand_misses):
+        """
+        :param demand_misses: the level's demand misses, what the prefetches did not cover
+        :return: dict of the counters and the derived rates
+        """
+        return {
+            "requests": self.requests,
+            "redundant": self.redundant,
+            "fills": self.fills,
+            "useful": self.useful,
+            "unused evictions": self.unused_evictions,
+            "accuracy": self.useful / self.fills if self.fills else 0,
+            "coverage": self.useful / (self.useful + demand_misses) if self.useful + demand_misses else 0,
+            "mean lead": self.lead_total / self.useful if self.useful else 0,
+        }
+
+    def state(self):
+        return {"counters": [self.requests, self.redundant, self.fills, self.useful, self.unused_evictions,
+                             self.lead_total],
+                "pending": sorted(self.pending.items())}
+
+    def load_state(self, state):
+        (self.requests, self.redundant, self.fills, self.useful, self.unused_evictions,
+         self.lead_total) = state["counters"]
+        self.pending = dict(state["pending"])
+
+
+PREFETCHERS = {prefetcher.name: prefetcher for prefetcher in (NextLinePrefetcher, StridePrefetcher, StreamPrefetcher)}
+
+
+def make_prefetcher(name, offset_bits, page_bits, degree=1, distance=1):
+    """
+    Build a level's prefetcher
+    :param name: "none", "next-line", "stride", or "stream"
+    :return: Prefetcher, or None for "none"
+    """
+    if name == "none":
+        return None
+    if name not in PREFETCHERS:
+        raise ValueError(f"Unknown prefetcher: {name}")
+    return PREFETCHERS[name](offset_bits, page_bits, degree, distance)
@@ -0,0 +1,89 @@
+from abc import abstractmethod, ABC
+import heapq
+
+
+class ReplacementPolicy(ABC):
+    """
+    Abstract base class for replacement policies that override the built in LRU victim choice of a cache
+    """
+    @abstractmethod
+    def choose_victim(self, cache, index):
+        pass
+
+
+class BeladyReplacement(ReplacementPolicy):
+    """
+    Belady's optimal replacement. Fed the precomputed next use of every reference to the cache, it evicts the
+    resident line whose next use is farthest away, found through a lazily cleaned max heap per set.
+    """
+    def __init__(self, cache, next_uses):
+        """
+        :param cache: CacheCore or inherited class to attach to
+        :param next_uses: iterable of (block, next use position) pairs, one per reference to the cache, in order
+        """
+        if cache.skewed:
+            raise ValueError("Belady replacement needs a fixed set per block, it cannot drive a skewed cache.")
+        self.cache = cache
+        self.index_bits = cache.index_bits
+        self._index_mask = (1 << cache.index_bits) - 1
+        # hashed indexing splits the block number itself, reuse keys carry a generation above it
+        self._index_function = cache.index_function
+        self._number_mask = (1 << (cache.tag_bits + cache.index_bits)) - 1
+        self._next_uses = iter(next_uses)
+        self.next_use = {}
+        self.heaps = [[] for _ in range(cache.num_sets)]
+        self._max_heap = 4 * cache.associativity + 16
+        cache.replacement = self
+
+    def advance(self):
+        """
+        Move to the next reference, call once before each access to the cache
+        :return: None
+        """
+        block, next_use = next(self._next_uses)
+        self.next_use[block] = next_use
+        index = self._split(block)[1]
+        if len(self.heaps[index]) > self._max_heap:
+            self._compact(index)
+        heapq.heappush(self.heaps[index], (-next_use, block))
+
+    def _split(self, block):
+        if self._index_function is None:
+            return block >> self.index_bits, block & self._index_mask
+        return self._index_function.split(block & self._number_mask)
+
+    def _resident_blocks(self, index):
+        if self._index_function is not None:
+            return [self._index_function.join(tag, index) for tag in self.cache.sets[index]]
+        return [(tag << self.index_bits) | index for tag in self.cache.sets[index]]
+
+    def _compact(self, index):
+        """
+        Rebuild a set's heap from its resident lines, dropping stale entries
+        """
+        heap = [(-self.next_use[block], block) for block in self._resident_blocks(index) if block in self.next_use]
+        heapq.heapify(heap)
+        self.heaps[index] = heap
+
+    def choose_victim(self, cache, index):
+        set_dict = cache.sets[index]
+        heap = self.heaps[index]
+        victim = None
+        # current entries for blocks that are not resident, such as the line being filled, go back on the heap
+        skipped = []
+        while heap:
+            neg_next_use, block = heap[0]
+            if self.next_use.get(block) != -neg_next_use:
+                heapq.heappop(heap)
+                continue
+            tag = self._split(block)[0]
+            if tag in set_dict:
+                victim = tag, set_dict[tag]
+                break
+            skipped.append(heapq.heappop(heap))
+        for entry in skipped:
+            heapq.heappush(heap, entry)
+        if victim is None:
+            # lines this policy never saw a reference for, fall back to LRU
+            victim = min(set_dict.items(), key=lambda kv: (kv[1].last_used, kv[1].inserted_at))
+        return victim
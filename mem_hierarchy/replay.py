@@ -0,0 +1,202 @@
+from mem_hierarchy.simulator import MemoryHierarchySimulator, _build_prefetcher, _build_write_buffer
+from mem_hierarchy.fused import _vm_signature, _index_signature
+from mem_hierarchy.data_structures.caches.data_cache import L2Cache
+from mem_hierarchy.data_structures.mem_levels.data_cache_level import DataCacheLevel
+from mem_hierarchy.data_structures.mem_levels.main_mem_level import MainMemoryLevel
+from mem_hierarchy.data_structures.virtual_mem.page_table import EvictedPageTableEntry
+from mem_hierarchy.data_structures.result_structures.access_results import AccessLine
+from mem_hierarchy.data_structures.result_structures import miss_stream
+from mem_hierarchy.data_structures.result_structures.miss_stream import MissStreamWriter, MissStreamReader
+from mem_hierarchy.protocols.policies import WriteBackWriteAllocate, WriteThroughNoWriteAllocate, InclusivePolicy
+from mem_hierarchy.protocols.invalidation_bus import InvalidationBus
+
+
+def _dc_signature(config):
+    """
+    Everything that decides the DC miss stream when the L2 never back invalidates the DC
+    """
+    return list(_vm_signature(config)) + [config.physical_address_bits, config.dc.num_sets, config.dc.associativity,
+                                          config.dc.line_size, config.dc.policy, *_index_signature(config.dc),
+                                          *_prefetch_signature(config.dc), *_write_buffer_signature(config.dc)]
+
+
+def _l2_signature(config):
+    if not config.l2_enabled:
+        return None
+    return [config.l2.num_sets, config.l2.associativity, config.l2.line_size, config.l2.policy,
+            *_index_signature(config.l2), *_prefetch_signature(config.l2), *_write_buffer_signature(config.l2)]
+
+
+def _prefetch_signature(level_config):
+    """
+    A cache's prefetcher for a signature, empty without one so streams captured before prefetching still match
+    """
+    if level_config.prefetcher == "none":
+        return ()
+    return level_config.prefetcher, level_config.prefetch_degree, level_config.prefetch_distance
+
+
+def _write_buffer_signature(level_config):
+    return ("write buffer", level_config.write_buffer) if level_config.write_buffer else ()
+
+
+def capture_metadata(simulator):
+    """
+    Metadata to store with a miss stream captured from a simulator's DC
+    :param simulator: MemoryHierarchySimulator after the captured run
+    :return: dict
+    """
+    stats = simulator.get_stats()
+    # the levels below the DC are what a replay recomputes
+    stats.pop("l2", None)
+    stats.pop("main memory", None)
+    return {
+        "dc signature": _dc_signature(simulator.config),
+        "l2 signature": _l2_signature(simulator.config),
+        "dc offset bits": simulator.config.bits.dc_offset_bits,
+        "page offset bits": simulator.config.bits.page_offset_bits,
+        "back invalidations": simulator.dc.back_invalidations,
+        "stats": stats,
+    }
+
+
+def capture_miss_stream(config, trace, path):
+    """
+    Simulate a trace and record the stream the DC sends to the rest of the hierarchy
+    :param config: Config
+    :param trace: trace file path
+    :param path: output file path
+    :return: MemoryHierarchySimulator after the run
+    """
+    simulator = MemoryHierarchySimulator(config)
+    writer = MissStreamWriter(path, config.bits.dc_offset_bits)
+    simulator.dc.capture_miss_stream(writer)
+    simulator.simulate(trace, verbose=False)
+    simulator.dc.capture_miss_stream(None)
+    writer.close(capture_metadata(simulator))
+    return simulator
+
+
+class MissStreamReplay:
+    """
+    The levels below the DC of one config, driven straight from a captured DC miss stream.
+    The stream only depends on the DC as long as the L2 never evicts a line the DC holds, since the inclusive
+    back invalidation would change what the DC misses on later. The replay keeps the set of resident DC lines
+    from the stream's fills and evictions, so it can tell when its own L2 would have back invalidated the DC.
+    """
+    def __init__(self, config):
+        self.config = config
+        self.invalidation_bus = InvalidationBus()
+        self.memory = MainMemoryLevel()
+        self.l2 = None
+        self.top_level = self.memory
+        if config.l2_enabled:
+            l2_write_policy = WriteThroughNoWriteAllocate() if config.l2.policy else WriteBackWriteAllocate()
+            self.l2 = DataCacheLevel("l2", L2Cache(config), l2_write_policy, InclusivePolicy(),
+                                     invalidation_bus=self.invalidation_bus, lower_level=self.memory)
+            self.l2.prefetcher = _build_prefetcher(config, config.l2, config.bits.l2_offset_bits)
+            self.l2.write_buffer = _build_write_buffer(config.l2, config.bits.l2_offset_bits)
+            self.top_level = self.l2
+        self._dc_block_mask = ~((1 << config.bits.dc_offset_bits) - 1)
+        self.dc_lines = set()
+        self.back_invalidations = 0
+
+    def _lower_read(self, address, line, origin, is_prefetch=False):
+        result = self.top_level.access("R", address, line, update_line=False, origin=origin, is_prefetch=is_prefetch)
+        if self.l2 is not None and result.evicted_entry:
+            # the same block the DC's inclusion policy would look up
+            block = result.evicted_entry.address & self._dc_block_mask
+            if block in self.dc_lines:
+                self.back_invalidations += 1
+                self.dc_lines.discard(block)
+        self.dc_lines.add(address & self._dc_block_mask)
+
+    def _page_evicted(self, ppn, page_offset_bits):
+        self.dc_lines = {block for block in self.dc_lines if block >> page_offset_bits != ppn}
+        self.invalidation_bus.publish_page_evicted(EvictedPageTableEntry(ppn, None, page_offset_bits))
+
+    def run(self, reader):
+        """
+        Push every record of a captured stream through the levels
+        :param reader: MissStreamReader
+        :return: None
+        """
+        page_offset_bits = reader.metadata["page offset bits"]
+        line = AccessLine(0)
+        lower = self.top_level
+        lower_cache = self.l2.cache if self.l2 is not None else None
+        origins = {kind: "dc" + origin for kind, origin in miss_stream.ORIGINS.items()}
+        for kind, address in reader:
+            if kind == miss_stream.TOUCH:
+                if lower_cache is not None:
+                    lower_cache.probe("R", address, update_mru=True)
+            elif kind == miss_stream.EVICT:
+                self.dc_lines.discard(address & self._dc_block_mask)
+            elif kind in miss_stream.WRITEBACK_KINDS:
+                lower.access("W", address, line, origin=origins[kind], is_writeback=True)
+            elif kind == miss_stream.WRITE_THROUGH:
+                lower.access("W", address, line, origin=origins[kind])
+            elif kind == miss_stream.READ or kind == miss_stream.RFO:
+                self._lower_read(address, line, origins[kind])
+            elif kind == miss_stream.PREFETCH:
+                self._lower_read(address, None, origins[kind], is_prefetch=True)
+            elif kind == miss_stream.PAGE_EVICTED:
+                self._page_evicted(address, page_offset_bits)
+            else:
+                raise ValueError(f"Unknown miss stream record kind: {kind}")
+        # the DC's own buffer drained at the end of the captured run, so its stores are in the stream already
+        if self.l2 is not None:
+            self.l2.drain_write_buffer()
+
+    def get_stats(self):
+        stats = {}
+        if self.l2 is not None:
+            stats["l2"] = self.l2.get_stats()
+        stats["main memory"] = self.memory.get_stats()
+        return stats
+
+
+def replay_miss_stream(config, path):
+    """
+    Replay a captured DC miss stream into the L2 and memory of a config with the same DC and VM setup
+    :param config: Config
+    :param path: miss stream file from capture_miss_stream
+    :return: dict with the combined stats and whether the replay is exact
+    """
+    reader = MissStreamReader(path)
+    metadata = reader.metadata
+    if _dc_signature(config) != metadata["dc signature"]:
+        raise ValueError(f"{path} was captured with a different DC or virtual memory configuration.")
+    replay = MissStreamReplay(config)
+    replay.run(reader)
+    same_l2 = _l2_signature(config) == metadata["l2 signature"]
+    if same_l2:
+        exact, reason = True, "same L2 as the capture"
+    elif metadata["back invalidations"]:
+        exact, reason = False, f"the capture's L2 back invalidated {metadata['back invalidations']} DC lines"
+    elif replay.back_invalidations:
+        exact, reason = False, f"this L2 would back invalidate {replay.back_invalidations} DC lines"
+    else:
+        exact, reason = True, "no inclusion back invalidations in the capture or the replay"
+    stats = dict(metadata["stats"])
+    stats.update(replay.get_stats())
+    return {"exact": exact, "reason": reason, "records": metadata["records"], "stats": stats}
+
+
+def format_replay(result):
+    """
+    Render a replay result
+    :param result: dict from replay_miss_stream
+    :return: string
+    """
+    stats = result["stats"]
+    print_str = f"replay of {result['records']} records is {'exact' if result['exact'] else 'approximate'}" \
+                f" ({result['reason']})\n"
+    print_str += f"dc hits          : {stats['dc']['hits']}\n"
+    print_str += f"dc misses        : {stats['dc']['misses']}\n"
+    if "l2" in stats:
+        print_str += f"L2 hits         : {stats['l2']['hits']}\n"
+        print_str += f"L2 misses       : {stats['l2']['misses']}\n"
+        print_str += f"L2 hit rate     : {stats['l2']['hit rate']:.6f}\n"
+    print_str += f"main memory refs : {stats['main memory']['mem_accesses']}\n"
+    return print_str
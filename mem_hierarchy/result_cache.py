@@ -0,0 +1,193 @@
+import hashlib
+import json
+import os
+from trace_parser import is_regular_file
+
+# bump when a change to the simulator changes the stats it reports for the same config and trace
+SIMULATOR_VERSION = "2"
+# entries beyond this many bytes are evicted, least recently used first
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+_SUFFIX = ".json"
+
+
+def default_cache_dir():
+    return os.environ.get("MEMHIER_CACHE_DIR") or os.path.join(os.path.expanduser("~"), ".cache", "memhier")
+
+
+def _source_digest():
+    """
+    Digest of the simulator's own source, so editing it invalidates old results even without a version bump
+    """
+    package = os.path.dirname(os.path.abspath(__file__))
+    root = os.path.dirname(package)
+    digest = hashlib.sha256()
+    paths = [os.path.join(root, name) for name in ("config.py", "trace_parser.py")]
+    for directory, dirs, files in os.walk(package):
+        dirs[:] = sorted(d for d in dirs if d != "__pycache__")
+        paths.extend(os.path.join(directory, name) for name in sorted(files) if name.endswith(".py"))
+    for path in paths:
+        digest.update(os.path.relpath(path, root).encode())
+        with open(path, "rb") as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+_simulator_version = None
+
+
+def simulator_version():
+    global _simulator_version
+    if _simulator_version is None:
+        _simulator_version = f"{SIMULATOR_VERSION}-{_source_digest()[:16]}"
+    return _simulator_version
+
+
+def normalized_config(config):
+    """
+    The config fields that decide a run's stats, with disabled levels left out
+    :param config: Config
+    :return: dict of plain data
+    """
+    normalized = {
+        "virtual addresses": config.virtual_addresses,
+        "address bits": config.address_bits,
+        "physical address bits": config.physical_address_bits,
+        "page table": vars(config.pt),
+        "dc": vars(config.dc),
+        "dtlb": vars(config.dtlb) if config.dtlb_enabled else None,
+        "l2": vars(config.l2) if config.l2_enabled else None,
+        "bits": vars(config.bits),
+    }
+    return normalized
+
+
+def config_digest(config):
+    return hashlib.sha256(json.dumps(normalized_config(config), sort_keys=True).encode()).hexdigest()
+
+
+def trace_digest(path, chunk_size=1 << 20):
+    """
+    Hash a trace's content
+    :return: hex digest, or None for traces that cannot be read twice (stdin, pipes)
+    """
+    if not is_regular_file(path):
+        return None
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    On disk cache of pprint_stats dicts, keyed by the digests of the config, the trace content, and the simulator
+    version. Each result is one small file, a hit bumps its modification time, and once the directory grows past
+    max_bytes the least recently used files are removed. Concurrent runs can share a directory, the worst case is
+    the same result being computed twice.
+    """
+    def __init__(self, directory=None, max_bytes=DEFAULT_MAX_BYTES):
+        self.directory = directory or default_cache_dir()
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(self.directory, exist_ok=True)
+        # trace digests already computed in this process, by path, size, and modification time
+        self._trace_digests = {}
+
+    def key(self, config, trace):
+        """
+        :param config: Config
+        :param trace: trace file path
+        :return: hex key, or None when the trace cannot be cached
+        """
+        try:
+            st = os.stat(trace)
+        except OSError:
+            return None
+        trace_id = (os.path.realpath(trace), st.st_size, st.st_mtime_ns)
+        if trace_id not in self._trace_digests:
+            self._trace_digests[trace_id] = trace_digest(trace)
+        trace_hash = self._trace_digests[trace_id]
+        if trace_hash is None:
+            return None
+        return hashlib.sha256(f"{config_digest(config)}:{trace_hash}:{simulator_version()}".encode()).hexdigest()
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + _SUFFIX)
+
+    def get(self, key):
+        """
+        :return: the stored pprint_stats dict, or None on a miss
+        """
+        if key is None:
+            return None
+        path = self._path(key)
+        try:
+            with open(path) as f:
+                stats = json.load(f)
+            os.utime(path)
+        except (OSError, ValueError):
+            self.misses += 1
+            return None
+        self.hits += 1
+        return stats
+
+    def put(self, key, stats):
+        """
+        Store a result and evict down to max_bytes
+        :return: None
+        """
+        if key is None:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(stats, f)
+        os.replace(tmp_path, path)
+        self.evict()
+
+    def evict(self):
+        """
+        Remove least recently used results until the cache fits in max_bytes
+        :return: number of results removed
+        """
+        entries = []
+        total = 0
+        with os.scandir(self.directory) as it:
+            for entry in it:
+                if not entry.name.endswith(_SUFFIX):
+                    continue
+                try:
+                    st = entry.stat()
+                except OSError:
+                    continue
+                entries.append((st.st_mtime_ns, st.st_size, entry.path))
+                total += st.st_size
+        removed = 0
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            try:
+                os.remove(path)
+            except OSError:
+                continue
+            total -= size
+            removed += 1
+        return removed
+
+    def simulate(self, config, trace, batch_size=4096):
+        """
+        Return the cached stats of a run, simulating and storing them on a miss
+        :param config: Config
+        :param trace: trace file path
+        :return: the pprint_stats dict
+        """
+        key = self.key(config, trace)
+        stats = self.get(key)
+        if stats is None:
+            # imported here since the simulator pulls in the whole hierarchy
+            from mem_hierarchy.simulator import MemoryHierarchySimulator
+            stats = MemoryHierarchySimulator(config).simulate(trace, verbose=False, batch_size=batch_size)
+            self.put(key, stats)
+        return stats
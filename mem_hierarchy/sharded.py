@@ -0,0 +1,151 @@
+import os
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+from mem_hierarchy.simulator import MemoryHierarchySimulator
+from mem_hierarchy.shared_trace import SharedTrace
+try:
+    import numpy as np
+except ImportError:  # numpy is optional, shards are filtered one access at a time without it
+    np = None
+
+# cache and level counters that add up across shards
+CACHE_COUNTERS = ("reads", "writes", "read_hits", "write_hits", "read_misses", "write_misses", "evictions",
+                  "write_backs", "alloc_on_write_miss", "writebacks_during_run", "l2_lower_R_calls",
+                  "l2_read_miss_calls", "clean_evictions", "dirty_evictions")
+LEVEL_COUNTERS = ("runtime_writebacks", "inclusions", "back_invalidations")
+
+
+def shard_bits(config):
+    """
+    Address bits a trace can be split on without changing any cache's behavior. Every interaction between the
+    levels (lower reads, MRU touches, writebacks, inclusion back invalidations) stays within one DC set and the
+    L2 set of the same address, so bits inside both the DC and the L2 index fields give independent shards.
+    Translation couples every set through the page table's LRU, so virtual address configs never shard, and
+    hashed indexing mixes the bits above the index field into the set, so only modulo indexed caches shard.
+    Prefetchers fill lines of other sets from what they learned across sets, and a write buffer drains blocks of
+    any set when it fills up, so caches with either never shard.
+    :param config: Config
+    :return: (lowest bit position, number of bits) or None when sharding would not be exact
+    """
+    if config.virtual_addresses:
+        return None
+    if config.dc.index_function != "modulo" or (config.l2_enabled and config.l2.index_function != "modulo"):
+        return None
+    for level in (config.dc, config.l2 if config.l2_enabled else None):
+        if level is not None and (level.prefetcher != "none" or level.write_buffer):
+            return None
+    low = config.bits.dc_offset_bits
+    high = low + config.bits.dc_index_bits
+    if config.l2_enabled:
+        low = max(low, config.bits.l2_offset_bits)
+        high = min(high, config.bits.l2_offset_bits + config.bits.l2_index_bits)
+    if high <= low:
+        return None
+    return low, high - low
+
+
+def _shard_batches(trace, position, mask, shard, batch_size):
+    for ops, addrs in trace.iter_batches(batch_size):
+        if np is not None:
+            keep = np.flatnonzero((np.asarray(addrs, dtype=np.int64) >> position) & mask == shard).tolist()
+        else:
+            keep = [i for i, address in enumerate(addrs) if (address >> position) & mask == shard]
+        if keep:
+            yield [ops[i] for i in keep], [addrs[i] for i in keep]
+
+
+def _simulate_shard(config, handle, position, mask, shard, batch_size):
+    """
+    Simulate the accesses of one shard in a worker process
+    :return: dict of counters to merge
+    """
+    trace = SharedTrace.attach(*handle)
+    simulator = MemoryHierarchySimulator(config)
+    try:
+        for ops, addrs in _shard_batches(trace, position, mask, shard, batch_size):
+            simulator.access_many(ops, addrs)
+    finally:
+        trace.close()
+    return _counters(simulator)
+
+
+def _counters(simulator):
+    counters = {"reads": simulator.reads, "writes": simulator.writes,
+                "memory": (simulator.memory.reads, simulator.memory.writes, dict(simulator.memory.by_origin))}
+    for name in ("dc", "l2"):
+        level = getattr(simulator, name)
+        if level is None:
+            continue
+        cache = level.cache
+        counters[name] = {
+            "cache": {counter: getattr(cache, counter) for counter in CACHE_COUNTERS if hasattr(cache, counter)},
+            "level": {counter: getattr(level, counter) for counter in LEVEL_COUNTERS},
+            "dirty_evictions_per_set": dict(getattr(cache, "dirty_evictions_per_set", {})),
+        }
+    return counters
+
+
+def _merge(simulator, counters):
+    simulator.reads += counters["reads"]
+    simulator.writes += counters["writes"]
+    reads, writes, by_origin = counters["memory"]
+    simulator.memory.reads += reads
+    simulator.memory.writes += writes
+    for origin, count in by_origin.items():
+        simulator.memory.by_origin[origin] = simulator.memory.by_origin.get(origin, 0) + count
+    for name in ("dc", "l2"):
+        if name not in counters:
+            continue
+        level = getattr(simulator, name)
+        for counter, value in counters[name]["cache"].items():
+            setattr(level.cache, counter, getattr(level.cache, counter) + value)
+        for counter, value in counters[name]["level"].items():
+            setattr(level, counter, getattr(level, counter) + value)
+        if hasattr(level.cache, "dirty_evictions_per_set"):
+            level.cache.dirty_evictions_per_set.update(Counter(counters[name]["dirty_evictions_per_set"]))
+
+
+class ShardedSimulator:
+    """
+    Runs a physically addressed trace as independent set shards in worker processes and merges the counters into
+    one MemoryHierarchySimulator, so stats come out the same as a serial run. Configs that cannot be sharded
+    exactly run serially.
+    """
+    def __init__(self, config, workers=None):
+        self.config = config
+        self.workers = workers or os.cpu_count() or 1
+        self.simulator = MemoryHierarchySimulator(config)
+        self.bits = shard_bits(config)
+        if self.bits is None:
+            self.shards = 1
+            self.reason = "virtual addresses couple every set through the page table" if config.virtual_addresses \
+                else "the DC and L2 index fields share no bits"
+        else:
+            position, count = self.bits
+            # a few shards per worker evens out sets that see more traffic
+            self.shards = min(1 << count, 1 << (4 * self.workers - 1).bit_length())
+            self.reason = None
+
+    @property
+    def exact(self):
+        return self.bits is not None
+
+    def simulate(self, trace, batch_size=4096):
+        """
+        Simulate a trace, sharded when exact and serial otherwise
+        :param trace: trace file path
+        :return: the pprint_stats dict
+        """
+        if self.bits is None or self.shards == 1 or self.workers == 1:
+            return self.simulator.simulate(trace, verbose=False, batch_size=batch_size)
+        position, _ = self.bits
+        shared = SharedTrace.from_file(trace, self.config.address_bits)
+        try:
+            with ProcessPoolExecutor(max_workers=self.workers) as pool:
+                futures = [pool.submit(_simulate_shard, self.config, shared.handle(), position, self.shards - 1,
+                                       shard, batch_size) for shard in range(self.shards)]
+                for future in futures:
+                    _merge(self.simulator, future.result())
+        finally:
+            shared.close()
+        return self.simulator.finish()
@@ -0,0 +1,70 @@
+from multiprocessing import shared_memory
+from array import array
+from trace_parser import TraceParser
+
+
+class SharedTrace:
+    """
+    A decoded trace in shared memory, 32 bit addresses followed by the operation bytes, so worker processes read
+    one copy instead of each parsing the text trace again. The process that decodes the trace owns the block and
+    unlinks it on close, workers attach by name.
+    """
+    def __init__(self, shm, length, owner=False):
+        self.shm = shm
+        self.name = shm.name
+        self.length = length
+        self.owner = owner
+
+    @classmethod
+    def from_file(cls, path, address_bits):
+        """
+        Decode a trace file into a new shared memory block
+        :param path: trace file path
+        :param address_bits: address width the trace is masked to
+        :return: SharedTrace
+        """
+        addrs = array('I')
+        ops = bytearray()
+        for operation, address, _ in TraceParser(path, addr_bits=address_bits):
+            if operation not in ("R", "W"):
+                raise ValueError(f"Unknown op: {operation}")
+            ops += operation.encode()
+            addrs.append(address)
+        length = len(ops)
+        # shared memory blocks cannot be empty
+        shm = shared_memory.SharedMemory(create=True, size=max(1, 5 * length))
+        shm.buf[:4 * length] = addrs.tobytes()
+        shm.buf[4 * length:5 * length] = ops
+        return cls(shm, length, owner=True)
+
+    @classmethod
+    def attach(cls, name, length):
+        """
+        Attach to a block created by from_file in another process
+        """
+        return cls(shared_memory.SharedMemory(name=name), length)
+
+    def handle(self):
+        """
+        Picklable (name, length) pair for attach
+        """
+        return self.name, self.length
+
+    def iter_batches(self, batch_size=4096):
+        """
+        Yield the trace as (operations, int addresses) lists of up to batch_size accesses
+        """
+        addrs = self.shm.buf[:4 * self.length].cast('I')
+        ops = self.shm.buf[4 * self.length:5 * self.length]
+        try:
+            for start in range(0, self.length, batch_size):
+                end = min(start + batch_size, self.length)
+                yield list(bytes(ops[start:end]).decode()), addrs[start:end].tolist()
+        finally:
+            addrs.release()
+            ops.release()
+
+    def close(self):
+        self.shm.close()
+        if self.owner:
+            self.shm.unlink()
@@ -1,24 +1,54 @@
 from trace_parser import TraceParser  # if you move it under package
 from mem_hierarchy.data_structures.caches.data_cache import DCCache, L2Cache
 from mem_hierarchy.data_structures.caches.translation_cache import DTLB
+from mem_hierarchy.data_structures.caches.write_buffer import WriteBuffer
 from mem_hierarchy.data_structures.mem_levels.dtlb_level import DTLBLevel
 from mem_hierarchy.data_structures.mem_levels.data_cache_level import DataCacheLevel
 from mem_hierarchy.data_structures.mem_levels.main_mem_level import MainMemoryLevel
 from mem_hierarchy.data_structures.mem_levels.virtual_memory_level import VirtualMemoryLevel
 from mem_hierarchy.data_structures.virtual_mem.page_table import PageTable
 from mem_hierarchy.data_structures.result_structures.access_results import AccessLine
+from mem_hierarchy.data_structures.result_structures.access_output import TextLineWriter
 from mem_hierarchy.protocols.policies import WriteBackWriteAllocate, WriteThroughNoWriteAllocate, InclusivePolicy
 from mem_hierarchy.protocols.invalidation_bus import InvalidationBus
+from mem_hierarchy.protocols.prefetchers import make_prefetcher
+from mem_hierarchy.metrics import MetricsRegistry, report_stats, export_text
+from mem_hierarchy.tracepoints import Tracepoints
 import json
+import sys
+
+def _build_prefetcher(config, level_config, offset_bits):
+    """
+    The prefetcher a cache's config asks for, None when it does not prefetch
+    """
+    # prefetches stay within a page, physically addressed configs still have a page size
+    page_bits = config.pt.page_size.bit_length() - 1
+    return make_prefetcher(level_config.prefetcher, offset_bits, page_bits, level_config.prefetch_degree,
+                           level_config.prefetch_distance)
+
+
+def _build_write_buffer(level_config, offset_bits):
+    """
+    The write buffer a cache's config asks for, None when stores go straight to the lower level
+    """
+    return WriteBuffer(level_config.write_buffer, offset_bits) if level_config.write_buffer else None
+
 
 class MemoryHierarchySimulator:
     """Simulates a memory hierarchy based on the provided configuration."""
-    def __init__(self, config):
+    def __init__(self, config, front_end=None):
+        """
+        :param config: Config
+        :param front_end: optional TranslationFrontEnd shared with other simulators. When given, this simulator
+                          only builds its caches, its top level is the DC, and whoever drives the front end feeds
+                          it physical addresses and page evictions (see FusedSimulator)
+        """
         self.config = config
         self.bits = self.config.bits
         self.memory = MainMemoryLevel()
         self.top_level = self.memory
         invalidation_bus = InvalidationBus()
+        self.invalidation_bus = invalidation_bus
         lower_for_next_level = self.top_level
         # setup for L2 cache if applicable
         if self.config.l2_enabled:
@@ -28,6 +58,8 @@ class MemoryHierarchySimulator:
                 l2_write_policy = WriteBackWriteAllocate()
             self.l2 = DataCacheLevel("l2", L2Cache(config), l2_write_policy, InclusivePolicy(),
                                  invalidation_bus=invalidation_bus, lower_level=lower_for_next_level)
+            self.l2.prefetcher = _build_prefetcher(config, config.l2, self.bits.l2_offset_bits)
+            self.l2.write_buffer = _build_write_buffer(config.l2, self.bits.l2_offset_bits)
             lower_for_next_level = self.l2
             self.top_level = self.l2
         else:
@@ -39,12 +71,17 @@ class MemoryHierarchySimulator:
             dc_write_policy = WriteBackWriteAllocate()
         self.dc = DataCacheLevel("dc", DCCache(config), dc_write_policy, InclusivePolicy(),
                                  invalidation_bus=invalidation_bus, lower_level=lower_for_next_level)
+        self.dc.prefetcher = _build_prefetcher(config, config.dc, self.bits.dc_offset_bits)
+        self.dc.write_buffer = _build_write_buffer(config.dc, self.bits.dc_offset_bits)
         lower_for_next_level = self.dc
         self.top_level = self.dc
         # setup for page table if applicable
         self.dtlb = None
         self.pt = None
-        if config.virtual_addresses:
+        if front_end is not None:
+            self.dtlb = front_end.dtlb
+            self.pt = front_end.pt
+        elif config.virtual_addresses:
             # setup for DTLB if applicable
             if config.dtlb_enabled:
                 self.dtlb = DTLBLevel(DTLB(config), lower_level=None, invalidation_bus=invalidation_bus)
@@ -53,27 +90,105 @@ class MemoryHierarchySimulator:
 
         self.reads = 0
         self.writes = 0
+        self.metrics = self._register_metrics()
+        # runtime subscribable hierarchy events, see mem_hierarchy.tracepoints
+        self.tracepoints = Tracepoints(self)
+
+    def _register_metrics(self):
+        """
+        Registry that every level of this hierarchy registers its counters into
+        :return: MetricsRegistry
+        """
+        registry = MetricsRegistry()
+        reads = registry.counter("trace_reads", "Read accesses simulated", source=lambda: self.reads)
+        writes = registry.counter("trace_writes", "Write accesses simulated", source=lambda: self.writes)
+        read_ratio = registry.gauge("trace_read_ratio", "Share of simulated accesses that were reads",
+                                    source=lambda: self.reads / (self.reads + self.writes) if self.reads + self.writes else 0)
+        if self.dtlb:
+            self.dtlb.register_metrics(registry)
+        if self.pt:
+            self.pt.register_metrics(registry)
+        self.dc.register_metrics(registry)
+        if self.l2:
+            self.l2.register_metrics(registry)
+        registry.report("Total reads      ", "total reads", reads)
+        registry.report("Total writes     ", "total writes", writes)
+        registry.report("Ratio of reads   ", "ratio of reads", read_ratio, ".6f", gap=True)
+        self.memory.register_metrics(registry)
+        if self.pt:
+            registry.report("page table refs  ", "page table refs", registry.get("page_table_accesses"))
+            registry.report("disk refs        ", "disk refs", registry.get("disk_references"))
+        return registry
 
     @staticmethod
     def align_to_block(address, offset_bits):
         return address & ~((1 << offset_bits) - 1)
 
-    def simulate(self, trace, write_to=None, verbose=True):
+    def access_many(self, ops, addrs):
         """
-        Core simulator functionality, simulates the memory hierarchy using the provided trace file.
-        :param write_to: string path to write stats to as json, if None, does not write
+        Runs a batch of accesses through the hierarchy without building per-access lines.
+        :param ops: sequence of "R" or "W"
+        :param addrs: sequence of int addresses
+        :return: None
+        """
+        reads = 0
+        for operation in ops:
+            if operation == "R":
+                reads += 1
+            elif operation != "W":
+                raise ValueError(f"Unknown op: {operation}")
+        self.reads += reads
+        self.writes += len(ops) - reads
+        self.top_level.access_many(ops, addrs)
+
+    def _access_with_series(self, ops, addrs, series):
+        """
+        Runs a batch through access_many in pieces that end on the series' interval boundaries
+        :param series: IntervalSeriesWriter
+        :return: None
+        """
+        start = 0
+        while start < len(ops):
+            end = min(len(ops), start + series.remaining)
+            self.access_many(ops[start:end], addrs[start:end])
+            series.advance(self, end - start)
+            start = end
+
+    def drain_write_buffers(self):
+        """
+        Write the stores still in the write buffers down at the end of a run, the DC's first so they can land in
+        the L2's buffer before it drains
+        :return: None
+        """
+        for level in (self.dc, self.l2):
+            if level is not None:
+                level.drain_write_buffer()
+
+    def finish(self):
+        """
+        End a run that fed the levels directly instead of going through simulate: drain the write buffers, then
+        take the stats
+        :return: the pprint_stats dict
+        """
+        self.drain_write_buffers()
+        return self.pprint_stats(verbose=False)
+
+    def _simulate_lines(self, trace, start=0, series=None, out=None, columns=None):
+        """
+        Runs the trace one access at a time, rendering the line each access produces.
         :param trace: trace file path
+        :param start: number of accesses at the start of the trace to skip
+        :param series: optional IntervalSeriesWriter advanced after every access
+        :param out: TextLineWriter that gets the table row of every access, None renders no table
+        :param columns: optional ColumnarAccessWriter that gets the raw fields of every access
         :return: None
         """
-        if verbose:
-            print("Virtual  Virt.  Page TLB    TLB TLB  PT   Phys        DC  DC          L2  L2")
-            print("Address  Page # Off  Tag    Ind Res. Res. Pg # DC Tag Ind Res. L2 Tag Ind Res.")
-            print("-------- ------ ---- ------ --- ---- ---- ---- ------ --- ---- ------ --- ----")
-        for operation, int_address, hex_address in TraceParser(trace, addr_bits=self.config.address_bits):
+        for operation, int_address, hex_address in TraceParser(trace, addr_bits=self.config.address_bits, skip=start):
             address = bin(int_address)[2:].zfill(self.config.address_bits)
-            tag, index, _ = self.l2.cache.parse_address(int_address)
             if len(address) > self.config.address_bits:
-                print(f"Address {hex_address} exceeds the configured address bits {self.config.address_bits}")
+                if out is not None:
+                    out.write_text(f"Address {hex_address} exceeds the configured address bits "
+                                   f"{self.config.address_bits}")
                 continue
                 # raise ValueError(f"Address {hex_address} exceeds the configured address bits {self.config.address_bits}")
             if operation == "R":
@@ -85,8 +200,65 @@ class MemoryHierarchySimulator:
             # have line get passed through the hierarchy to collect info
             line = AccessLine(address)
             self.top_level.access(operation, int_address, line)
+            if out is not None:
+                out.write(line)
+            if columns is not None:
+                columns.write(line)
+            if series is not None:
+                series.advance(self, 1)
+
+    def simulate(self, trace, write_to=None, verbose=True, batch_size=4096, start=0, checkpoint_to=None,
+                 checkpoint_every=None, series=None, columns=None):
+        """
+        Core simulator functionality, simulates the memory hierarchy using the provided trace file.
+        :param write_to: string path to write stats to as json, if None, does not write
+        :param trace: trace file path
+        :param batch_size: number of accesses per access_many batch when not verbose
+        :param start: number of accesses at the start of the trace to skip, the position of a restored checkpoint
+        :param checkpoint_to: path to save a checkpoint to at the end of the run, if None, does not save
+        :param checkpoint_every: when not verbose, also save a checkpoint about every this many accesses
+        :param series: optional IntervalSeriesWriter that gets a row of counter deltas every interval, closed at
+                       the end of the run
+        :param columns: optional ColumnarAccessWriter that gets the raw fields of every access, closed at the end
+                        of the run. Runs the per access path even when not verbose.
+        :return: None
+        """
+        position = start
+        if series is not None:
+            series.start(self, start)
+        if verbose or columns is not None:
+            out = None
             if verbose:
-                print(line)
+                print("Virtual  Virt.  Page TLB    TLB TLB  PT   Phys        DC  DC          L2  L2")
+                print("Address  Page # Off  Tag    Ind Res. Res. Pg # DC Tag Ind Res. L2 Tag Ind Res.")
+                print("-------- ------ ---- ------ --- ---- ---- ---- ------ --- ---- ------ --- ----")
+                out = TextLineWriter(sys.stdout)
+            reads_writes = self.reads + self.writes
+            self._simulate_lines(trace, start, series, out, columns)
+            if out is not None:
+                out.flush()
+            position += self.reads + self.writes - reads_writes
+        else:
+            # nothing gets rendered, so run the trace through the batched path
+            parser = TraceParser(trace, addr_bits=self.config.address_bits, skip=start)
+            next_checkpoint = position + checkpoint_every if checkpoint_to and checkpoint_every else None
+            for ops, addrs in parser.iter_batches(batch_size):
+                if series is None:
+                    self.access_many(ops, addrs)
+                else:
+                    self._access_with_series(ops, addrs, series)
+                position += len(ops)
+                if next_checkpoint is not None and position >= next_checkpoint:
+                    self.checkpoint(checkpoint_to, trace_position=position)
+                    next_checkpoint = position + checkpoint_every
+        if checkpoint_to is not None:
+            # saved before the final drain, a resumed run keeps the buffered stores and drains them at its end
+            self.checkpoint(checkpoint_to, trace_position=position)
+        self.drain_write_buffers()
+        if series is not None:
+            series.close(self)
+        if columns is not None:
+            columns.close({"trace": trace, "start": start, "address bits": self.config.address_bits})
 
         if verbose:
             print("\nSimulation statistics\n")
@@ -97,6 +269,35 @@ class MemoryHierarchySimulator:
                 json.dump(stat_dict, f, indent=4)
         return stat_dict
 
+    def checkpoint(self, path, trace_position=None):
+        """
+        Save the full hierarchy state to a versioned checkpoint file
+        :param path: checkpoint file path
+        :param trace_position: accesses of the trace simulated so far, defaults to reads plus writes
+        :return: None
+        """
+        # imported here since the checkpoint module builds on the other simulators
+        from mem_hierarchy.checkpoint import save_checkpoint
+        save_checkpoint(self, path, trace_position)
+
+    def restore(self, path, counters=True):
+        """
+        Load a checkpoint saved from a hierarchy with the same geometry
+        :param path: checkpoint file path
+        :param counters: restore the stats too, False keeps the warm state but counts from zero
+        :return: the trace position to resume from
+        """
+        from mem_hierarchy.checkpoint import load_checkpoint, restore
+        return restore(self, load_checkpoint(path), counters=counters)
+
+    def reset(self):
+        """
+        Clear every level's contents and stats, so a built hierarchy can run another trace from a cold start
+        :return: None
+        """
+        from mem_hierarchy.checkpoint import empty_state, restore
+        restore(self, empty_state(self))
+
     def get_stats(self):
         """
         Gathers and returns stats from all levels of the memory hierarchy.
@@ -119,56 +320,14 @@ class MemoryHierarchySimulator:
 
     def pprint_stats(self, verbose=True):
         """
-        Pretty prints the stats from all levels of the memory hierarchy.
-        :return: None
+        Pretty prints the stats from all levels of the memory hierarchy, as laid out in the metrics registry.
+        :return: dict of the printed values
         """
-        stats = self.get_stats()
-        stat_dict = {}
-        stat_str = ""
-        dtlb_stats = stats.get('dtlb', None)
-        if dtlb_stats is not None:
-            stat_str += "dtlb hits        : " + str(dtlb_stats['hits']) + "\n"
-            stat_dict["dtlb hits"] = dtlb_stats['hits']
-            stat_str += "dtlb misses      : " + str(dtlb_stats['misses']) + "\n"
-            stat_dict["dtlb misses"] = dtlb_stats['misses']
-            stat_str += "dtlb hit rate    : " + f"{dtlb_stats['hit rate']:.6f}" + "\n\n"
-            stat_dict["dtlb hit rate"] = f"{dtlb_stats['hit rate']:.6f}"
-        pt_stats = stats.get('page table', None)
-        if pt_stats is not None:
-            stat_str += "pt hits          : " + str(pt_stats['hits']) + "\n"
-            stat_dict["pt hits"] = pt_stats['hits']
-            stat_str += "pt misses        : " + str(pt_stats['misses']) + "\n"
-            stat_dict["pt misses"] = pt_stats['misses']
-            stat_str += "pt hit rate      : " + f"{pt_stats['hit rate']:.6f}" + "\n\n"
-            stat_dict["pt hit rate"] = f"{pt_stats['hit rate']:.6f}"
-        dc_stats = stats.get('dc', None)
-        stat_str += "dc hits          : " + str(dc_stats['hits']) + "\n"
-        stat_dict["dc hits"] = dc_stats['hits']
-        stat_str += "dc misses        : " + str(dc_stats['misses']) + "\n"
-        stat_dict["dc misses"] = dc_stats['misses']
-        stat_str += "dc hit rate      : " + f"{dc_stats['hit rate']:.6f}" + "\n\n"
-        stat_dict["dc hit rate"] = f"{dc_stats['hit rate']:.6f}"
-        l2_stats = stats.get('l2', None)
-        if l2_stats is not None:
-            stat_str += "L2 hits         : " + str(l2_stats['hits']) + "\n"
-            stat_dict["l2 hits"] = l2_stats['hits']
-            stat_str += "L2 misses       : " + str(l2_stats['misses']) + "\n"
-            stat_dict["l2 misses"] = l2_stats['misses']
-            stat_str += "L2 hit rate     : " + f"{l2_stats['hit rate']:.6f}" + "\n\n"
-            stat_dict["l2 hit rate"] = f"{l2_stats['hit rate']:.6f}"
-        stat_str += "Total reads      : " + str(stats['reads']) + "\n"
-        stat_dict["total reads"] = stats['reads']
-        stat_str += "Total writes     : " + str(stats['writes']) + "\n"
-        stat_dict["total writes"] = stats['writes']
-        stat_str += "Ratio of reads   : " + f"{stats['read ratio']:.6f}" + "\n\n"
-        stat_dict["ratio of reads"] = f"{stats['read ratio']:.6f}"
-        stat_str += "main memory refs : " + str(stats['main memory']['mem_accesses']) + "\n"
-        stat_dict["main memory refs"] = stats['main memory']['mem_accesses']
-        stat_str += "page table refs  : " + str(stats['page table']['accesses']) + "\n" if pt_stats else ""
-        stat_dict["page table refs"] = stats['page table']['accesses'] if pt_stats else ""
-        stat_str += "disk refs        : " + str(stats['page table']['disk refs']) + "\n" if pt_stats else ""
-        stat_dict["disk refs"] = stats['page table']['disk refs'] if pt_stats else ""
+        registry = self.metrics.collect()
+        stat_dict = report_stats(registry)
+        if not self.pt:
+            stat_dict["page table refs"] = stat_dict["disk refs"] = ""
         if verbose:
-            print(stat_str)
+            print(export_text(registry))
         return stat_dict
 
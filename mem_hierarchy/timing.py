@@ -0,0 +1,280 @@
+import math
+from collections import Counter
+from contextlib import contextmanager
+from mem_hierarchy.data_structures.result_structures.access_results import AccessLine
+
+# trace accesses carry no size, a demand access and a write through store move one word
+WORD_BYTES = 4
+# latency percentiles in the report
+PERCENTILES = (50, 90, 99)
+
+
+class LevelTiming:
+    """
+    Cycles and traffic of one level of the hierarchy
+    """
+    def __init__(self, name, latency, line_size=None, bus_width=None):
+        """
+        :param name: level name in the report
+        :param latency: cycles a lookup at this level costs
+        :param line_size: bytes a fill of or writeback from this level moves, None for levels without lines
+        :param bus_width: bytes per cycle of the bus below this level, None for levels without one
+        """
+        self.name = name
+        self.latency = latency
+        self.line_size = line_size
+        self.bus_width = bus_width
+        self.lookups = 0
+        self.lookup_cycles = 0
+        # cycles spent moving data between this level and the one above
+        self.transfer_cycles = 0
+        # bytes the level above read out of this level, and wrote into it
+        self.bytes_read = 0
+        self.bytes_written = 0
+
+    @property
+    def cycles(self):
+        return self.lookup_cycles + self.transfer_cycles
+
+    def summary(self):
+        return {"lookups": self.lookups, "lookup cycles": self.lookup_cycles,
+                "transfer cycles": self.transfer_cycles, "bytes read": self.bytes_read,
+                "bytes written": self.bytes_written}
+
+
+class TimingModel:
+    """
+    Blocking, in order timing over the hierarchy's existing call chain. Every lookup a level does costs its hit
+    latency, so a miss costs the lookups of every level it goes down through, and data moving between two levels
+    costs ceil(bytes / bus width) cycles of the bus below the upper one: a read moves the upper level's line up,
+    a writeback moves it down, and a write through store moves one word. A page table miss adds the disk
+    latency. Everything an access sets off, its fill, the writebacks of the lines it evicts, and the shootdowns
+    of a page it evicts, is charged to that access, nothing overlaps. Prefetch fills are the exception, they
+    keep the lookups and traffic they cause on the levels but run off the critical path of the access that set
+    them off.
+
+    The entry points of the levels are wrapped on the instances for the length of a run, like PhaseProfiler, so
+    an untimed simulator pays nothing, and the top level runs one access at a time so each one is measured.
+    """
+    def __init__(self, timing_config):
+        """
+        :param timing_config: TimingConfig with the latencies and bus widths
+        """
+        self.timing_config = timing_config
+        self.levels = {}
+        self.latencies = {"R": Counter(), "W": Counter()}
+        self._cycles = 0
+
+    def _charge(self, level_timing):
+        level_timing.lookups += 1
+        level_timing.lookup_cycles += level_timing.latency
+        self._cycles += level_timing.latency
+
+    def _transfer(self, upper_timing, level_timing, operation, is_writeback):
+        """
+        Count the data a call from the upper level to this one moves, on the bus below the upper level
+        """
+        if upper_timing is None:
+            # demand accesses from the core, the port is part of the hit latency
+            if operation == "R":
+                level_timing.bytes_read += WORD_BYTES
+            else:
+                level_timing.bytes_written += WORD_BYTES
+            return
+        if operation == "R":
+            moved = upper_timing.line_size
+            level_timing.bytes_read += moved
+        else:
+            moved = upper_timing.line_size if is_writeback else WORD_BYTES
+            level_timing.bytes_written += moved
+        cycles = math.ceil(moved / upper_timing.bus_width)
+        level_timing.transfer_cycles += cycles
+        self._cycles += cycles
+
+    def _wrap_level(self, level_timing, upper_timing, method):
+        def timed(operation, address, *args, **kwargs):
+            self._charge(level_timing)
+            self._transfer(upper_timing, level_timing, operation, kwargs.get("is_writeback", False))
+            return method(operation, address, *args, **kwargs)
+        return timed
+
+    def _wrap_dtlb(self, level_timing, method):
+        def timed(operation, address, *args, **kwargs):
+            # a DTLB write is the fill after a walk, the walk already paid for it
+            if operation == "R":
+                self._charge(level_timing)
+            return method(operation, address, *args, **kwargs)
+        return timed
+
+    def _wrap_translate(self, walk_timing, disk_timing, method):
+        def timed(virtual_address):
+            self._charge(walk_timing)
+            translation = method(virtual_address)
+            if not translation.hit:
+                self._charge(disk_timing)
+            return translation
+        return timed
+
+    def _off_critical_path(self, method):
+        def timed(*args, **kwargs):
+            cycles = self._cycles
+            result = method(*args, **kwargs)
+            self._cycles = cycles
+            return result
+        return timed
+
+    def _wrap_top(self, method):
+        def timed(operation, address, *args, **kwargs):
+            self._cycles = 0
+            result = method(operation, address, *args, **kwargs)
+            self.latencies[operation][self._cycles] += 1
+            return result
+        return timed
+
+    def _one_at_a_time(self, top_level):
+        def access_many(ops, addrs):
+            # scratch line, nothing is rendered in batch mode
+            line = AccessLine(0)
+            for operation, address in zip(ops, addrs):
+                top_level.access(operation, address, line)
+        return access_many
+
+    def _targets(self, simulator):
+        """
+        (object, method name, wrapper factory) for every entry point timed on a simulator
+        """
+        timing = self.timing_config
+        levels = self.levels
+        targets = []
+        if simulator.dtlb:
+            levels["dtlb"] = LevelTiming("dtlb", timing.dtlb_latency)
+            targets.append((simulator.dtlb, "access", lambda method: self._wrap_dtlb(levels["dtlb"], method)))
+        if simulator.pt:
+            levels["page table"] = LevelTiming("page table", timing.page_table_latency)
+            levels["disk"] = LevelTiming("disk", timing.disk_latency)
+            targets.append((simulator.pt.page_table, "translate",
+                            lambda method: self._wrap_translate(levels["page table"], levels["disk"], method)))
+        upper = None
+        caches = [(simulator.dc, timing.dc_latency, timing.dc_bus_width)]
+        if simulator.l2:
+            caches.append((simulator.l2, timing.l2_latency, timing.l2_bus_width))
+        for level, latency, bus_width in caches:
+            level_timing = LevelTiming(level.name, latency, level.cache.line_size, bus_width)
+            levels[level.name] = level_timing
+            targets.append((level, "access", lambda method, timed=level_timing, upper=upper:
+                            self._wrap_level(timed, upper, method)))
+            targets.append((level, "_prefetch_fill", self._off_critical_path))
+            upper = level_timing
+        levels["main memory"] = LevelTiming("main memory", timing.memory_latency)
+        targets.append((simulator.memory, "access", lambda method, upper=upper:
+                        self._wrap_level(levels["main memory"], upper, method)))
+        # the top level is wrapped last so its per access timer sits outside its own level timing
+        targets.append((simulator.top_level, "access", self._wrap_top))
+        targets.append((simulator.top_level, "access_many", lambda method: self._one_at_a_time(simulator.top_level)))
+        return targets
+
+    @contextmanager
+    def attached(self, simulator):
+        """
+        Time every access the simulator runs while the context is open
+        :param simulator: MemoryHierarchySimulator
+        """
+        targets = self._targets(simulator)
+        saved = []
+        for owner, name, wrap in targets:
+            saved.append((owner, name, owner.__dict__.get(name)))
+            setattr(owner, name, wrap(getattr(owner, name)))
+        try:
+            yield self
+        finally:
+            for owner, name, previous in reversed(saved):
+                if previous is None:
+                    owner.__dict__.pop(name, None)
+                else:
+                    setattr(owner, name, previous)
+
+    def run(self, simulator, trace, **kwargs):
+        """
+        Simulate a trace with every access timed
+        :param simulator: MemoryHierarchySimulator
+        :param trace: trace file path
+        :param kwargs: passed on to simulator.simulate
+        :return: the stats dict from simulate
+        """
+        with self.attached(simulator):
+            return simulator.simulate(trace, **kwargs)
+
+    def histogram(self, operations=("R", "W")):
+        """
+        Access latencies in power of two buckets
+        :param operations: which of "R" and "W" to count
+        :return: list of (lowest cycles, highest cycles, accesses) for every bucket up to the slowest access
+        """
+        buckets = Counter()
+        for operation in operations:
+            for cycles, count in self.latencies[operation].items():
+                buckets[cycles.bit_length()] += count
+        if not buckets:
+            return []
+        return [((1 << bucket) >> 1, (1 << bucket) - 1, buckets[bucket]) for bucket in range(max(buckets) + 1)]
+
+    def percentile(self, percent, operations=("R", "W")):
+        latencies = Counter()
+        for operation in operations:
+            latencies.update(self.latencies[operation])
+        wanted = math.ceil(sum(latencies.values()) * percent / 100)
+        seen = 0
+        for cycles in sorted(latencies):
+            seen += latencies[cycles]
+            if seen >= wanted:
+                return cycles
+        return 0
+
+    def summary(self):
+        """
+        Totals, AMAT, percentiles, per level cycles and traffic, and the latency histogram
+        :return: dict of plain data
+        """
+        accesses = {operation: sum(counts.values()) for operation, counts in self.latencies.items()}
+        cycles = {operation: sum(latency * count for latency, count in counts.items())
+                  for operation, counts in self.latencies.items()}
+        total_accesses = accesses["R"] + accesses["W"]
+        total_cycles = cycles["R"] + cycles["W"]
+        return {
+            "accesses": total_accesses,
+            "total cycles": total_cycles,
+            "amat": total_cycles / total_accesses if total_accesses else 0,
+            "read amat": cycles["R"] / accesses["R"] if accesses["R"] else 0,
+            "write amat": cycles["W"] / accesses["W"] if accesses["W"] else 0,
+            "percentiles": {percent: self.percentile(percent) for percent in PERCENTILES},
+            "levels": {name: level_timing.summary() for name, level_timing in self.levels.items()},
+            "histogram": [[low, high, count] for low, high, count in self.histogram()],
+        }
+
+    def format(self):
+        """
+        The timing report
+        :return: string
+        """
+        summary = self.summary()
+        total_cycles = summary["total cycles"] or 1
+        lines = [f"accesses         : {summary['accesses']}",
+                 f"total cycles     : {summary['total cycles']}",
+                 f"AMAT             : {summary['amat']:.3f} (reads {summary['read amat']:.3f}, "
+                 f"writes {summary['write amat']:.3f})",
+                 "latency          : " + ", ".join(f"p{percent} {cycles}"
+                                                   for percent, cycles in summary["percentiles"].items()),
+                 "",
+                 f"{'level':<12s} {'latency':>8s} {'lookups':>10s} {'cycles':>12s} {'share':>7s} "
+                 f"{'bytes read':>12s} {'bytes written':>13s} {'bytes/cycle':>11s}"]
+        for level_timing in self.levels.values():
+            moved = level_timing.bytes_read + level_timing.bytes_written
+            lines.append(f"{level_timing.name:<12s} {level_timing.latency:>8d} {level_timing.lookups:>10d} "
+                         f"{level_timing.cycles:>12d} {100 * level_timing.cycles / total_cycles:>6.1f}% "
+                         f"{level_timing.bytes_read:>12d} {level_timing.bytes_written:>13d} "
+                         f"{moved / total_cycles:>11.4f}")
+        lines += ["", f"{'cycles':>21s} {'accesses':>10s} {'share':>7s}"]
+        accesses = summary["accesses"] or 1
+        for low, high, count in self.histogram():
+            lines.append(f"{low:>10d}-{high:<10d} {count:>10d} {100 * count / accesses:>6.1f}%")
+        return "\n".join(lines)
@@ -0,0 +1,146 @@
+FILL = "fill"
+EVICTION = "eviction"
+WRITEBACK = "writeback"
+BACK_INVALIDATION = "back_invalidation"
+PAGE_FAULT = "page_fault"
+PAGE_EVICTION = "page_eviction"
+TLB_SHOOTDOWN = "tlb_shootdown"
+EVENTS = (FILL, EVICTION, WRITEBACK, BACK_INVALIDATION, PAGE_FAULT, PAGE_EVICTION, TLB_SHOOTDOWN)
+
+# events each kind of level can fire
+CACHE_EVENTS = frozenset((FILL, EVICTION, WRITEBACK, BACK_INVALIDATION))
+PAGE_TABLE_EVENTS = frozenset((PAGE_FAULT, PAGE_EVICTION))
+TLB_EVENTS = frozenset((TLB_SHOOTDOWN,))
+
+
+class TraceEvent:
+    """
+    One fired tracepoint
+    """
+    __slots__ = ("event", "level", "address", "set_index", "detail")
+
+    def __init__(self, event, level, address, set_index=None, detail=None):
+        """
+        :param event: one of EVENTS
+        :param level: "dc", "l2", "page table", or "dtlb"
+        :param address: block address for cache events, page base address for page and TLB events
+        :param set_index: set of the cache or DTLB, None for page table events
+        :param detail: dict of event specific fields
+        """
+        self.event = event
+        self.level = level
+        self.address = address
+        self.set_index = set_index
+        self.detail = detail or {}
+
+    def __str__(self):
+        print_str = f"{self.level:<10s} {self.event:<17s} {self.address:08x}"
+        if self.set_index is not None:
+            print_str += f" set {self.set_index}"
+        for key, value in self.detail.items():
+            print_str += f" {key}={value}"
+        return print_str
+
+
+class Subscription:
+    """
+    A callback and the filters an event has to pass to reach it
+    """
+    def __init__(self, callback, events=None, levels=None, address_range=None, sets=None):
+        """
+        :param callback: called with each matching TraceEvent
+        :param events: event names to receive, None for all
+        :param levels: level names to receive events from, None for all
+        :param address_range: (low, high) addresses, low inclusive and high exclusive, None for all
+        :param sets: set indices to receive, None for all. Page table events carry no set and never match.
+        """
+        self.callback = callback
+        self.events = frozenset(events) if events is not None else frozenset(EVENTS)
+        unknown = self.events - set(EVENTS)
+        if unknown:
+            raise ValueError(f"Unknown trace events: {', '.join(sorted(unknown))}")
+        self.levels = frozenset(levels) if levels is not None else None
+        self.address_range = address_range
+        self.sets = frozenset(sets) if sets is not None else None
+
+    def wants_level(self, level, events):
+        return (self.levels is None or level in self.levels) and not self.events.isdisjoint(events)
+
+    def matches(self, event):
+        if event.event not in self.events:
+            return False
+        if self.levels is not None and event.level not in self.levels:
+            return False
+        if self.address_range is not None and not self.address_range[0] <= event.address < self.address_range[1]:
+            return False
+        if self.sets is not None and event.set_index not in self.sets:
+            return False
+        return True
+
+
+class Tracepoints:
+    """
+    Named tracepoints of one hierarchy. Every level holds a tracer reference that is bound when a subscriber
+    wants one of its events and stays None otherwise. Subscribing and unsubscribing rebind the levels at runtime.
+    The levels test the reference only on miss paths (fills, evictions, writebacks, page faults, and
+    shootdowns), never on a hit, and the batched hit loops do not test it at all.
+    """
+    def __init__(self, simulator):
+        self.simulator = simulator
+        self.subscriptions = []
+
+    def _levels(self):
+        """
+        (tracer owner, level name, events it fires) for each traced part of the hierarchy
+        """
+        simulator = self.simulator
+        levels = [(simulator.dc, "dc", CACHE_EVENTS)]
+        if simulator.l2:
+            levels.append((simulator.l2, "l2", CACHE_EVENTS))
+        if simulator.pt:
+            levels.append((simulator.pt.page_table, "page table", PAGE_TABLE_EVENTS))
+        if simulator.dtlb:
+            levels.append((simulator.dtlb, "dtlb", TLB_EVENTS))
+        return levels
+
+    def _bind(self):
+        for owner, name, events in self._levels():
+            wanted = any(subscription.wants_level(name, events) for subscription in self.subscriptions)
+            owner.tracer = self if wanted else None
+
+    def subscribe(self, callback, events=None, levels=None, address_range=None, sets=None):
+        """
+        Attach a subscriber, see Subscription for the filters
+        :return: Subscription, pass it to unsubscribe
+        """
+        subscription = Subscription(callback, events, levels, address_range, sets)
+        self.subscriptions.append(subscription)
+        self._bind()
+        return subscription
+
+    def unsubscribe(self, subscription):
+        self.subscriptions.remove(subscription)
+        self._bind()
+
+    def emit(self, event, level, address, set_index=None, **detail):
+        """
+        Fire a tracepoint, called by the levels
+        :return: None
+        """
+        trace_event = TraceEvent(event, level, address, set_index, detail)
+        for subscription in self.subscriptions:
+            if subscription.matches(trace_event):
+                subscription.callback(trace_event)
+
+
+class TraceLog:
+    """
+    Subscriber that writes one line per event to an open text file
+    """
+    def __init__(self, out):
+        self.out = out
+        self.events = 0
+
+    def __call__(self, trace_event):
+        self.out.write(f"{trace_event}\n")
+        self.events += 1
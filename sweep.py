@@ -0,0 +1,378 @@
+from config import Config, CacheConfig, DTLBConfig, PageTableConfig, safe_enabled, safe_index_function, \
+    safe_prefetcher
+from mem_hierarchy import MemoryHierarchySimulator
+from mem_hierarchy.shared_trace import SharedTrace
+from mem_hierarchy.result_cache import ResultCache
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import argparse
+import itertools
+import json
+import csv
+import os
+import sys
+import time
+
+# sweepable parameters, in the order they appear in the result table
+PARAMETERS = {
+    "dtlb_sets": ("--dtlb-sets", int, "DTLB number of sets"),
+    "dtlb_assoc": ("--dtlb-assoc", int, "DTLB set size"),
+    "dtlb_index": ("--dtlb-index", safe_index_function, "DTLB index function (modulo/xor/prime/skewed)"),
+    "dc_sets": ("--dc-sets", int, "DC number of sets"),
+    "dc_assoc": ("--dc-assoc", int, "DC set size"),
+    "dc_line": ("--dc-line", int, "DC line size"),
+    "dc_wt": ("--dc-wt", safe_enabled, "DC write through/no write allocate (y/n)"),
+    "dc_index": ("--dc-index", safe_index_function, "DC index function (modulo/xor/prime/skewed)"),
+    "dc_prefetcher": ("--dc-prefetcher", safe_prefetcher, "DC prefetcher (none/next-line/stride/stream)"),
+    "dc_prefetch_degree": ("--dc-prefetch-degree", int, "DC prefetch degree"),
+    "dc_prefetch_distance": ("--dc-prefetch-distance", int, "DC prefetch distance"),
+    "dc_write_buffer": ("--dc-write-buffer", int, "DC write buffer entries, 0 for none"),
+    "l2_sets": ("--l2-sets", int, "L2 number of sets"),
+    "l2_assoc": ("--l2-assoc", int, "L2 set size"),
+    "l2_line": ("--l2-line", int, "L2 line size"),
+    "l2_wt": ("--l2-wt", safe_enabled, "L2 write through/no write allocate (y/n)"),
+    "l2_index": ("--l2-index", safe_index_function, "L2 index function (modulo/xor/prime/skewed)"),
+    "l2_prefetcher": ("--l2-prefetcher", safe_prefetcher, "L2 prefetcher (none/next-line/stride/stream)"),
+    "l2_prefetch_degree": ("--l2-prefetch-degree", int, "L2 prefetch degree"),
+    "l2_prefetch_distance": ("--l2-prefetch-distance", int, "L2 prefetch distance"),
+    "l2_write_buffer": ("--l2-write-buffer", int, "L2 write buffer entries, 0 for none"),
+    "l2": ("--l2", safe_enabled, "L2 cache enabled (y/n)"),
+    "tlb": ("--tlb", safe_enabled, "DTLB enabled (y/n)"),
+}
+BATCH_SIZE = 4096
+
+
+def base_parameters(config):
+    """
+    The sweepable parameters of a config
+    :param config: Config
+    :return: dict of parameter name to value
+    """
+    params = {
+        "dtlb_sets": config.dtlb.num_sets, "dtlb_assoc": config.dtlb.associativity,
+        "dtlb_index": config.dtlb.index_function,
+        "dc_sets": config.dc.num_sets, "dc_assoc": config.dc.associativity, "dc_line": config.dc.line_size,
+        "dc_wt": config.dc.policy, "dc_index": config.dc.index_function, "dc_prefetcher": config.dc.prefetcher,
+        "dc_prefetch_degree": config.dc.prefetch_degree, "dc_prefetch_distance": config.dc.prefetch_distance,
+        "dc_write_buffer": config.dc.write_buffer, "l2": config.l2_enabled, "tlb": config.dtlb_enabled,
+        "l2_sets": None, "l2_assoc": None, "l2_line": None, "l2_wt": None, "l2_index": "modulo",
+        "l2_prefetcher": "none", "l2_prefetch_degree": 1, "l2_prefetch_distance": 1, "l2_write_buffer": 0,
+    }
+    if config.l2_enabled:
+        params.update(l2_sets=config.l2.num_sets, l2_assoc=config.l2.associativity, l2_line=config.l2.line_size,
+                      l2_wt=config.l2.policy, l2_index=config.l2.index_function, l2_prefetcher=config.l2.prefetcher,
+                      l2_prefetch_degree=config.l2.prefetch_degree, l2_prefetch_distance=config.l2.prefetch_distance,
+                      l2_write_buffer=config.l2.write_buffer)
+    return {name: params[name] for name in PARAMETERS}
+
+
+def build_config(base, params):
+    """
+    Build a config from a base config with some parameters replaced
+    :param base: Config
+    :param params: dict of parameter name to value, a full set from base_parameters
+    :return: Config, raises ValueError when the combination is not valid
+    """
+    if params["l2"] and params["l2_sets"] is None:
+        raise ValueError("L2 enabled but the base config has no L2 geometry, give --l2-sets/--l2-assoc/--l2-line.")
+    l2_cfg = None
+    if params["l2"]:
+        l2_cfg = CacheConfig(params["l2_sets"], params["l2_assoc"], params["l2_line"], params["l2_wt"], enabled=True,
+                             index_function=params["l2_index"], prefetcher=params["l2_prefetcher"],
+                             prefetch_degree=params["l2_prefetch_degree"],
+                             prefetch_distance=params["l2_prefetch_distance"],
+                             write_buffer=params["l2_write_buffer"])
+    return Config(
+        virtual_addresses=base.virtual_addresses,
+        dtlb_enabled=params["tlb"],
+        l2_enabled=params["l2"],
+        dtlb_cfg=DTLBConfig(params["dtlb_sets"], params["dtlb_assoc"], params["tlb"],
+                            index_function=params["dtlb_index"]),
+        pt_cfg=PageTableConfig(base.pt.n_virtual_pages, base.pt.n_physical_pages, base.pt.page_size),
+        dc_cfg=CacheConfig(params["dc_sets"], params["dc_assoc"], params["dc_line"], params["dc_wt"], enabled=True,
+                           index_function=params["dc_index"], prefetcher=params["dc_prefetcher"],
+                           prefetch_degree=params["dc_prefetch_degree"],
+                           prefetch_distance=params["dc_prefetch_distance"],
+                           write_buffer=params["dc_write_buffer"]),
+        l2_cfg=l2_cfg,
+        timing_cfg=base.timing,
+    )
+
+
+def _effective_key(params):
+    """
+    Parameters that actually shape the hierarchy, so grid points that differ only in a disabled level, or in the
+    prefetch tuning of a cache that does not prefetch, run once
+    """
+    return tuple((name, value) for name, value in params.items()
+                 if not (name.startswith("l2_") and not params["l2"])
+                 and not (name.startswith("dtlb_") and not params["tlb"])
+                 and not (name.startswith("dc_prefetch_") and params["dc_prefetcher"] == "none")
+                 and not (name.startswith("l2_prefetch_") and params["l2_prefetcher"] == "none"))
+
+
+def expand_grid(base, ranges):
+    """
+    Cartesian product of the given parameter ranges over the base config's parameters
+    :param base: Config
+    :param ranges: dict of parameter name to list of values
+    :return: list of parameter dicts
+    """
+    names = list(ranges)
+    grid = []
+    for values in itertools.product(*(ranges[name] for name in names)):
+        params = base_parameters(base)
+        params.update(zip(names, values))
+        grid.append(params)
+    return grid
+
+
+# per worker process state, set up by _init_worker
+_worker_base = None
+_worker_traces = {}
+
+
+def _init_worker(base):
+    global _worker_base
+    _worker_base = base
+
+
+def _run_job(params, trace_name, trace_length):
+    """
+    Simulate one config over one shared trace in a worker process
+    :return: the pprint_stats dict
+    """
+    trace = _worker_traces.get(trace_name)
+    if trace is None:
+        trace = _worker_traces[trace_name] = SharedTrace.attach(trace_name, trace_length)
+    simulator = MemoryHierarchySimulator(build_config(_worker_base, params))
+    for ops, addrs in trace.iter_batches(BATCH_SIZE):
+        simulator.access_many(ops, addrs)
+    return simulator.finish()
+
+
+class Progress:
+    """
+    Single line progress display on stderr
+    """
+    def __init__(self, total, enabled=True):
+        self.total = total
+        self.done = 0
+        self.failed = 0
+        self.enabled = enabled
+        self.start = time.time()
+
+    def update(self, done=0, failed=0):
+        self.done += done
+        self.failed += failed
+        if not self.enabled:
+            return
+        elapsed = time.time() - self.start
+        finished = self.done + self.failed
+        eta = elapsed / finished * (self.total - finished) if finished else 0
+        print(f"\r[{finished}/{self.total}] {self.failed} failed, {elapsed:.1f}s elapsed, eta {eta:.1f}s",
+              end="", file=sys.stderr, flush=True)
+
+    def close(self):
+        if self.enabled:
+            print(file=sys.stderr)
+
+
+def run_sweep(base, grid, traces, jobs=None, retries=2, progress=True, cache=None):
+    """
+    Run every config in the grid over every trace in a process pool
+    :param base: Config the grid was expanded from
+    :param grid: list of parameter dicts from expand_grid
+    :param traces: list of trace file paths
+    :param jobs: number of worker processes, defaults to the number of cpus
+    :param retries: times a failed job is resubmitted before it is reported as an error
+    :param cache: ResultCache to reuse earlier results from and store new ones in, None to always simulate
+    :return: list of result rows, one per (trace, config), in grid order
+    """
+    rows = []
+    pending = []
+    # row index of the first run of each distinct (trace, hierarchy), duplicates copy its result
+    first_run = {}
+    duplicates = []
+    cache_keys = {}
+    for trace in traces:
+        for params in grid:
+            row = {"trace": trace}
+            row.update(params)
+            key = (trace, _effective_key(params))
+            try:
+                config = build_config(base, params)
+            except ValueError as e:
+                row["error"] = str(e)
+            else:
+                if key in first_run:
+                    duplicates.append((len(rows), first_run[key]))
+                else:
+                    first_run[key] = len(rows)
+                    cache_keys[len(rows)] = cache.key(config, trace) if cache else None
+                    stats = cache.get(cache_keys[len(rows)]) if cache else None
+                    if stats is None:
+                        pending.append(len(rows))
+                    else:
+                        row.update(stats)
+            rows.append(row)
+
+    shared = {}
+    display = Progress(len(pending), enabled=progress)
+    attempts = {i: 0 for i in pending}
+    try:
+        # traces whose results all came from the cache are never decoded
+        for trace in dict.fromkeys(rows[i]["trace"] for i in pending):
+            shared[trace] = SharedTrace.from_file(trace, base.address_bits)
+        while pending:
+            resubmit = []
+            # a worker that dies takes the pool with it, so every round gets a fresh pool
+            with ProcessPoolExecutor(max_workers=jobs, initializer=_init_worker, initargs=(base,)) as pool:
+                futures = {}
+                for i in pending:
+                    params = {name: rows[i][name] for name in PARAMETERS}
+                    trace = shared[rows[i]["trace"]]
+                    futures[pool.submit(_run_job, params, trace.name, trace.length)] = i
+                for future in as_completed(futures):
+                    i = futures[future]
+                    try:
+                        stats = future.result()
+                        rows[i].update(stats)
+                        if cache:
+                            cache.put(cache_keys[i], stats)
+                        display.update(done=1)
+                    except Exception as e:  # includes BrokenProcessPool when a worker dies
+                        attempts[i] += 1
+                        if attempts[i] > retries:
+                            rows[i]["error"] = f"{type(e).__name__}: {e}"
+                            display.update(failed=1)
+                        else:
+                            resubmit.append(i)
+            pending = sorted(resubmit)
+    finally:
+        for trace in shared.values():
+            trace.close()
+        display.close()
+    for i, source in duplicates:
+        rows[i].update({key: value for key, value in rows[source].items() if key not in PARAMETERS})
+    return rows
+
+
+def write_table(rows, out, fmt):
+    """
+    Write the result rows as csv or json
+    :param rows: list of dicts from run_sweep
+    :param out: open text file
+    :param fmt: "csv" or "json"
+    :return: None
+    """
+    if fmt == "json":
+        json.dump(rows, out, indent=4)
+        out.write("\n")
+        return
+    columns = []
+    for row in rows:
+        for key in row:
+            if key not in columns:
+                columns.append(key)
+    writer = csv.DictWriter(out, fieldnames=columns)
+    writer.writeheader()
+    writer.writerows(rows)
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(
+        description="Run a grid of memory hierarchy configs over one or more traces in parallel"
+    )
+    parser.add_argument(
+        "-c", "--config",
+        default="trace.config",
+        help="Base config file, swept parameters replace its values (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-t", "--trace",
+        nargs="+",
+        required=True,
+        help="Trace file paths",
+    )
+    for name, (flag, _, description) in PARAMETERS.items():
+        parser.add_argument(flag, dest=name, default=None, help=f"Comma separated values for the {description}")
+    parser.add_argument(
+        "-j", "--jobs",
+        type=int,
+        default=None,
+        help="Number of worker processes (default: number of cpus)",
+    )
+    parser.add_argument(
+        "--retries",
+        type=int,
+        default=2,
+        help="Times a failed run is retried (default: %(default)s)",
+    )
+    parser.add_argument(
+        "-o", "--output",
+        default="-",
+        help='Result table path, "-" for stdout (default: "%(default)s")',
+    )
+    parser.add_argument(
+        "--format",
+        choices=["csv", "json"],
+        default=None,
+        help="Result table format (default: from the output extension, csv otherwise)",
+    )
+    parser.add_argument(
+        "--no-cache",
+        dest="cache",
+        action="store_false",
+        help="Simulate every config instead of reusing stored results for the same config and trace",
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Result cache directory (default: $MEMHIER_CACHE_DIR or ~/.cache/memhier)",
+    )
+    parser.add_argument(
+        "--no-progress",
+        dest="progress",
+        action="store_false",
+        help="Do not show the progress line (only shown when stderr is a terminal)",
+    )
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+
+    # validation
+    if not os.path.exists(args.config):
+        print(f"error: config file not found: {args.config}", file=sys.stderr)
+        sys.exit(2)
+    for trace in args.trace:
+        if not os.path.exists(trace):
+            print(f"error: trace file not found: {trace}", file=sys.stderr)
+            sys.exit(2)
+
+    base = Config.from_config_file(args.config)
+    ranges = {}
+    for name, (flag, parse, _) in PARAMETERS.items():
+        value = getattr(args, name)
+        if value is None:
+            continue
+        try:
+            ranges[name] = [parse(item) for item in value.split(",")]
+        except ValueError as e:
+            print(f"error: {flag}: {e}", file=sys.stderr)
+            sys.exit(2)
+
+    fmt = args.format or ("json" if args.output.endswith(".json") else "csv")
+    rows = run_sweep(base, expand_grid(base, ranges), args.trace, jobs=args.jobs, retries=args.retries,
+                     progress=args.progress and sys.stderr.isatty(),
+                     cache=ResultCache(args.cache_dir) if args.cache else None)
+    if args.output == "-":
+        write_table(rows, sys.stdout, fmt)
+    else:
+        with open(args.output, "w", newline="") as out:
+            write_table(rows, out, fmt)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,4 +1,40 @@
 
+import os
+import shutil
+import stat
+import tempfile
+from contextlib import contextmanager
+
+
+def is_regular_file(path):
+    """
+    Whether a trace path can be read more than once, stdin and pipes cannot
+    """
+    try:
+        return stat.S_ISREG(os.stat(path).st_mode)
+    except OSError:
+        return False
+
+
+@contextmanager
+def rereadable_trace(path):
+    """
+    A path to a trace that can be read more than once. A trace on stdin or a pipe is copied to a temporary file
+    first, which is removed on exit.
+    :param path: trace file path
+    """
+    if is_regular_file(path):
+        yield path
+        return
+    fd, spooled = tempfile.mkstemp(prefix="memhier-trace-")
+    try:
+        with open(path, "rb") as source, os.fdopen(fd, "wb") as target:
+            shutil.copyfileobj(source, target)
+        yield spooled
+    finally:
+        os.unlink(spooled)
+
+
 def hex_to_binary(hex_string, num_bits):
     return bin(int(hex_string, 16))[2:].zfill(num_bits)
 
@@ -7,22 +43,44 @@ def hex_to_int(hex_string):
 
 class TraceParser:
     """
-    Parses a trace file and yields operation and address pairs
+    Parses a trace file and yields operation and address pairs. The file is streamed line by line so traces
+    never have to fit in memory.
     """
-    def __init__(self, trace_file, addr_bits=32, emit_str=False):
+    def __init__(self, trace_file, addr_bits=32, emit_str=False, skip=0):
+        """
+        :param skip: number of accesses at the start of the trace to pass over, for resuming a run
+        """
         self.addr_bits = addr_bits
+        self.skip = skip
         self.trace_file = trace_file
-        with open(trace_file, 'r') as f:
-            self.lines = f.readlines()
         self._mask = (1 << self.addr_bits) - 1
         self.emit_str = emit_str
 
-    def __iter__(self):
-        # iterate over each line and yield relevant info
-        for line in self.lines:
+    def iter_lines(self):
+        """
+        Stream the raw lines of the trace file
+        """
+        with open(self.trace_file, 'r') as f:
+            for line in f:
+                yield line
+
+    def _iter_records(self):
+        """
+        Stream the lines that hold an access, after the skipped ones
+        """
+        skip = self.skip
+        for line in self.iter_lines():
             parts = line.split(":")
             if len(parts) < 2:
                 continue
+            if skip:
+                skip -= 1
+                continue
+            yield parts
+
+    def __iter__(self):
+        # iterate over each line and yield relevant info
+        for parts in self._iter_records():
             operation = parts[0].strip()
             hex_string = parts[1].strip()
             addr_int = hex_to_int(hex_string) & self._mask
@@ -30,4 +88,20 @@ class TraceParser:
                 address = format(addr_int, f"0{self.addr_bits}b")
             else:
                 address = addr_int
-            yield operation, address, hex_string
\ No newline at end of file
+            yield operation, address, hex_string
+
+    def iter_batches(self, batch_size=4096):
+        """
+        Yield the trace as (operations, int addresses) lists of up to batch_size accesses
+        """
+        ops = []
+        addrs = []
+        for parts in self._iter_records():
+            ops.append(parts[0].strip())
+            addrs.append(hex_to_int(parts[1].strip()) & self._mask)
+            if len(ops) >= batch_size:
+                yield ops, addrs
+                ops = []
+                addrs = []
+        if ops:
+            yield ops, addrs